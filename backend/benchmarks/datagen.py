@@ -0,0 +1,76 @@
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'flaskr'))
+
+from flask import Flask
+from sqlalchemy import insert
+
+from models import setup_db, db, Question, Category
+
+CATEGORIES = ['Science', 'Art', 'Geography', 'History', 'Entertainment', 'Sports']
+# share of questions per category, most popular first
+CATEGORY_WEIGHTS = [0.35, 0.05, 0.2, 0.25, 0.1, 0.05]
+OPENERS = ['What', 'Which', 'Who', 'Where', 'When', 'How many', 'In which year']
+WORDS = ('ancient river empire painter album planet element treaty league '
+         'mountain novel composer island battle theory symphony desert '
+         'champion festival dynasty molecule sculpture volcano cathedral '
+         'orbit galaxy harbor kingdom legend marathon opera pharaoh '
+         'reactor satellite tournament voyage').split()
+
+
+def make_app(database_path):
+    app = Flask(__name__)
+    setup_db(app, database_path)
+    return app
+
+"""
+generate_questions(count, seed)
+    yields question rows with a realistic category skew and a Zipf-like
+    word distribution, so search and category filters see uneven data.
+"""
+def generate_questions(count, seed=0):
+    rng = random.Random(seed)
+    category_ids = list(range(1, len(CATEGORIES) + 1))
+    word_weights = [1.0 / rank for rank in range(1, len(WORDS) + 1)]
+    for _ in range(count):
+        words = rng.choices(WORDS, word_weights, k=rng.randint(3, 8))
+        yield {
+            'question': '%s %s %s?' % (rng.choice(OPENERS), ' '.join(words[:-1]), rng.randrange(10000)),
+            'answer': ' '.join(rng.choices(WORDS, word_weights, k=rng.randint(1, 3))).title(),
+            'category': rng.choices(category_ids, CATEGORY_WEIGHTS)[0],
+            'difficulty': rng.randint(1, 5)
+        }
+
+
+def populate(database_path, rows, batch_size=10000, seed=0):
+    app = make_app(database_path)
+    with app.app_context():
+        db.session.query(Question).delete()
+        db.session.query(Category).delete()
+        db.session.execute(insert(Category.__table__),
+                           [{'id': i + 1, 'type': name} for i, name in enumerate(CATEGORIES)])
+        batch = []
+        for row in generate_questions(rows, seed):
+            batch.append(row)
+            if len(batch) == batch_size:
+                db.session.execute(insert(Question.__table__), batch)
+                batch = []
+        if batch:
+            db.session.execute(insert(Question.__table__), batch)
+        db.session.commit()
+    return app
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Fill the trivia tables with synthetic questions.')
+    parser.add_argument('--database-path', default='sqlite:///bench_trivia.db')
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    started = time.perf_counter()
+    populate(args.database_path, args.rows, seed=args.seed)
+    print('inserted %d questions in %.1fs' % (args.rows, time.perf_counter() - started))
@@ -0,0 +1,112 @@
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import insert
+
+from datagen import generate_questions, populate, make_app
+
+from models import db, Question
+from dedup import DuplicateIndex, cluster_duplicates, DEDUP_THRESHOLD
+
+"""
+Benchmark for near-duplicate detection.
+
+Builds a DuplicateIndex over the questions table, then looks up lightly
+edited copies of random questions (which should be found) and freshly
+generated ones, and reports build time, lookup latency and recall. With
+--cluster the edited copies are inserted and the whole-table clustering
+job is timed, along with how many copies it grouped with their source.
+"""
+
+
+def edit(text, rng):
+    # the kind of change a second author makes: case, punctuation, a word
+    words = text.rstrip('?').split()
+    choice = rng.randrange(3)
+    if choice == 0:
+        words.insert(rng.randrange(len(words) + 1), rng.choice(['the', 'a', 'famous', 'known']))
+    elif choice == 1:
+        words[rng.randrange(len(words))] += 's'
+    return ' '.join(words).lower() + ('?' if choice == 2 else ' ?')
+
+
+def timed(function, *args):
+    started = time.perf_counter()
+    result = function(*args)
+    return result, (time.perf_counter() - started) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--database-path', default='sqlite:///bench_trivia.db')
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--reuse', action='store_true', help='keep the rows already in the database')
+    parser.add_argument('--probes', type=int, default=500)
+    parser.add_argument('--threshold', type=float, default=DEDUP_THRESHOLD)
+    parser.add_argument('--cluster', action='store_true', help='also insert the copies and run the clustering job')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    app = make_app(args.database_path) if args.reuse else populate(args.database_path, args.rows, seed=args.seed)
+    rng = random.Random(args.seed)
+    with app.app_context():
+        index = DuplicateIndex(args.threshold)
+        _, build_ms = timed(index.rebuild)
+        sources = db.session.query(Question.id, Question.question, Question.answer) \
+            .order_by(Question.id).limit(args.probes * 20).all()
+        copies = [(question_id, edit(question, rng), answer) for question_id, question, answer in
+                  rng.sample(sources, min(args.probes, len(sources)))]
+
+        copy_ms, found, candidates = [], 0, []
+        for source_id, question, answer in copies:
+            matches, elapsed = timed(index.find, question, answer)
+            copy_ms.append(elapsed)
+            found += any(match['id'] == source_id for match in matches)
+            candidates.append(len(index.candidates(question, answer)))
+        fresh_ms, fresh_matches = [], 0
+        for row in generate_questions(args.probes, seed=args.seed + 1):
+            matches, elapsed = timed(index.find, row['question'], row['answer'])
+            fresh_ms.append(elapsed)
+            fresh_matches += bool(matches)
+
+        result = {
+            'questions': len(index),
+            'build_seconds': round(build_ms / 1000, 3),
+            'copy_recall': round(found / len(copies), 3),
+            'fresh_flagged': round(fresh_matches / args.probes, 3),
+            'candidates_mean': round(statistics.mean(candidates), 1),
+            'lookup_p50_ms': round(statistics.median(copy_ms + fresh_ms), 3),
+            'lookup_p99_ms': round(sorted(copy_ms + fresh_ms)[int(0.99 * (len(copy_ms) + len(fresh_ms) - 1))], 3)
+        }
+
+        if args.cluster:
+            first_copy = db.session.query(db.func.max(Question.id)).scalar() + 1
+            db.session.execute(insert(Question.__table__), [
+                {'question': question, 'answer': answer, 'category': 1, 'difficulty': 1}
+                for _, question, answer in copies])
+            db.session.commit()
+            clusters, cluster_ms = timed(cluster_duplicates, args.threshold)
+            group_of = {question_id: number for number, members in enumerate(clusters) for question_id in members}
+            grouped = sum(1 for offset, (source_id, _, _) in enumerate(copies)
+                          if source_id in group_of and group_of[source_id] == group_of.get(first_copy + offset))
+            result.update({
+                'cluster_seconds': round(cluster_ms / 1000, 3),
+                'clusters': len(clusters),
+                'clustered_questions': sum(len(members) for members in clusters),
+                'copy_pairs_grouped': round(grouped / len(copies), 3)
+            })
+            db.session.query(Question).filter(Question.id >= first_copy).delete(synchronize_session=False)
+            db.session.commit()
+
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,262 @@
+import argparse
+import http.client
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from collections import deque
+from urllib.parse import urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'flaskr'))
+
+SCENARIOS = ('list', 'search', 'category', 'categories', 'quiz', 'answer', 'create', 'delete')
+
+"""
+Load benchmark for the trivia API.
+
+Fills the database with synthetic questions (see datagen.py), serves
+create_app() from an in-process threaded WSGI server, or targets --url,
+and drives each scenario for --duration seconds at every --concurrency
+level. Prints throughput and p50/p95/p99 latency per scenario and
+concurrency as JSON. With --server wsgi,asgi the same workload runs
+against the WSGI app and the ASGI entry point (asgi.py, served by
+uvicorn) side by side.
+
+    python benchmarks/load_bench.py --rows 100000 --concurrency 1,8,32
+    python benchmarks/load_bench.py --server wsgi,asgi --scenarios quiz --concurrency 64,256
+    python benchmarks/load_bench.py --database-url postgresql://localhost/trivia_bench --rows 1000000
+"""
+
+
+class Workload:
+
+    def __init__(self, rows, category_counts, words, seed):
+        self.rows = rows
+        self.category_counts = category_counts
+        self.words = words
+        self.created = deque()
+        self.seed = seed
+
+    def request(self, scenario, rng):
+        if scenario == 'list':
+            return 'GET', '/questions?page=%d' % rng.randint(1, max(self.rows // 10, 1)), None
+        if scenario == 'search':
+            return 'GET', '/questions/search?search=%s' % '+'.join(rng.sample(self.words, rng.randint(1, 2))), None
+        if scenario == 'category':
+            category = rng.choice(list(self.category_counts))
+            pages = max(self.category_counts[category] // 10, 1)
+            return 'GET', '/categories/%s/questions?page=%d' % (category, rng.randint(1, pages)), None
+        if scenario == 'categories':
+            return 'GET', '/categories', None
+        if scenario == 'quiz':
+            category = rng.choice(list(self.category_counts) + ['0'])
+            body = {'previous_questions': [], 'quiz_category': {'type': 'click' if category == '0' else 'bench', 'id': int(category)}}
+            return 'POST', '/quizzes', body
+        if scenario == 'answer':
+            body = {'question_id': rng.randint(1, max(self.rows, 1)), 'correct': rng.random() < 0.6}
+            return 'POST', '/answers', body
+        if scenario == 'create':
+            body = {'question': 'Benchmark question %d?' % rng.randrange(10 ** 9), 'answer': 'Bench',
+                    'category': rng.choice(list(self.category_counts)), 'difficulty': rng.randint(1, 5)}
+            return 'POST', '/questions', body
+        if scenario == 'delete':
+            try:
+                return 'DELETE', '/questions/%d' % self.created.popleft(), None
+            except IndexError:
+                return None
+        raise ValueError(scenario)
+
+    def record(self, scenario, payload):
+        if scenario == 'create' and payload.get('New_question_ID'):
+            self.created.append(payload['New_question_ID'])
+
+
+def percentile(ordered, fraction):
+    if not ordered:
+        return None
+    index = min(int(round(fraction * (len(ordered) - 1))), len(ordered) - 1)
+    return round(ordered[index] * 1000, 3)
+
+
+def run_scenario(base_url, workload, scenario, concurrency, duration):
+    parts = urlsplit(base_url)
+    deadline = time.perf_counter() + duration
+    latencies, errors, shed = [], [0], [0]
+    lock = threading.Lock()
+
+    def worker(number):
+        rng = random.Random(workload.seed * 1000 + number)
+        connection = http.client.HTTPConnection(parts.hostname, parts.port, timeout=30)
+        local, failed, refused = [], 0, 0
+        while time.perf_counter() < deadline:
+            planned = workload.request(scenario, rng)
+            if planned is None:
+                break
+            method, path, body = planned
+            headers = {'Content-Type': 'application/json'} if body is not None else {}
+            started = time.perf_counter()
+            try:
+                connection.request(method, path, json.dumps(body) if body is not None else None, headers)
+                response = connection.getresponse()
+                data = response.read()
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                failed += 1
+                continue
+            if response.status in (429, 503) and response.getheader('Retry-After'):
+                # shed by admission control; kept out of the latencies
+                refused += 1
+                continue
+            local.append(time.perf_counter() - started)
+            if response.status >= 500 or (response.status >= 400 and scenario not in ('list', 'category')):
+                failed += 1
+            elif response.status == 200 and scenario == 'create':
+                workload.record(scenario, json.loads(data))
+        connection.close()
+        with lock:
+            latencies.extend(local)
+            errors[0] += failed
+            shed[0] += refused
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(number,)) for number in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'scenario': scenario,
+        'concurrency': concurrency,
+        'requests': len(latencies),
+        'errors': errors[0],
+        'shed': shed[0],
+        'seconds': round(elapsed, 3),
+        'throughput_rps': round(len(latencies) / elapsed, 1) if elapsed else None,
+        'p50_ms': percentile(latencies, 0.50),
+        'p95_ms': percentile(latencies, 0.95),
+        'p99_ms': percentile(latencies, 0.99)
+    }
+
+
+def serve(app):
+    from werkzeug.serving import make_server
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, 'http://127.0.0.1:%d' % server.server_port
+
+
+class AsgiServer:
+
+    def __init__(self, app):
+        import socket
+        import uvicorn
+        self.socket = socket.socket()
+        self.socket.bind(('127.0.0.1', 0))
+        config = uvicorn.Config(app, log_level='warning', lifespan='on', backlog=4096)
+        self.server = uvicorn.Server(config)
+        self.thread = threading.Thread(target=self.server.run, kwargs={'sockets': [self.socket]}, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        while not self.server.started:
+            time.sleep(0.01)
+        return 'http://127.0.0.1:%d' % self.socket.getsockname()[1]
+
+    def shutdown(self):
+        self.server.should_exit = True
+        self.thread.join()
+
+
+def serve_asgi(app):
+    from asgi import TriviaAsgi
+    server = AsgiServer(TriviaAsgi(app))
+    return server, server.start()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--database-url', default='sqlite:///bench_trivia.db')
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--reuse', action='store_true', help='keep the rows already in the database')
+    parser.add_argument('--url', help='benchmark an already running server instead of an in-process one')
+    parser.add_argument('--server', default='wsgi', help='in-process servers to compare: wsgi, asgi or wsgi,asgi')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    parser.add_argument('--concurrency', default='1,8,32')
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-response-cache', action='store_true')
+    parser.add_argument('--admission', action='store_true',
+                        help='keep admission control on; the rate limit stays off, as every client shares one address')
+    parser.add_argument('--output', help='write the JSON report to this file as well')
+    args = parser.parse_args()
+
+    os.environ['DATABASE_URL'] = args.database_url
+    if args.no_response_cache:
+        os.environ['RESPONSE_CACHE'] = 'off'
+    if args.admission:
+        os.environ.setdefault('RATE_LIMIT_PER_SECOND', '0')
+    else:
+        os.environ['ADMISSION'] = 'off'
+    from datagen import populate, WORDS
+    logging.getLogger('trivia.requests').setLevel(logging.WARNING)
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+
+    if not args.url and not args.reuse:
+        started = time.perf_counter()
+        populate(args.database_url, args.rows, seed=args.seed)
+        print('generated %d questions in %.1fs' % (args.rows, time.perf_counter() - started), file=sys.stderr)
+
+    servers = {}
+    if args.url:
+        servers['url'] = (None, args.url)
+    else:
+        from app import create_app
+        flask_app = create_app()
+        for kind in args.server.split(','):
+            servers[kind] = serve_asgi(flask_app) if kind == 'asgi' else serve(flask_app)
+
+    base_url = next(iter(servers.values()))[1]
+    parts = urlsplit(base_url)
+    connection = http.client.HTTPConnection(parts.hostname, parts.port)
+    connection.request('GET', '/categories')
+    categories = json.loads(connection.getresponse().read())
+    connection.close()
+    counts = categories.get('question_counts') or {key: args.rows // 6 for key in categories['categories']}
+    workload = Workload(sum(counts.values()), counts, list(WORDS), args.seed)
+
+    results = []
+    for concurrency in [int(level) for level in args.concurrency.split(',')]:
+        for scenario in args.scenarios.split(','):
+            for kind, (_, url) in servers.items():
+                result = dict(run_scenario(url, workload, scenario, concurrency, args.duration), server=kind)
+                print('%(server)-4s %(scenario)-10s c=%(concurrency)-3d %(throughput_rps)8s rps  '
+                      'p50 %(p50_ms)s ms  p99 %(p99_ms)s ms  shed %(shed)s' % result, file=sys.stderr)
+                results.append(result)
+
+    report = {
+        'database': urlsplit(args.database_url).scheme if not args.url else None,
+        'target': args.url or 'in-process',
+        'rows': workload.rows,
+        'duration': args.duration,
+        'results': results
+    }
+    for server, _ in servers.values():
+        if server is not None:
+            server.shutdown()
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as stream:
+            stream.write(output)
+    print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from datagen import populate, make_app
+
+from models import db, Question
+from search import MemorySearchIndex, PostgresSearch
+
+TERMS = ['painter', 'river empire', 'volcano', 'pharaoh voyage', 'symph', 'which opera']
+
+"""
+Compares ILIKE substring search with the full-text backend used by
+/questions/search: the in-memory index on SQLite, or tsvector/GIN on
+Postgres. Both sides fetch the first page of ids and the hit count,
+which is what the endpoint needs.
+"""
+def time_calls(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - started) * 1000)
+    return {'p50_ms': round(statistics.median(timings), 3), 'max_ms': round(max(timings), 3)}
+
+
+def ilike_page(term):
+    selection = db.session.query(Question.id).filter(Question.question.ilike('%' + term + '%'))
+    ids = [question_id for question_id, in selection.order_by(Question.id).limit(10)]
+    return ids, selection.count()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--database-path', default='sqlite:///bench_trivia.db')
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--reuse', action='store_true', help='keep the rows already in the database')
+    args = parser.parse_args()
+
+    app = make_app(args.database_path) if args.reuse else populate(args.database_path, args.rows)
+    with app.app_context():
+        if db.engine.dialect.name == 'postgresql':
+            engine = PostgresSearch()
+            engine.setup()
+        else:
+            engine = MemorySearchIndex()
+            started = time.perf_counter()
+            engine.rebuild()
+            print('memory index built in %.1fs' % (time.perf_counter() - started), file=sys.stderr)
+
+        results = {'rows': db.session.query(Question.id).count(), 'backend': type(engine).__name__, 'terms': {}}
+        for term in TERMS:
+            results['terms'][term] = {
+                'ilike': time_calls(lambda: ilike_page(term), args.repeat),
+                'fulltext': time_calls(lambda: engine.search(term, False, 0, 10), args.repeat)
+            }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
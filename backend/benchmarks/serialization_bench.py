@@ -0,0 +1,56 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from datagen import populate, make_app
+
+from models import db, Question
+from serialization import load_backend, project_questions, stdlib_dumps
+
+"""
+Questions serialized per second: the ORM path (load Question objects,
+call format(), encode like jsonify) against the projection path (select
+the five columns as tuples, build dicts, encode with each JSON backend).
+"""
+def measure(function, rows, repeat):
+    best = None
+    for _ in range(repeat):
+        db.session.expunge_all()
+        started = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return round(rows / best)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--database-path', default='sqlite:///bench_trivia.db')
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--reuse', action='store_true', help='keep the rows already in the database')
+    args = parser.parse_args()
+
+    app = make_app(args.database_path) if args.reuse else populate(args.database_path, args.rows)
+    with app.app_context():
+        rows = db.session.query(Question.id).count()
+        selection = Question.query.order_by(Question.id)
+        results = {'rows': rows, 'objects_per_second': {}}
+        results['objects_per_second']['orm_format_json'] = measure(
+            lambda: stdlib_dumps({'questions': [question.format() for question in selection.all()]}), rows, args.repeat)
+        for name in ('json', 'ujson', 'orjson'):
+            try:
+                _, dumps = load_backend(name)
+            except ValueError:
+                continue
+            results['objects_per_second']['projection_' + name] = measure(
+                lambda: dumps({'questions': project_questions(selection)}), rows, args.repeat)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from datagen import populate, make_app
+
+from models import db, Question
+from suggest import SuggestIndex, SUGGEST_LIMIT, SUGGEST_MAX_BYTES
+
+"""
+Keystroke-rate benchmark for /questions/suggest's prefix index.
+
+Builds a SuggestIndex over the questions table, measuring build time and
+the memory it really takes (tracemalloc) next to its own estimate, then
+replays typing sessions: the first few words of random questions, one
+prefix per keystroke, and reports per-call latency and calls per second.
+"""
+
+
+def keystrokes(titles, sessions, rng):
+    for _ in range(sessions):
+        words = rng.choice(titles).split()
+        typed = ' '.join(words[:rng.randint(1, 4)])
+        for end in range(1, len(typed) + 1):
+            yield typed[:end]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--database-path', default='sqlite:///bench_trivia.db')
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--reuse', action='store_true', help='keep the rows already in the database')
+    parser.add_argument('--sessions', type=int, default=2000, help='typing sessions to replay')
+    parser.add_argument('--max-bytes', type=int, default=SUGGEST_MAX_BYTES)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    app = make_app(args.database_path) if args.reuse else populate(args.database_path, args.rows, seed=args.seed)
+    with app.app_context():
+        index = SuggestIndex(args.max_bytes)
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        started = time.perf_counter()
+        index.rebuild()
+        build_seconds = time.perf_counter() - started
+        measured = tracemalloc.get_traced_memory()[0] - before
+        tracemalloc.stop()
+        titles = [title for title, in db.session.query(Question.question).limit(10000)]
+
+    rng = random.Random(args.seed)
+    prefixes = list(keystrokes(titles, args.sessions, rng))
+    timings = []
+    started = time.perf_counter()
+    for prefix in prefixes:
+        call_started = time.perf_counter()
+        index.suggest(prefix, SUGGEST_LIMIT)
+        timings.append((time.perf_counter() - call_started) * 1e6)
+    elapsed = time.perf_counter() - started
+    timings.sort()
+
+    print(json.dumps({
+        'rows': args.rows,
+        'build_seconds': round(build_seconds, 3),
+        'estimated_bytes': index.bytes,
+        'measured_bytes': measured,
+        'skipped_titles': index.skipped_titles,
+        'calls': len(prefixes),
+        'calls_per_second': round(len(prefixes) / elapsed),
+        'p50_us': round(statistics.median(timings), 1),
+        'p99_us': round(timings[int(0.99 * (len(timings) - 1))], 1),
+        'max_us': round(timings[-1], 1)
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
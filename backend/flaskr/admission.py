@@ -0,0 +1,309 @@
+import asyncio
+import math
+import os
+import random
+import threading
+import time
+from collections import OrderedDict, deque
+
+from flask import g, jsonify, request
+
+from instrumentation import registry, Counter, Gauge, Histogram
+
+ADMISSION_QUEUE_SIZE = 32
+ADMISSION_QUEUE_TIMEOUT = 0.5
+ADMISSION_RETRY_AFTER = 1
+# 0 leaves the rate limit off; behind a proxy it also needs ADMISSION_TRUST_PROXY=1
+RATE_LIMIT_PER_SECOND = 0.0
+RATE_LIMIT_BURST = 50
+RATE_LIMIT_CLIENTS = 100000
+WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+"""
+Admission control for the endpoints that see traffic spikes.
+
+Each endpoint passed to init_admission() has its own concurrency limit.
+Up to that many of its requests run at once. The next
+ADMISSION_QUEUE_SIZE wait in line, in arrival order, for at most
+ADMISSION_QUEUE_TIMEOUT seconds. Anything beyond that is shed at once
+with a 503 and a Retry-After header, before it touches the database.
+The limits only hold back their own endpoint, so a /quizzes spike
+cannot take the worker threads /categories needs. Keep an endpoint's
+limit plus its queue below the server's thread count.
+
+Before that, once RATE_LIMIT_PER_SECOND is set, every client has a
+token bucket of RATE_LIMIT_BURST requests, refilled at that rate and
+shared by the limited endpoints. A client that runs out gets a 429 with
+the Retry-After of its next token. Buckets are kept in process memory
+for the RATE_LIMIT_CLIENTS most recent clients. Clients are told apart
+by address, which behind a proxy is the proxy's own unless
+ADMISSION_TRUST_PROXY is set, so the limit is off by default.
+
+In-flight and waiting requests, waits and shed requests are exported
+per endpoint on /metrics.
+"""
+
+admission_in_flight = registry.register(Gauge(
+    'trivia_admission_in_flight', 'Admitted requests running, by endpoint.', ('endpoint',)))
+admission_queue_depth = registry.register(Gauge(
+    'trivia_admission_queue_depth', 'Requests waiting for admission, by endpoint.', ('endpoint',)))
+admission_wait = registry.register(Histogram(
+    'trivia_admission_wait_seconds', 'Time admitted requests waited in the queue.', ('endpoint',),
+    buckets=WAIT_BUCKETS))
+admission_shed = registry.register(Counter(
+    'trivia_admission_shed_total', 'Requests refused by admission control, by endpoint and reason.',
+    ('endpoint', 'reason')))
+
+SHED_PAYLOADS = {
+    429: {'success': False, 'error': 429, 'message': 'Too many requests, slow down'},
+    503: {'success': False, 'error': 503, 'message': 'The server is busy, try again shortly'}
+}
+
+"""
+ConcurrencyLimit(endpoint, limit, queue_size, timeout)
+    the slots of one endpoint, for threaded workers. acquire() blocks in
+    the queue and returns None once admitted, or 'queue_full' or
+    'timeout'. Every admitted request must release() its slot.
+"""
+class ConcurrencyLimit:
+
+    def __init__(self, endpoint, limit, queue_size=ADMISSION_QUEUE_SIZE, timeout=ADMISSION_QUEUE_TIMEOUT):
+        self.endpoint = endpoint
+        self.limit = limit
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.in_flight = 0
+        self.waiting = 0
+        self._condition = threading.Condition()
+
+    def publish(self):
+        admission_in_flight.set(self.endpoint, value=self.in_flight)
+        admission_queue_depth.set(self.endpoint, value=self.waiting)
+
+    def acquire(self):
+        started = time.perf_counter()
+        with self._condition:
+            # newcomers queue behind waiting requests rather than taking a slot as it frees
+            if self.in_flight < self.limit and not self.waiting:
+                self.in_flight += 1
+                self.publish()
+                return None
+            if self.waiting >= self.queue_size:
+                return 'queue_full'
+            self.waiting += 1
+            self.publish()
+            try:
+                admitted = self._condition.wait_for(lambda: self.in_flight < self.limit, self.timeout)
+            finally:
+                self.waiting -= 1
+            if admitted:
+                self.in_flight += 1
+            self.publish()
+        if not admitted:
+            return 'timeout'
+        admission_wait.observe(self.endpoint, value=time.perf_counter() - started)
+        return None
+
+    def release(self):
+        with self._condition:
+            self.in_flight -= 1
+            self.publish()
+            self._condition.notify()
+
+"""
+AsyncConcurrencyLimit(endpoint, limit, queue_size, timeout)
+    the same limit for coroutines on one event loop. A released slot is
+    handed straight to the oldest waiter.
+"""
+class AsyncConcurrencyLimit(ConcurrencyLimit):
+
+    def __init__(self, endpoint, limit, queue_size=ADMISSION_QUEUE_SIZE, timeout=ADMISSION_QUEUE_TIMEOUT):
+        super().__init__(endpoint, limit, queue_size, timeout)
+        self._waiters = deque()
+
+    async def acquire(self):
+        if self.in_flight < self.limit and not self._waiters:
+            self.in_flight += 1
+            self.publish()
+            return None
+        if len(self._waiters) >= self.queue_size:
+            return 'queue_full'
+        started = time.perf_counter()
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self.waiting = len(self._waiters)
+        self.publish()
+        try:
+            await asyncio.wait_for(waiter, self.timeout)
+        except asyncio.TimeoutError:
+            return 'timeout'
+        except asyncio.CancelledError:
+            # cancelled just after being handed a slot
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+            self.waiting = len(self._waiters)
+            self.publish()
+        admission_wait.observe(self.endpoint, value=time.perf_counter() - started)
+        return None
+
+    def release(self):
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                # the slot passes to the waiter, in_flight stays the same
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+        self.publish()
+
+"""
+RateLimiter(rate, burst, max_clients)
+    per-client token buckets. take(client) spends a token and returns 0,
+    or returns the seconds until the client's next token.
+"""
+class RateLimiter:
+
+    def __init__(self, rate=RATE_LIMIT_PER_SECOND, burst=RATE_LIMIT_BURST, max_clients=RATE_LIMIT_CLIENTS):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def take(self, client, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            bucket = self._buckets.get(client)
+            if bucket is None:
+                bucket = self._buckets[client] = [float(self.burst), now]
+                # the least recently seen client goes first; its bucket would have refilled anyway
+                if len(self._buckets) > self.max_clients:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(client)
+                bucket[0] = min(float(self.burst), bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+                return 0
+            return (1 - bucket[0]) / self.rate
+
+
+def client_key(remote_addr, forwarded_for, trust_proxy):
+    # the first X-Forwarded-For address is the client's, when a proxy we run set it
+    if trust_proxy and forwarded_for:
+        return forwarded_for.split(',')[0].strip()
+    return remote_addr or 'unknown'
+
+
+def retry_after(reason, wait=0):
+    # a rate limit names its own wait; shed requests spread their retries over a second or two
+    if reason == 'rate_limited':
+        return max(1, math.ceil(wait))
+    return ADMISSION_RETRY_AFTER + random.randint(0, ADMISSION_RETRY_AFTER)
+
+
+def parse_limits(value, endpoints):
+    # "play_trivia=32,next_quiz_question=0" over the defaults in `endpoints`
+    limits = dict(endpoints)
+    for item in filter(None, (part.strip() for part in value.split(','))):
+        endpoint, _, limit = item.partition('=')
+        if endpoint not in endpoints:
+            raise ValueError('ADMISSION_LIMITS names unknown endpoint %r' % endpoint)
+        limits[endpoint] = int(limit)
+    return limits
+
+"""
+Admission
+    the admission settings of this process, read from the environment by
+    configure(endpoints). `endpoints` maps endpoint names to their
+    default concurrency limit. ADMISSION=off turns everything off and a
+    limit of 0 turns one endpoint's limit off. The rate limit is only on
+    with a RATE_LIMIT_PER_SECOND above 0.
+"""
+class Admission:
+
+    def __init__(self):
+        self.limits = {}
+        self.queue_size = ADMISSION_QUEUE_SIZE
+        self.timeout = ADMISSION_QUEUE_TIMEOUT
+        self.rate_limiter = None
+        self.trust_proxy = False
+
+    def configure(self, endpoints):
+        enabled = os.environ.get('ADMISSION', 'on').lower() not in ('0', 'false', 'no', 'off')
+        self.limits = parse_limits(os.environ.get('ADMISSION_LIMITS', ''), endpoints) if enabled else {}
+        self.queue_size = int(os.environ.get('ADMISSION_QUEUE_SIZE', ADMISSION_QUEUE_SIZE))
+        self.timeout = float(os.environ.get('ADMISSION_QUEUE_TIMEOUT', ADMISSION_QUEUE_TIMEOUT))
+        self.trust_proxy = os.environ.get('ADMISSION_TRUST_PROXY', '0').lower() in ('1', 'true', 'yes')
+        rate = float(os.environ.get('RATE_LIMIT_PER_SECOND', RATE_LIMIT_PER_SECOND))
+        self.rate_limiter = RateLimiter(
+            rate, int(os.environ.get('RATE_LIMIT_BURST', RATE_LIMIT_BURST)),
+            int(os.environ.get('RATE_LIMIT_CLIENTS', RATE_LIMIT_CLIENTS))) if enabled and rate > 0 else None
+
+    def build(self, limit_class):
+        # one limit per endpoint that has one, for threaded or async workers
+        limits = {endpoint: limit_class(endpoint, limit, self.queue_size, self.timeout)
+                  for endpoint, limit in self.limits.items() if limit > 0}
+        for limit in limits.values():
+            limit.publish()
+        return limits
+
+    def rate_limited(self, endpoint, client):
+        # seconds the client has to wait, or 0
+        if self.rate_limiter is None:
+            return 0
+        wait = self.rate_limiter.take(client)
+        if wait:
+            admission_shed.inc(endpoint, 'rate_limited')
+        return wait
+
+
+admission = Admission()
+registry.register(Gauge('trivia_rate_limit_clients', 'Clients with a rate limit bucket.',
+                        collect=lambda: len(admission.rate_limiter or ())))
+
+"""
+init_admission(app, endpoints)
+    applies the rate limit and the concurrency limits to the requests to
+    `endpoints`, a mapping of endpoint names to their default limit.
+"""
+def init_admission(app, endpoints):
+    admission.configure(endpoints)
+    limits = admission.build(ConcurrencyLimit)
+
+    def shed(status, reason, wait=0):
+        response = jsonify(SHED_PAYLOADS[status])
+        response.status_code = status
+        response.headers['Retry-After'] = str(retry_after(reason, wait))
+        return response
+
+    @app.before_request
+    def admit():
+        if request.endpoint not in admission.limits:
+            return
+        client = client_key(request.remote_addr, request.headers.get('X-Forwarded-For'), admission.trust_proxy)
+        wait = admission.rate_limited(request.endpoint, client)
+        if wait:
+            return shed(429, 'rate_limited', wait)
+        limit = limits.get(request.endpoint)
+        if limit is None:
+            return
+        reason = limit.acquire()
+        if reason is not None:
+            admission_shed.inc(request.endpoint, reason)
+            return shed(503, reason)
+        g.admission_limit = limit
+
+    @app.teardown_request
+    def release_slot(exc):
+        limit = g.pop('admission_limit', None)
+        if limit is not None:
+            limit.release()
@@ -0,0 +1,283 @@
+import atexit
+import logging
+import os
+import threading
+import time
+
+from sqlalchemy import case, func, insert
+from sqlalchemy.exc import IntegrityError
+
+from models import db, Question, AnswerEvent, QuestionStats, AnswerWatermark
+from instrumentation import registry, Counter, Gauge
+
+ANSWER_BATCH_LIMIT = 100
+ANSWER_FLUSH_SIZE = 1000
+ANSWER_FLUSH_INTERVAL = 1.0
+ANSWER_BUFFER_LIMIT = 100000
+ANSWER_AGGREGATE_INTERVAL = 30.0
+ANSWER_AGGREGATE_LIMIT = 50000
+# events younger than this wait for the next run, so a flush that is still committing is not skipped
+ANSWER_SETTLE_SECONDS = 5.0
+ANSWER_MIN_SAMPLES = 20
+# lowest correct rate of each difficulty, easiest first
+DIFFICULTY_RATES = ((1, 0.8), (2, 0.6), (3, 0.4), (4, 0.2), (5, 0.0))
+# how far past the edges of its difficulty's range a question's correct rate must go before it moves
+DIFFICULTY_MARGIN = 0.05
+# ids per IN (...) clause, below SQLite's variable limit
+ID_CHUNK = 500
+
+logger = logging.getLogger(__name__)
+
+"""
+Quiz answer analytics.
+
+POST /answers only validates the events and appends them to an
+in-memory buffer, so answering never waits on the database. A flusher
+thread writes the buffer to the append-only answer_events table with
+one multi-row INSERT every ANSWER_FLUSH_INTERVAL seconds, or as soon as
+ANSWER_FLUSH_SIZE events are waiting. Events that arrive while the
+buffer holds ANSWER_BUFFER_LIMIT are dropped and counted.
+
+An aggregator thread rolls new events up into question_stats every
+ANSWER_AGGREGATE_INTERVAL seconds. It then recalibrates the difficulty
+of every question it touched that has ANSWER_MIN_SAMPLES answers, from
+its correct rate (DIFFICULTY_RATES), once that rate is DIFFICULTY_MARGIN
+outside the range of its current difficulty. Progress is kept in
+answer_watermark. Each run claims its range of event ids by moving the
+watermark with a compare-and-set UPDATE, so every worker can run the
+aggregator without counting an event twice. Difficulty changes go
+through the ORM, so the in-process indexes and caches see them on
+commit. A run that changes no difficulty only writes question_stats,
+which leaves the data versions, ETags and cached pages as they were.
+"""
+
+answer_events = registry.register(Counter(
+    'trivia_answer_events_total', 'Answer events received, by outcome.', ('outcome',)))
+answer_flushes = registry.register(Counter(
+    'trivia_answer_flushes_total', 'Writes of buffered answer events, by result.', ('result',)))
+recalibrations = registry.register(Counter(
+    'trivia_difficulty_recalibrations_total', 'Question difficulties changed by the answer aggregator.'))
+
+"""
+parse_answers(body)
+    the answer events of a POST /answers body, which is one answer
+    ({"question_id": 4, "correct": true}) or up to ANSWER_BATCH_LIMIT of
+    them under "answers". Raises ValueError for anything else.
+"""
+def parse_answers(body):
+    if not isinstance(body, dict):
+        raise ValueError('body is not an object')
+    items = body['answers'] if 'answers' in body else [body]
+    if not isinstance(items, list) or not 0 < len(items) <= ANSWER_BATCH_LIMIT:
+        raise ValueError('answers must be a list of 1 to %d answers' % ANSWER_BATCH_LIMIT)
+    answered_at = time.time()
+    events = []
+    for item in items:
+        question_id = item.get('question_id') if isinstance(item, dict) else None
+        correct = item.get('correct') if isinstance(item, dict) else None
+        if not isinstance(question_id, int) or isinstance(question_id, bool) or not isinstance(correct, bool):
+            raise ValueError('every answer needs an integer question_id and a boolean correct')
+        events.append({'question_id': question_id, 'correct': correct, 'answered_at': answered_at})
+    return events
+
+"""
+calibrated_difficulty(answers, correct, min_samples, current)
+    the difficulty matching a correct rate, or None while there are too
+    few answers to tell. A question keeps its `current` difficulty until
+    the rate is DIFFICULTY_MARGIN outside that difficulty's range, so
+    one that hovers at an edge does not flip on every run.
+"""
+def calibrated_difficulty(answers, correct, min_samples=ANSWER_MIN_SAMPLES, current=None):
+    if answers < min_samples or answers == 0:
+        return None
+    rate = correct / answers
+    lowest_rates = dict(DIFFICULTY_RATES)
+    if current in lowest_rates:
+        highest = lowest_rates.get(current - 1, 1.0)
+        if lowest_rates[current] - DIFFICULTY_MARGIN <= rate < highest + DIFFICULTY_MARGIN:
+            return current
+    for difficulty, lowest in DIFFICULTY_RATES:
+        if rate >= lowest:
+            return difficulty
+
+
+def chunks(ids):
+    for start in range(0, len(ids), ID_CHUNK):
+        yield ids[start:start + ID_CHUNK]
+
+
+def claim_events(limit, settle):
+    # (first, last] event ids for this run, reserved by moving the watermark; None if there is nothing to do
+    if db.session.query(AnswerWatermark).get(1) is None:
+        db.session.add(AnswerWatermark(id=1, last_event_id=0))
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # created by another worker in the meantime
+            db.session.rollback()
+    since = db.session.query(AnswerWatermark.last_event_id).filter(AnswerWatermark.id == 1).scalar()
+    upto = db.session.query(func.max(AnswerEvent.id)).filter(
+        AnswerEvent.id > since, AnswerEvent.id <= since + limit,
+        AnswerEvent.recorded_at < time.time() - settle).scalar()
+    if upto is None:
+        return None
+    claimed = db.session.query(AnswerWatermark) \
+        .filter(AnswerWatermark.id == 1, AnswerWatermark.last_event_id == since) \
+        .update({'last_event_id': upto}, synchronize_session=False)
+    # another worker moved the watermark first and takes this range
+    return (since, upto) if claimed == 1 else None
+
+"""
+aggregate_answers(limit, settle, recalibrate, min_samples)
+    rolls up to `limit` new answer events older than `settle` seconds
+    into question_stats and, if `recalibrate`, updates the difficulty of
+    the questions they touched. Everything commits in one transaction.
+    Returns the number of events, questions and recalibrated questions.
+"""
+def aggregate_answers(limit=ANSWER_AGGREGATE_LIMIT, settle=ANSWER_SETTLE_SECONDS, recalibrate=True,
+                      min_samples=ANSWER_MIN_SAMPLES):
+    result = {'events': 0, 'questions': 0, 'recalibrated': 0}
+    try:
+        claimed = claim_events(limit, settle)
+        if claimed is None:
+            db.session.rollback()
+            return result
+        since, upto = claimed
+        rows = db.session.query(AnswerEvent.question_id, func.count(AnswerEvent.id),
+                                func.sum(case([(AnswerEvent.correct, 1)], else_=0))) \
+            .filter(AnswerEvent.id > since, AnswerEvent.id <= upto) \
+            .group_by(AnswerEvent.question_id).all()
+        ids = [question_id for question_id, _, _ in rows]
+        stats = {}
+        for chunk in chunks(ids):
+            stats.update((stat.question_id, stat) for stat in
+                         QuestionStats.query.filter(QuestionStats.question_id.in_(chunk)))
+        now = time.time()
+        for question_id, answers, correct in rows:
+            stat = stats.get(question_id)
+            if stat is None:
+                stat = stats[question_id] = QuestionStats(question_id=question_id, answers=0, correct=0)
+                db.session.add(stat)
+            stat.answers += answers
+            stat.correct += int(correct or 0)
+            stat.updated_at = now
+            result['events'] += answers
+        result['questions'] = len(rows)
+
+        if recalibrate:
+            for chunk in chunks(ids):
+                for question in Question.query.filter(Question.id.in_(chunk)):
+                    difficulty = calibrated_difficulty(stats[question.id].answers, stats[question.id].correct,
+                                                       min_samples, question.difficulty)
+                    if difficulty is not None and difficulty != question.difficulty:
+                        question.difficulty = difficulty
+                        result['recalibrated'] += 1
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    recalibrations.inc(amount=result['recalibrated'])
+    return result
+
+"""
+AnswerPipeline
+    the in-memory answer buffer of one process and its flusher and
+    aggregator threads. The threads start on first use rather than at
+    import, so every forked worker gets its own.
+"""
+class AnswerPipeline:
+
+    def __init__(self):
+        self.app = None
+        self.flush_size = ANSWER_FLUSH_SIZE
+        self.flush_interval = ANSWER_FLUSH_INTERVAL
+        self.buffer_limit = ANSWER_BUFFER_LIMIT
+        self.aggregate_interval = ANSWER_AGGREGATE_INTERVAL
+        self.recalibrate = True
+        self._condition = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._events = []
+        self._started = False
+
+    def configure(self, app):
+        self.app = app
+        self.flush_size = int(os.environ.get('ANSWER_FLUSH_SIZE', ANSWER_FLUSH_SIZE))
+        self.flush_interval = float(os.environ.get('ANSWER_FLUSH_INTERVAL', ANSWER_FLUSH_INTERVAL))
+        self.buffer_limit = int(os.environ.get('ANSWER_BUFFER_LIMIT', ANSWER_BUFFER_LIMIT))
+        self.aggregate_interval = float(os.environ.get('ANSWER_AGGREGATE_INTERVAL', ANSWER_AGGREGATE_INTERVAL))
+        self.recalibrate = os.environ.get('ANSWER_RECALIBRATE', '1').lower() not in ('0', 'false', 'no', 'off')
+
+    def __len__(self):
+        return len(self._events)
+
+    def record(self, events):
+        # buffers as many events as fit and returns how many that was
+        self.start()
+        with self._condition:
+            accepted = events[:max(self.buffer_limit - len(self._events), 0)]
+            self._events.extend(accepted)
+            if len(self._events) >= self.flush_size:
+                self._condition.notify()
+        answer_events.inc('accepted', amount=len(accepted))
+        if len(accepted) < len(events):
+            answer_events.inc('dropped', amount=len(events) - len(accepted))
+        return len(accepted)
+
+    def start(self):
+        if self._started:
+            return
+        with self._condition:
+            if self._started:
+                return
+            self._started = True
+        threading.Thread(target=self._flush_loop, name='answer-flusher', daemon=True).start()
+        if self.aggregate_interval > 0:
+            threading.Thread(target=self._aggregate_loop, name='answer-aggregator', daemon=True).start()
+        atexit.register(self.flush)
+
+    def _flush_loop(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: len(self._events) >= self.flush_size, self.flush_interval)
+            self.flush()
+
+    def flush(self):
+        with self._flush_lock:
+            with self._condition:
+                events, self._events = self._events, []
+            if not events:
+                return 0
+            recorded_at = time.time()
+            for event in events:
+                event['recorded_at'] = recorded_at
+            try:
+                with self.app.app_context():
+                    db.session.execute(insert(AnswerEvent.__table__), events)
+                    db.session.commit()
+            except Exception:
+                logger.exception("answer flush failed", extra={'events': len(events)})
+                answer_flushes.inc('failed')
+                with self._condition:
+                    # kept for the next flush, as far as the buffer has room
+                    kept = events[:max(self.buffer_limit - len(self._events), 0)]
+                    self._events[:0] = kept
+                answer_events.inc('dropped', amount=len(events) - len(kept))
+                return 0
+            answer_flushes.inc('ok')
+            return len(events)
+
+    def _aggregate_loop(self):
+        while True:
+            time.sleep(self.aggregate_interval)
+            try:
+                with self.app.app_context():
+                    result = aggregate_answers(recalibrate=self.recalibrate)
+                if result['events']:
+                    logger.info("answers aggregated", extra=result)
+            except Exception:
+                logger.exception("answer aggregation failed")
+
+
+answer_pipeline = AnswerPipeline()
+registry.register(Gauge('trivia_answer_buffer_events', 'Answer events waiting to be written.',
+                        collect=lambda: len(answer_pipeline)))
@@ -1,37 +1,210 @@
+import csv
+import io
+import json
+import logging
 import os
-from flask import Flask, request, abort, jsonify
-from flask_sqlalchemy import SQLAlchemy
+import time
+import click
+from datetime import datetime, timezone
+from flask import Flask, Response, g, request, abort, jsonify, stream_with_context
 from flask_cors import CORS
-import random
+from werkzeug.exceptions import HTTPException
 
-from models import setup_db, Question, Category
-db = SQLAlchemy()
+from models import setup_db, db, pool_stats, Question, QuestionStats
+from pagination import paginate, paginate_search, paginate_selection
+from counts import question_counts
+from changes import change_feed, init_change_feed
+from category_cache import category_cache
+from search import init_search, tokenize
+from quiz_sessions import quiz_sessions, deal_deck, parse_session_request, QUIZ_PREFETCH_LIMIT
+from question_ids import question_ids, target_difficulty, ALL_CATEGORIES, ANY_DIFFICULTY
+from bulk import export_questions, guess_format, import_questions, IMPORT_BATCH_SIZE
+import batch
+from versions import data_versions
+from response_cache import response_cache, category_tag, ALL_QUESTIONS_TAG
+from serialization import json_response, project_questions
+from instrumentation import init_instrumentation, register_pool_metrics
+from profiling import init_profiling
+from replicas import init_replicas
+from admission import init_admission
+from category_migration import migrate_category, MIGRATION_BATCH_SIZE, MIGRATION_PAUSE
+from snapshot import write_snapshot
+from suggest import suggest_index, SUGGEST_LIMIT, SUGGEST_MAX_LIMIT
+from dedup import cluster_duplicates, dedup_mode, duplicate_index, screen, DEDUP_FLAG, DEDUP_REJECT, \
+    DEDUP_THRESHOLD
+from snapshot_app import create_snapshot_app
+from answers import aggregate_answers, answer_pipeline, parse_answers, ANSWER_AGGREGATE_LIMIT, ANSWER_SETTLE_SECONDS
 
-QUESTIONS_PER_PAGE = 10
+logger = logging.getLogger(__name__)
+
+# GET endpoints that answer conditional requests, with the tables their payload depends on
+CONDITIONAL_ENDPOINTS = {
+    'get_questions': ('questions', 'categories'),
+    'get_categories': ('questions', 'categories'),
+    'get_categories_questions': ('questions', 'categories'),
+    'search_questions': ('questions',),
+    'suggest_questions': ('questions',),
+    'bulk_export_questions': ('questions',)
+}
+
+# endpoints that only read from the database and may be served by a read replica
+REPLICA_ENDPOINTS = {
+    'get_questions', 'get_categories', 'get_categories_questions', 'search_questions',
+    'bulk_export_questions', 'play_trivia', 'create_quiz_session', 'next_quiz_question', 'get_question_stats'
+}
+
+# endpoints under admission control, with the requests each may run at once per process
+ADMISSION_ENDPOINTS = {
+    'play_trivia': 16,
+    'create_quiz_session': 8,
+    'next_quiz_question': 16
+}
 
 def create_app(test_config=None):
+    # SNAPSHOT_PATH switches to the read-only app that serves a snapshot file without a database
+    snapshot_path = (test_config or {}).get('SNAPSHOT_PATH') or os.environ.get('SNAPSHOT_PATH')
+    if snapshot_path:
+        return create_snapshot_app(snapshot_path, test_config)
+
     # create and configure the app
     app = Flask(__name__)
+    app.config.from_mapping(test_config or {})
+    init_instrumentation(app)
+    init_profiling(app)
+    init_admission(app, ADMISSION_ENDPOINTS)
     setup_db(app)
+    init_change_feed(app)
+    with app.app_context():
+        engine = db.get_engine(app)
+    register_pool_metrics(lambda: pool_stats(engine))
+    init_replicas(app, REPLICA_ENDPOINTS)
     CORS(app, resources={'/': {'origins': '*'}})
+    response_cache.configure()
+    answer_pipeline.configure(app)
+    dedup = dedup_mode()
+    with app.app_context():
+        # read first, so that writes committed during the rebuilds are not missed
+        since = change_feed.head()
+        question_counts.rebuild()
+        search_engine = init_search()
+        question_ids.rebuild()
+        suggest_index.rebuild()
+        # the duplicate index is built by the first screened write, see dedup.py
+        duplicate_index.clear()
+        change_feed.start(since)
+
+    def screening_mode(body):
+        # allow_duplicate lets a moderator insert a question the policy would reject
+        return DEDUP_FLAG if dedup == DEDUP_REJECT and body.get('allow_duplicate') is True else dedup
+
+    @app.cli.command('rebuild-counts')
+    def rebuild_counts():
+        question_counts.rebuild()
+        click.echo("question counts rebuilt: %s" % question_counts.total())
+
+    @app.cli.command('import-questions')
+    @click.argument('path', type=click.Path(exists=True, dir_okay=False))
+    @click.option('--format', 'fmt', type=click.Choice(['ndjson', 'csv']))
+    @click.option('--batch-size', default=IMPORT_BATCH_SIZE)
+    @click.option('--allow-duplicate', is_flag=True, help='import near-duplicates even with DEDUP_MODE=reject')
+    def import_questions_command(path, fmt, batch_size, allow_duplicate):
+        with open(path, newline='', encoding='utf-8') as stream:
+            stats = import_questions(stream, fmt or guess_format(path), batch_size,
+                                     screening_mode({'allow_duplicate': allow_duplicate}))
+        for error in stats['errors']:
+            click.echo("rejected row %(row)s: %(error)s" % error)
+        click.echo("imported %(inserted)s questions, rejected %(rejected)s, screened %(screened)s for duplicates, "
+                   "%(rows_per_second)s rows/s" % stats)
+
+    @app.cli.command('migrate-category')
+    @click.option('--batch-size', default=MIGRATION_BATCH_SIZE)
+    @click.option('--pause', default=MIGRATION_PAUSE, help='seconds to sleep between backfill batches')
+    @click.option('--drop-old', is_flag=True, help='drop the old string column once the swap is done')
+    def migrate_category_command(batch_size, pause, drop_old):
+        try:
+            migrate_category(batch_size, pause, drop_old, echo=click.echo)
+        except RuntimeError as e:
+            raise click.ClickException(str(e))
+
+    @app.cli.command('aggregate-answers')
+    @click.option('--limit', default=ANSWER_AGGREGATE_LIMIT, help='most answer events to roll up per run')
+    @click.option('--settle', default=ANSWER_SETTLE_SECONDS, help='skip answer events written less than this many seconds ago')
+    @click.option('--no-recalibrate', is_flag=True, help='update the statistics but leave difficulties alone')
+    def aggregate_answers_command(limit, settle, no_recalibrate):
+        total = {'events': 0, 'questions': 0, 'recalibrated': 0}
+        while True:
+            result = aggregate_answers(limit, settle, recalibrate=not no_recalibrate)
+            if not result['events']:
+                break
+            for key in total:
+                total[key] += result[key]
+        click.echo("aggregated %(events)s answers to %(questions)s questions, recalibrated %(recalibrated)s" % total)
+
+    @app.cli.command('export-snapshot')
+    @click.argument('path', type=click.Path(dir_okay=False, writable=True))
+    def export_snapshot_command(path):
+        started = time.perf_counter()
+        total = write_snapshot(path)
+        click.echo("wrote %s questions to %s in %.1fs" % (total, path, time.perf_counter() - started))
+
+    @app.cli.command('find-duplicates')
+    @click.option('--threshold', default=DEDUP_THRESHOLD, help='estimated similarity from which questions are grouped')
+    @click.option('--output', type=click.Path(dir_okay=False, writable=True), help='write the groups as NDJSON')
+    def find_duplicates_command(threshold, output):
+        started = time.perf_counter()
+        clusters = cluster_duplicates(threshold, echo=click.echo)
+        keepers = [members[0] for members in clusters]
+        titles = {}
+        for offset in range(0, len(keepers), IMPORT_BATCH_SIZE):
+            titles.update(db.session.query(Question.id, Question.question)
+                          .filter(Question.id.in_(keepers[offset:offset + IMPORT_BATCH_SIZE])))
+        if output:
+            with open(output, 'w', encoding='utf-8') as stream:
+                for members in clusters:
+                    stream.write(json.dumps({'ids': members, 'question': titles.get(members[0])}) + '\n')
+        else:
+            for members in clusters:
+                click.echo("%d questions %s: %s" % (len(members), members, titles.get(members[0])))
+        click.echo("found %d groups covering %d questions in %.1fs"
+                   % (len(clusters), sum(len(members) for members in clusters), time.perf_counter() - started))
+
+    @app.cli.command('export-questions')
+    @click.argument('path', type=click.Path(dir_okay=False, writable=True))
+    @click.option('--format', 'fmt', type=click.Choice(['ndjson', 'csv']))
+    def export_questions_command(path, fmt):
+        with open(path, 'w', newline='', encoding='utf-8') as stream:
+            for chunk in export_questions(fmt or guess_format(path)):
+                stream.write(chunk)
   
+    @app.before_request
+    def answer_conditional_get():
+        tables = CONDITIONAL_ENDPOINTS.get(request.endpoint)
+        if request.method != 'GET' or tables is None:
+            return None
+        # taken before the handler runs, so a concurrent write can only make the ETag older than the body
+        g.etag = data_versions.etag(tables)
+        # HTTP dates have whole seconds, so only offer one once that second is over
+        modified = int(data_versions.last_modified(tables))
+        g.last_modified = datetime.fromtimestamp(modified, timezone.utc) if modified < int(time.time()) else None
+        if request.if_none_match:
+            not_modified = request.if_none_match.contains(g.etag)
+        else:
+            not_modified = g.last_modified is not None and request.if_modified_since is not None and \
+                request.if_modified_since.replace(tzinfo=timezone.utc) >= g.last_modified
+        if not_modified:
+            return app.response_class(status=304)
+        return None
+
     @app.after_request
     def after_request(response):
         response.headers.add('Access-Control-Allow-Headers', 'Content-Type, Authorization')
         response.headers.add('Access-Control-Allow-Headers', 'GET, POST, PATCH, DELETE, OPTIONS')
+        if 'etag' in g and response.status_code in (200, 304):
+            response.set_etag(g.etag)
+            if g.last_modified is not None:
+                response.last_modified = g.last_modified
         return response
     
-    # Define pagination method
-
-    def paginate_selection(request,selection):
-        page = request.args.get('page',1,type=int)
-        start = (page-1)*QUESTIONS_PER_PAGE
-        end = start + QUESTIONS_PER_PAGE
-
-        questions = [question.format() for question in selection]
-        current_question = questions[start:end]
-
-        return current_question
     """
     @TODO:
     Create an endpoint to handle GET requests
@@ -40,49 +213,37 @@ def create_app(test_config=None):
     # Get endpoints for questions
 
     @app.route('/questions')
+    @response_cache.cached(lambda view_args: {ALL_QUESTIONS_TAG})
     def get_questions():
         try:
-            select_questions = Question.query.order_by(Question.id).all()
-            cur_questions= paginate_selection(request,select_questions)
-            category_id=[]
-            category_type=[]
-            current_categories={}
-            categories = Category.query.all()
-            for i in categories:
-                category_id.append(i.id)
-                category_type.append(i.type)    
-            print("cur que:",cur_questions)
-            current_categories = dict(zip(category_id, category_type))
-            print("________________curre cat___________:",current_categories)
+            select_questions = Question.query.order_by(Question.id)
+            cur_questions, cursors = paginate(request,select_questions)
+            current_categories = category_cache.get()
             if len(cur_questions) ==0:
                 abort(404)
             else:    
-                return jsonify({
+                return json_response({
                     'success':True,
                     'questions':cur_questions,
-                    'total_questions': len(Question.query.all()),
-                    'categories':current_categories
+                    'total_questions': question_counts.total(),
+                    'categories':current_categories,
+                    **cursors
                 })
-        except Exception as e:
-            print("get question exception",e)
+        except HTTPException:
+            raise
+        except Exception:
+            logger.exception("get_questions failed")
         
      # Get endpoints for categories
     @app.route('/categories')
     def get_categories():
-        category_id=[]
-        category_type=[]
-        current_categories={}
-        categories = Category.query.all()
-        for i in categories:
-            category_id.append(i.id)
-            category_type.append(i.type)
-
-        if len(categories) == 0:
+        current_categories = category_cache.get()
+        if len(current_categories) == 0:
             abort(404)
-        print("cate:",categories)
         return jsonify({
         'success': True,
-        'categories': current_categories
+        'categories': current_categories,
+        'question_counts': question_counts.by_category()
         })
     """
     @TODO:
@@ -115,10 +276,10 @@ def create_app(test_config=None):
             return jsonify({
                 'success':True,
                 'Deleted question':question_id,
-                'Total Questions':len(Question.query.all())
+                'Total Questions':question_counts.total()
             })
-        except Exception as e:
-            print("Delete Exception:",e)
+        except Exception:
+            logger.exception("delete_questions failed", extra={'question_id': question_id})
             abort(422)
     
     """
@@ -134,6 +295,8 @@ def create_app(test_config=None):
     @app.route('/questions',methods=["POST"])
     def create_question():
         body = request.get_json()
+        if not isinstance(body, dict):
+            abort(422)
         new_question = body.get('question')
         new_answer =  body.get('answer')
         new_category = body.get('category')
@@ -142,20 +305,99 @@ def create_app(test_config=None):
         if(new_question or new_answer or new_category or new_difficulty) == None:
             abort(422)
         try:    
+            duplicates, rejected = screen(new_question, new_answer, screening_mode(body))
+            if rejected:
+                return jsonify({
+                    'success': False,
+                    'error': 409,
+                    'message': 'The question duplicates an existing one',
+                    'duplicates': duplicates
+                }), 409
             ques = Question(question=new_question,answer=new_answer,category=new_category,difficulty=new_difficulty)   
             ques.insert()
 
-            selection = Question.query.order_by(Question.id).all()
+            selection = Question.query.order_by(Question.id)
             new_questions = paginate_selection(request,selection)
             return jsonify({
                 'success':True,
-                'New_question_ID':Question.id,
+                'New_question_ID':ques.id,
                 'curr_questions':new_questions,
-                'Total_Questions':len(Question.query.all())
+                'Total_Questions':question_counts.total(),
+                'duplicates':duplicates
             })
-        except Exception as e:
-            print("Exception as e:",e)
+        except Exception:
+            logger.exception("create_question failed")
+            abort(422)
+    # Batch create and delete, one transaction per request
+
+    @app.route('/questions/batch',methods=["POST"])
+    def create_questions_batch():
+        body = request.get_json() or {}
+        items = body.get('questions') if isinstance(body, dict) else None
+        if not isinstance(items, list) or not items or len(items) > batch.MAX_BATCH_SIZE:
+            abort(422)
+        try:
+            results, created = batch.create_questions(items, screening_mode(body))
+        except Exception:
+            logger.exception("create_questions_batch failed")
+            db.session.rollback()
+            abort(422)
+        return jsonify({
+            'success': True,
+            'results': results,
+            'created': created,
+            'total_questions': question_counts.total()
+        })
+
+    @app.route('/questions/batch',methods=["DELETE"])
+    def delete_questions_batch():
+        body = request.get_json() or {}
+        question_ids = body.get('ids') if isinstance(body, dict) else None
+        if not isinstance(question_ids, list) or not question_ids or len(question_ids) > batch.MAX_BATCH_SIZE \
+                or not all(isinstance(question_id, int) for question_id in question_ids):
+            abort(422)
+        try:
+            results, deleted = batch.delete_questions(question_ids)
+        except Exception:
+            logger.exception("delete_questions_batch failed")
+            db.session.rollback()
+            abort(422)
+        return jsonify({
+            'success': True,
+            'results': results,
+            'deleted': deleted,
+            'total_questions': question_counts.total()
+        })
+
+    # Bulk import and export, streamed in batches
+
+    @app.route('/questions/import',methods=["POST"])
+    def bulk_import_questions():
+        fmt = request.args.get('format') or guess_format(None, 'csv' if request.mimetype == 'text/csv' else 'ndjson')
+        batch_size = request.args.get('batch_size', IMPORT_BATCH_SIZE, type=int)
+        if fmt not in ('ndjson', 'csv') or batch_size < 1:
+            abort(422)
+        stream = io.TextIOWrapper(request.stream, encoding='utf-8', newline='')
+        mode = screening_mode({'allow_duplicate': request.args.get('allow_duplicate') == 'true'})
+        try:
+            stats = import_questions(stream, fmt, batch_size, mode)
+        except (UnicodeDecodeError, csv.Error) as e:
+            logger.warning("bulk import rejected: %s", e)
+            abort(422)
+        return jsonify({
+            'success': True,
+            **stats,
+            'total_questions': question_counts.total()
+        })
+
+    @app.route('/questions/export')
+    def bulk_export_questions():
+        fmt = request.args.get('format', 'ndjson')
+        if fmt not in ('ndjson', 'csv'):
             abort(422)
+        mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+        return Response(stream_with_context(export_questions(fmt)), mimetype=mimetype)
+
     """
     @TODO:
     Create a POST endpoint to get questions based on a search term.
@@ -167,17 +409,24 @@ def create_app(test_config=None):
     Try using the word "title" to start.
     """
     @app.route('/questions/search')
+    @response_cache.cached(lambda view_args: {ALL_QUESTIONS_TAG})
     def search_questions():
         search_ques = request.args.get('search')
         if search_ques is None:
             abort(422)
-        selection = Question.query.filter(Question.question.ilike(f'%{search_ques}%')).all()
-        if selection is None:
-            abort(404)
-        search_questions = paginate_selection(request, selection)
-        return jsonify({
+        include_answers = request.args.get('answers', '').lower() in ('1', 'true', 'yes')
+        if tokenize(search_ques):
+            search_questions, total, cursors = paginate_search(request, search_engine, search_ques, include_answers)
+        else:
+            # nothing to match on, so every question qualifies like ILIKE '%%' did
+            selection = Question.query.order_by(Question.id)
+            search_questions, cursors = paginate(request, selection)
+            total = question_counts.total()
+        return json_response({
             'success':True,
-            'Questions':list(search_questions)
+            'Questions':list(search_questions),
+            'total_questions':total,
+            **cursors
         })
     """
     @TODO:
@@ -189,24 +438,42 @@ def create_app(test_config=None):
     """
  
 
+    # Search-as-you-type, answered from the in-memory prefix index
+
+    @app.route('/questions/suggest')
+    def suggest_questions():
+        prefix = request.args.get('prefix')
+        limit = request.args.get('limit', SUGGEST_LIMIT, type=int)
+        if prefix is None or not 1 <= limit <= SUGGEST_MAX_LIMIT:
+            abort(422)
+        terms, questions = suggest_index.suggest(prefix, limit)
+        return json_response({
+            'success': True,
+            'prefix': prefix,
+            'terms': terms,
+            'questions': [{'id': question_id, 'question': title} for question_id, title in questions]
+        })
+
     @app.route('/categories/<int:category_id>/questions')
+    @response_cache.cached(lambda view_args: {category_tag(view_args['category_id'])})
     def get_categories_questions(category_id):
         try:
-            select_question = Question.query.filter(Question.category==str(category_id)).all()
-            print("Select:",select_question)
-            paginate_question = paginate_selection(request,select_question)
-            print("_________paginate_______",paginate_question)
-            curr_cat=Category.query.get(category_id)
-            # current_cat[curr_cat.id]=curr_cat.type
-            print("curre cat__________",curr_cat)
-            return jsonify({
+            select_question = Question.query.filter(Question.in_category(category_id)).order_by(Question.id)
+            paginate_question, cursors = paginate(request,select_question)
+            curr_cat = category_cache.type_of(category_id)
+            if curr_cat is None:
+                abort(404)
+            return json_response({
                 'success':True,
                 'questions':paginate_question,
-                'Total_Questions_category':len(select_question),
-                'current_cat':curr_cat.type
+                'Total_Questions_category':question_counts.count(category_id),
+                'current_cat':curr_cat,
+                **cursors
             })
-        except Exception as e:
-            print("cat ques exception____________:",e)
+        except HTTPException:
+            raise
+        except Exception:
+            logger.exception("get_categories_questions failed", extra={'category_id': category_id})
             abort(404)
     """
     @TODO:
@@ -227,23 +494,116 @@ def create_app(test_config=None):
             previous_questions = body.get('previous_questions')
             if (quiz_category or previous_questions) == None:
                 abort(422)
-            if quiz_category['type'] == 'click':
-                available_questions = Question.query.filter(
-                    Question.id.notin_((previous_questions))).all()
-            else:
-                available_questions = Question.query.filter_by(
-                    category=quiz_category['id']).filter(Question.id.notin_((previous_questions))).all()
+            category = ALL_CATEGORIES if quiz_category['type'] == 'click' else quiz_category['id']
+            difficulty = target_difficulty(body.get('difficulty'))
+            excluded = set(previous_questions)
+            if 'count' in body:
+                return prefetch_questions(category, excluded, body['count'], difficulty)
+            new_question = None
+            question_id = question_ids.random_unseen(category, excluded, difficulty)
+            while question_id is not None:
+                question = Question.query.get(question_id)
+                if question is not None:
+                    new_question = question.format()
+                    break
+                # deleted by another worker since the index was refreshed
+                excluded.add(question_id)
+                question_id = question_ids.random_unseen(category, excluded, difficulty)
 
-            new_question = available_questions[random.randrange(
-                0, len(available_questions))].format() if len(available_questions) > 0 else None
-
-            return jsonify({
+            return json_response({
                 'success': True,
                 'question': new_question
             })  
         except:
             abort(422)  
-            
+
+    def prefetch_questions(category, excluded, count, difficulty=ANY_DIFFICULTY):
+        # a whole round in one response: one index draw and one IN (...) query
+        # bool is an int subclass, so `true` would otherwise pass as 1
+        if not isinstance(count, int) or isinstance(count, bool) or count < 1:
+            abort(422)
+        chosen = question_ids.random_unseen_many(category, excluded, min(count, QUIZ_PREFETCH_LIMIT), difficulty)
+        rows = {question['id']: question for question in project_questions(Question.query.filter(Question.id.in_(chosen)))} if chosen else {}
+        questions = [rows[question_id] for question_id in chosen if question_id in rows]
+        return json_response({
+            'success': True,
+            'question': questions[0] if questions else None,
+            'questions': questions
+        })
+
+    # Server-side quiz sessions: the deck is shuffled once, every round pops one id
+
+    @app.route('/quizzes/sessions',methods=["POST"])
+    def create_quiz_session():
+        try:
+            category, difficulty, deck_size = parse_session_request(request.get_json() or {})
+        except ValueError:
+            abort(422)
+        session_id, total = quiz_sessions.create(deal_deck(category, difficulty, deck_size), deck_size)
+        return jsonify({
+            'success': True,
+            'session_id': session_id,
+            'total_questions': total
+        })
+
+    @app.route('/quizzes/sessions/<session_id>/next',methods=["POST"])
+    def next_quiz_question(session_id):
+        session = quiz_sessions.get(session_id)
+        if session is None:
+            abort(404)
+        new_question = None
+        question_id = session.next_id()
+        while question_id is not None:
+            # skip ids whose question was deleted after the deck was dealt
+            question = Question.query.get(question_id)
+            if question is not None:
+                new_question = question.format()
+                break
+            question_id = session.next_id()
+
+        return json_response({
+            'success': True,
+            'question': new_question,
+            'remaining': len(session.deck)
+        })
+
+    @app.route('/quizzes/sessions/<session_id>',methods=["DELETE"])
+    def end_quiz_session(session_id):
+        if not quiz_sessions.discard(session_id):
+            abort(404)
+        return jsonify({
+            'success': True,
+            'session_id': session_id
+        })
+
+    # Answer events: buffered in memory and written in batches, see answers.py
+
+    @app.route('/answers',methods=["POST"])
+    def record_answers():
+        try:
+            events = parse_answers(request.get_json())
+        except ValueError:
+            abort(422)
+        accepted = answer_pipeline.record(events)
+        if not accepted:
+            return jsonify({'success': False, 'error': 503, 'message': 'Too many answers waiting to be written'}), 503
+        return jsonify({
+            'success': True,
+            'accepted': accepted
+        }), 202
+
+    @app.route('/questions/<int:question_id>/stats')
+    def get_question_stats(question_id):
+        question = Question.query.get(question_id)
+        if question is None:
+            abort(404)
+        stats = QuestionStats.query.get(question_id) or QuestionStats(question_id=question_id, answers=0, correct=0)
+        return jsonify({
+            'success': True,
+            'difficulty': question.difficulty,
+            **stats.format()
+        })
+
     """
     @TODO:
     Create error handlers for all expected errors
@@ -262,4 +622,11 @@ def create_app(test_config=None):
             jsonify({'success': False, 'error': 404,'message': 'The request can not be processed'}),
             422
         )
+
+    @app.errorhandler(500)
+    def server_error(error):
+        return (
+            jsonify({'success': False, 'error': 500, 'message': 'Internal server error'}),
+            500
+        )
     return app
@@ -0,0 +1,348 @@
+import asyncio
+import io
+import json
+import logging
+import os
+import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import abort
+from werkzeug.exceptions import HTTPException
+
+from models import db
+from changes import change_feed
+from app import create_app
+from async_db import open_store
+from question_ids import question_ids, target_difficulty, ALL_CATEGORIES, ANY_DIFFICULTY
+from quiz_sessions import quiz_sessions, deal_deck, parse_session_request, QUIZ_PREFETCH_LIMIT
+from serialization import json_dumps
+from answers import answer_pipeline, parse_answers
+from instrumentation import http_requests, http_latency
+from admission import admission, admission_shed, client_key, retry_after, AsyncConcurrencyLimit, SHED_PAYLOADS
+
+ASGI_WSGI_THREADS = 32
+
+logger = logging.getLogger(__name__)
+
+"""
+ASGI entry point for the trivia API.
+
+    cd flaskr && uvicorn --factory asgi:create_asgi_app --workers 4
+
+The quiz endpoints, which see the spikes, run as coroutines: the next
+question is drawn from the in-process id index and its row is fetched
+through an async driver (see async_db.py), so one process keeps
+thousands of quiz clients in flight without a thread each. POST
+/answers runs on the event loop too, as it only appends to the answer
+buffer (see answers.py). The quiz coroutines get the same rate limit
+and per-endpoint concurrency limits as under WSGI (see admission.py),
+with their queues on the event loop. Every other route, OPTIONS
+included, is handed to the Flask app from create_app() in a bounded
+thread pool (ASGI_WSGI_THREADS), so all routes, JSON
+contracts, caches and hooks are the same as under WSGI. Writes go
+through Flask, which keeps the shared in-process indexes current; the
+coroutines sync the change feed (see changes.py) before they read them.
+"""
+
+# payloads of the Flask app's error handlers, keyed by status
+ERROR_PAYLOADS = {
+    404: {'success': False, 'error': 404, 'message': 'Data not found'},
+    422: {'success': False, 'error': 404, 'message': 'The request can not be processed'},
+    500: {'success': False, 'error': 500, 'message': 'Internal server error'}
+}
+CORS_HEADERS = [
+    (b'access-control-allow-origin', b'*'),
+    (b'access-control-allow-headers', b'Content-Type, Authorization'),
+    (b'access-control-allow-headers', b'GET, POST, PATCH, DELETE, OPTIONS')
+]
+
+
+async def read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            return b''.join(chunks)
+
+
+def request_json(scope, body):
+    # like flask.Request.get_json(): None unless the body is declared JSON
+    content_type = dict(scope['headers']).get(b'content-type', b'').split(b';')[0].strip()
+    if content_type != b'application/json' and not content_type.endswith(b'+json'):
+        return None
+    try:
+        return json.loads(body)
+    except ValueError:
+        abort(400)
+
+
+class WsgiBridge:
+
+    def __init__(self, wsgi_app, threads=ASGI_WSGI_THREADS):
+        self.wsgi_app = wsgi_app
+        self.executor = ThreadPoolExecutor(threads, thread_name_prefix='wsgi')
+
+    def environ(self, scope, body):
+        server = scope.get('server') or ('localhost', 80)
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': scope.get('root_path', ''),
+            'PATH_INFO': scope['path'],
+            'QUERY_STRING': scope['query_string'].decode('latin-1'),
+            'SERVER_NAME': server[0],
+            'SERVER_PORT': str(server[1]),
+            'SERVER_PROTOCOL': 'HTTP/%s' % scope.get('http_version', '1.1'),
+            'REMOTE_ADDR': (scope.get('client') or ('', 0))[0],
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': True,
+            'wsgi.run_once': False,
+            'CONTENT_LENGTH': str(len(body))
+        }
+        for name, value in scope['headers']:
+            key = name.decode('latin-1').upper().replace('-', '_')
+            value = value.decode('latin-1')
+            if key == 'CONTENT_TYPE':
+                environ['CONTENT_TYPE'] = value
+            elif key != 'CONTENT_LENGTH':
+                key = 'HTTP_' + key
+                environ[key] = environ[key] + ',' + value if key in environ else value
+        return environ
+
+    async def __call__(self, scope, receive, send):
+        loop = asyncio.get_running_loop()
+        environ = self.environ(scope, await read_body(receive))
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            started['status'] = int(status.split(' ', 1)[0])
+            started['headers'] = [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]
+
+        def first_chunk():
+            iterator = iter(self.wsgi_app(environ, start_response))
+            return iterator, next(iterator, None)
+
+        # the response is streamed chunk by chunk, so exports never sit in memory whole
+        iterator, chunk = await loop.run_in_executor(self.executor, first_chunk)
+        try:
+            await send({'type': 'http.response.start', 'status': started['status'], 'headers': started['headers']})
+            while chunk is not None:
+                if chunk:
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+                chunk = await loop.run_in_executor(self.executor, next, iterator, None)
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            close = getattr(iterator, 'close', None)
+            if close is not None:
+                await loop.run_in_executor(self.executor, close)
+
+
+class TriviaAsgi:
+
+    def __init__(self, flask_app, threads=ASGI_WSGI_THREADS):
+        self.flask_app = flask_app
+        self.bridge = WsgiBridge(flask_app.wsgi_app, threads)
+        self.store = None
+        self._store_lock = None
+        self.limits = admission.build(AsyncConcurrencyLimit)
+        self.routes = [
+            ('POST', re.compile(r'^/quizzes$'), '/quizzes', self.play_trivia),
+            ('POST', re.compile(r'^/quizzes/sessions$'), '/quizzes/sessions', self.create_quiz_session),
+            ('POST', re.compile(r'^/quizzes/sessions/(?P<session_id>[^/]+)/next$'),
+             '/quizzes/sessions/<session_id>/next', self.next_quiz_question),
+            ('POST', re.compile(r'^/answers$'), '/answers', self.record_answers)
+        ]
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            raise ValueError('unsupported ASGI scope: %s' % scope['type'])
+        for method, pattern, rule, handler in self.routes:
+            match = pattern.match(scope['path'])
+            if match and scope['method'] == method:
+                await self.dispatch(scope, receive, send, rule, handler, match.groupdict())
+                return
+        await self.bridge(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await self.open_store()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                if self.store is not None:
+                    await self.store.close()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def open_store(self):
+        if self.store is None:
+            if self._store_lock is None:
+                self._store_lock = asyncio.Lock()
+            async with self._store_lock:
+                if self.store is None:
+                    with self.flask_app.app_context():
+                        engine = db.get_engine(self.flask_app)
+                    self.store = await open_store(engine)
+        return self.store
+
+    async def dispatch(self, scope, receive, send, rule, handler, params):
+        started = time.perf_counter()
+        body = await read_body(receive)
+        headers = [(b'content-type', b'application/json')] + CORS_HEADERS
+        limit = self.limits.get(handler.__name__)
+        shed = await self.admit(scope, handler.__name__, limit)
+        status = 500
+        try:
+            try:
+                if shed is not None:
+                    status, seconds = shed
+                    content = json_dumps(SHED_PAYLOADS[status])
+                    headers.append((b'retry-after', str(seconds).encode()))
+                else:
+                    if change_feed.due():
+                        # the feed reads the database, so it syncs off the event loop
+                        await asyncio.get_running_loop().run_in_executor(self.bridge.executor, self.sync_changes)
+                    # handlers return a payload, or (status, payload) for anything but 200
+                    result = await handler(scope, body, **params)
+                    status, payload = result if isinstance(result, tuple) else (200, result)
+                    content = json_dumps(payload)
+            except HTTPException as e:
+                status = e.code
+                if status in ERROR_PAYLOADS:
+                    content = json_dumps(ERROR_PAYLOADS[status])
+                else:
+                    content = e.get_body()
+                    headers = [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                               for name, value in e.get_headers()] + CORS_HEADERS
+            except Exception:
+                logger.exception('%s failed', handler.__name__)
+                status, content = 500, json_dumps(ERROR_PAYLOADS[500])
+            finally:
+                if shed is None and limit is not None:
+                    limit.release()
+            if isinstance(content, str):
+                content = content.encode('utf-8')
+            await send({'type': 'http.response.start', 'status': status,
+                        'headers': headers + [(b'content-length', str(len(content)).encode())]})
+            await send({'type': 'http.response.body', 'body': content})
+        finally:
+            # counted even when the client went away mid-response
+            http_requests.inc(rule, scope['method'], status)
+            http_latency.observe(rule, scope['method'], value=time.perf_counter() - started)
+
+    def sync_changes(self):
+        with self.flask_app.app_context():
+            change_feed.sync()
+
+    async def admit(self, scope, endpoint, limit):
+        # None once admitted, or the status and Retry-After seconds of a shed request
+        if endpoint not in admission.limits:
+            return None
+        forwarded_for = dict(scope['headers']).get(b'x-forwarded-for', b'').decode('latin-1')
+        client = client_key(scope['client'][0] if scope.get('client') else None, forwarded_for,
+                            admission.trust_proxy)
+        wait = admission.rate_limited(endpoint, client)
+        if wait:
+            return 429, retry_after('rate_limited', wait)
+        if limit is None:
+            return None
+        reason = await limit.acquire()
+        if reason is not None:
+            admission_shed.inc(endpoint, reason)
+            return 503, retry_after(reason)
+        return None
+
+    async def draw(self, function, *args):
+        # the id index holds a threading.Lock, and a draw may scan a whole category, so it runs off the loop
+        return await asyncio.get_running_loop().run_in_executor(None, function, *args)
+
+    async def fetch_question(self, question_id):
+        store = await self.open_store()
+        rows = await store.fetch_questions([question_id])
+        return rows[0] if rows else None
+
+    # same contract as app.play_trivia: any malformed body is a 422
+    async def play_trivia(self, scope, body):
+        try:
+            body = request_json(scope, body)
+            quiz_category = body.get('quiz_category')
+            previous_questions = body.get('previous_questions')
+            if (quiz_category or previous_questions) == None:
+                abort(422)
+            category = ALL_CATEGORIES if quiz_category['type'] == 'click' else quiz_category['id']
+            difficulty = target_difficulty(body.get('difficulty'))
+            excluded = set(previous_questions)
+            if 'count' in body:
+                return await self.prefetch_questions(category, excluded, body['count'], difficulty)
+            new_question = None
+            question_id = await self.draw(question_ids.random_unseen, category, excluded, difficulty)
+            while question_id is not None:
+                new_question = await self.fetch_question(question_id)
+                if new_question is not None:
+                    break
+                excluded.add(question_id)
+                question_id = await self.draw(question_ids.random_unseen, category, excluded, difficulty)
+            return {'success': True, 'question': new_question}
+        except Exception:
+            logger.debug('play_trivia rejected a request', exc_info=True)
+            abort(422)
+
+    async def prefetch_questions(self, category, excluded, count, difficulty=ANY_DIFFICULTY):
+        if not isinstance(count, int) or isinstance(count, bool) or count < 1:
+            abort(422)
+        chosen = await self.draw(question_ids.random_unseen_many, category, excluded,
+                                 min(count, QUIZ_PREFETCH_LIMIT), difficulty)
+        store = await self.open_store()
+        rows = {question['id']: question for question in await store.fetch_questions(chosen)} if chosen else {}
+        questions = [rows[question_id] for question_id in chosen if question_id in rows]
+        return {'success': True, 'question': questions[0] if questions else None, 'questions': questions}
+
+    async def create_quiz_session(self, scope, body):
+        try:
+            category, difficulty, deck_size = parse_session_request(request_json(scope, body) or {})
+        except ValueError:
+            abort(422)
+        deck = await self.draw(deal_deck, category, difficulty, deck_size)
+        session_id, total = quiz_sessions.create(deck, deck_size)
+        return {'success': True, 'session_id': session_id, 'total_questions': total}
+
+    async def next_quiz_question(self, scope, body, session_id):
+        session = quiz_sessions.get(session_id)
+        if session is None:
+            abort(404)
+        new_question = None
+        question_id = session.next_id()
+        while question_id is not None:
+            new_question = await self.fetch_question(question_id)
+            if new_question is not None:
+                break
+            question_id = session.next_id()
+        return {'success': True, 'question': new_question, 'remaining': len(session.deck)}
+
+    async def record_answers(self, scope, body):
+        try:
+            events = parse_answers(request_json(scope, body))
+        except ValueError:
+            abort(422)
+        accepted = answer_pipeline.record(events)
+        if not accepted:
+            return 503, {'success': False, 'error': 503, 'message': 'Too many answers waiting to be written'}
+        return 202, {'success': True, 'accepted': accepted}
+
+"""
+create_asgi_app(test_config)
+    the ASGI application around create_app(test_config).
+"""
+def create_asgi_app(test_config=None):
+    threads = int(os.environ.get('ASGI_WSGI_THREADS', ASGI_WSGI_THREADS))
+    return TriviaAsgi(create_app(test_config), threads)
@@ -0,0 +1,125 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import select
+
+from models import Question
+from serialization import QUESTION_COLUMNS, QUESTION_FIELDS, question_dict
+
+ASYNC_DB_POOL_SIZE = 10
+
+"""
+Async access to the questions table for the ASGI entry point.
+
+Three interchangeable stores answer fetch_questions(ids):
+
+    AsyncpgStore     Postgres through asyncpg's connection pool
+    AiosqliteStore   SQLite through a small pool of aiosqlite connections
+    ThreadedStore    the shared SQLAlchemy engine in a bounded thread
+                     pool, for any other database or missing driver
+
+SQLAlchemy 1.3 has no asyncio support, so the async stores run their own
+SQL, built from the Question table and the serialized field list, and
+return the same dicts as serialization.project_questions().
+"""
+
+QUESTION_SELECT = 'SELECT %s FROM %s' % (', '.join(QUESTION_FIELDS), Question.__tablename__)
+
+
+class AsyncpgStore:
+
+    def __init__(self, url, pool_size=ASYNC_DB_POOL_SIZE):
+        self.url = url
+        self.pool_size = pool_size
+        self.pool = None
+
+    async def open(self):
+        import asyncpg
+        self.pool = await asyncpg.create_pool(
+            user=self.url.username, password=self.url.password, host=self.url.host,
+            port=self.url.port, database=self.url.database, min_size=1, max_size=self.pool_size)
+
+    async def close(self):
+        await self.pool.close()
+
+    async def fetch_questions(self, ids):
+        rows = await self.pool.fetch(QUESTION_SELECT + ' WHERE id = ANY($1::int[])', list(ids))
+        return [question_dict(tuple(row)) for row in rows]
+
+
+class AiosqliteStore:
+
+    def __init__(self, url, pool_size=ASYNC_DB_POOL_SIZE):
+        self.path = url.database
+        self.pool_size = pool_size
+        self.connections = None
+
+    async def open(self):
+        import aiosqlite
+        self.connections = asyncio.Queue()
+        for _ in range(self.pool_size):
+            self.connections.put_nowait(await aiosqlite.connect(self.path))
+
+    async def close(self):
+        while not self.connections.empty():
+            await self.connections.get_nowait().close()
+
+    async def fetch_questions(self, ids):
+        ids = list(ids)
+        connection = await self.connections.get()
+        try:
+            marks = ', '.join('?' * len(ids))
+            async with connection.execute(QUESTION_SELECT + ' WHERE id IN (%s)' % marks, ids) as cursor:
+                rows = await cursor.fetchall()
+        finally:
+            self.connections.put_nowait(connection)
+        return [question_dict(row) for row in rows]
+
+
+class ThreadedStore:
+
+    def __init__(self, engine, pool_size=ASYNC_DB_POOL_SIZE):
+        self.engine = engine
+        self.executor = ThreadPoolExecutor(pool_size, thread_name_prefix='async-db')
+
+    async def open(self):
+        pass
+
+    async def close(self):
+        self.executor.shutdown(wait=False)
+
+    def _fetch(self, ids):
+        with self.engine.connect() as connection:
+            rows = connection.execute(select(list(QUESTION_COLUMNS)).where(Question.id.in_(ids)))
+            return [question_dict(row) for row in rows]
+
+    async def fetch_questions(self, ids):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, self._fetch, list(ids))
+
+"""
+open_store(engine, driver)
+    the store for `engine`'s database: ASYNC_DB_DRIVER (asyncpg,
+    aiosqlite or threads) if set, else the async driver for its dialect
+    when installed, else ThreadedStore.
+"""
+async def open_store(engine, driver=None):
+    driver = driver or os.environ.get('ASYNC_DB_DRIVER')
+    pool_size = int(os.environ.get('ASYNC_DB_POOL_SIZE', ASYNC_DB_POOL_SIZE))
+    url = engine.url
+    if driver is None:
+        driver = {'postgresql': 'asyncpg', 'sqlite': 'aiosqlite'}.get(url.get_backend_name(), 'threads')
+        try:
+            __import__(driver)
+        except ImportError:
+            driver = 'threads'
+    if driver == 'asyncpg':
+        store = AsyncpgStore(url, pool_size)
+    elif driver == 'aiosqlite':
+        store = AiosqliteStore(url, pool_size)
+    elif driver == 'threads':
+        store = ThreadedStore(engine, pool_size)
+    else:
+        raise ValueError('unknown ASYNC_DB_DRIVER: %s' % driver)
+    await store.open()
+    return store
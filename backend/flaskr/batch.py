@@ -0,0 +1,84 @@
+from models import db, Question
+from bulk import validate_row
+from category_cache import category_cache
+from changes import pending_changes
+from dedup import screen, DEDUP_OFF
+
+MAX_BATCH_SIZE = 1000
+QUESTION_COLUMNS = ('id', 'question', 'answer', 'category', 'difficulty')
+
+"""
+Batch create and delete for moderators: every valid item of a request is
+written in one statement inside one transaction, and each item gets its
+own status. Postgres returns the affected rows with RETURNING; other
+databases go through the ORM (create) or a SELECT before the DELETE.
+The rows are registered with the pending ChangeSet so the in-process
+indexes see them once the transaction commits. New questions are
+screened for near-duplicates of existing ones (see dedup.py), but not
+against each other. Items that fail validation get an `invalid` status
+and leave the rest of the batch alone.
+"""
+
+
+def uses_returning():
+    return db.engine.dialect.name == 'postgresql'
+
+
+def create_questions(items, dedup_mode=DEDUP_OFF):
+    categories = category_cache.get()
+    results, rows = [], []
+    for index, item in enumerate(items):
+        try:
+            row = validate_row(item, categories)
+        except (TypeError, ValueError) as e:
+            # a malformed item only fails itself, never the rest of the batch
+            results.append({'index': index, 'status': 'invalid', 'error': str(e)})
+            continue
+        duplicates, rejected = screen(row['question'], row['answer'], dedup_mode)
+        result = {'index': index, 'status': 'duplicate' if rejected else 'created'}
+        if duplicates:
+            result['duplicates'] = [duplicate['id'] for duplicate in duplicates]
+        results.append(result)
+        if not rejected:
+            rows.append((index, row))
+    if not rows:
+        return results, 0
+
+    if uses_returning():
+        table = Question.__table__
+        statement = table.insert().values([row for _, row in rows]) \
+            .returning(*[table.c[column] for column in QUESTION_COLUMNS])
+        created = [dict(zip(QUESTION_COLUMNS, row)) for row in db.session.execute(statement)]
+        pending_changes(db.session).questions_added.extend(created)
+        ids = [question['id'] for question in created]
+    else:
+        questions = [Question(**row) for _, row in rows]
+        db.session.add_all(questions)
+        db.session.flush()
+        ids = [question.id for question in questions]
+    db.session.commit()
+
+    for (index, _), question_id in zip(rows, ids):
+        results[index]['id'] = question_id
+    return results, len(ids)
+
+
+def delete_questions(question_ids):
+    table = Question.__table__
+    condition = table.c.id.in_(question_ids)
+    if uses_returning():
+        statement = table.delete().where(condition) \
+            .returning(*[table.c[column] for column in QUESTION_COLUMNS])
+        deleted = [dict(zip(QUESTION_COLUMNS, row)) for row in db.session.execute(statement)]
+    else:
+        selection = db.session.execute(
+            table.select().with_only_columns([table.c[column] for column in QUESTION_COLUMNS]).where(condition))
+        deleted = [dict(zip(QUESTION_COLUMNS, row)) for row in selection]
+        db.session.execute(table.delete().where(condition))
+    pending_changes(db.session).questions_removed.extend(deleted)
+    db.session.commit()
+
+    deleted_ids = {question['id'] for question in deleted}
+    results = [{'id': question_id, 'status': 'deleted' if question_id in deleted_ids else 'not_found'}
+               for question_id in question_ids]
+    return results, len(deleted_ids)
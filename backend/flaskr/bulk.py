@@ -0,0 +1,198 @@
+import csv
+import io
+import json
+import logging
+import time
+
+from models import db, Question
+from category_cache import category_cache
+from changes import pending_changes, reload_indexes
+from dedup import screen, DEDUP_OFF, DEDUP_REJECT
+
+IMPORT_BATCH_SIZE = 5000
+EXPORT_BATCH_SIZE = 5000
+IMPORT_COLUMNS = ('question', 'answer', 'category', 'difficulty')
+EXPORT_COLUMNS = ('id',) + IMPORT_COLUMNS
+MAX_REPORTED_ERRORS = 100
+
+logger = logging.getLogger(__name__)
+
+"""
+Streaming bulk import and export of questions as NDJSON or CSV.
+
+Imports validate row by row and write one multi-row INSERT (COPY on
+Postgres with psycopg2) and one commit per batch. Exports page through
+a server-side cursor. Neither side holds more than one batch in memory.
+
+With DEDUP_REJECT, imported rows are screened for near-duplicates of
+the questions that existed before the import (see dedup.py). The index
+only takes in the new rows once the import is over, so rows of one
+import are not compared with each other. Other modes import without
+screening: flagging would build the index and query candidates for
+every row just to report a count.
+"""
+
+
+def guess_format(filename, default='ndjson'):
+    if filename and filename.lower().endswith('.csv'):
+        return 'csv'
+    if filename and filename.lower().endswith(('.ndjson', '.jsonl')):
+        return 'ndjson'
+    return default
+
+
+def read_rows(stream, fmt):
+    if fmt == 'csv':
+        for row in csv.DictReader(stream):
+            yield row
+    elif fmt == 'ndjson':
+        for line in stream:
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError as e:
+                # handed on so the importer can reject this line and carry on
+                yield e
+    else:
+        raise ValueError('unsupported format: %s' % fmt)
+
+
+def text_field(row, name):
+    value = row.get(name)
+    if value is None:
+        return ''
+    if not isinstance(value, str):
+        raise ValueError('%s must be a string' % name)
+    return value.strip()
+
+
+def integer_field(row, name):
+    # CSV cells are strings, JSON may carry either; floats and booleans are refused
+    value = row.get(name)
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise ValueError('%s must be an integer' % name)
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError('%s must be an integer' % name)
+
+
+def validate_row(row, categories):
+    if not isinstance(row, dict):
+        raise ValueError('row is not an object')
+    question = text_field(row, 'question')
+    answer = text_field(row, 'answer')
+    if not question or not answer:
+        raise ValueError('question and answer are required')
+    category = integer_field(row, 'category')
+    difficulty = integer_field(row, 'difficulty')
+    if category not in categories:
+        raise ValueError('unknown category %s' % category)
+    return {'question': question, 'answer': answer, 'category': category, 'difficulty': difficulty}
+
+
+def copy_batch(batch):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in batch:
+        writer.writerow([row[column] for column in IMPORT_COLUMNS])
+    buffer.seek(0)
+    cursor = db.session.connection().connection.cursor()
+    cursor.copy_expert('COPY questions (%s) FROM STDIN WITH CSV' % ', '.join(IMPORT_COLUMNS), buffer)
+
+
+def insert_batch(batch):
+    if db.engine.dialect.name == 'postgresql' and db.engine.dialect.driver == 'psycopg2':
+        copy_batch(batch)
+    else:
+        db.session.execute(Question.__table__.insert(), batch)
+    # the rows have no snapshots; other processes reload instead
+    pending_changes(db.session).reload = True
+    db.session.commit()
+
+"""
+import_questions(stream, fmt, batch_size, dedup_mode)
+    validates and inserts every row of `stream`. Invalid rows, and with
+    DEDUP_REJECT near-duplicates, are skipped and reported by row
+    number; valid rows are committed batch by batch, then the
+    in-process indexes are rebuilt once, also when the import fails
+    after some batches were committed. Returns the import stats.
+"""
+def import_questions(stream, fmt='ndjson', batch_size=IMPORT_BATCH_SIZE, dedup_mode=DEDUP_OFF):
+    started = time.perf_counter()
+    categories = category_cache.get()
+    inserted, rejected, screened, errors = 0, 0, 0, []
+    batch = []
+    try:
+        for number, row in enumerate(read_rows(stream, fmt), 1):
+            try:
+                if isinstance(row, Exception):
+                    raise row
+                row = validate_row(row, categories)
+                if dedup_mode == DEDUP_REJECT:
+                    screened += 1
+                    duplicates, refused = screen(row['question'], row['answer'], dedup_mode)
+                    if refused:
+                        raise ValueError('duplicate of question %s' % ', '.join(str(duplicate['id']) for duplicate in duplicates))
+            except ValueError as e:
+                rejected += 1
+                if len(errors) < MAX_REPORTED_ERRORS:
+                    errors.append({'row': number, 'error': str(e)})
+                continue
+            batch.append(row)
+            if len(batch) >= batch_size:
+                insert_batch(batch)
+                inserted += len(batch)
+                batch = []
+        if batch:
+            insert_batch(batch)
+            inserted += len(batch)
+    finally:
+        if inserted:
+            reload_indexes()
+
+    seconds = time.perf_counter() - started
+    stats = {
+        'inserted': inserted,
+        'rejected': rejected,
+        'screened': screened,
+        'errors': errors,
+        'seconds': round(seconds, 3),
+        'rows_per_second': round(inserted / seconds, 1) if seconds else None
+    }
+    logger.info('imported %d questions (%d rejected) at %s rows/s', inserted, rejected, stats['rows_per_second'])
+    return stats
+
+"""
+export_questions(fmt, batch_size)
+    yields the questions table as NDJSON lines or CSV text in id order,
+    reading through a server-side cursor `batch_size` rows at a time.
+"""
+def export_questions(fmt='ndjson', batch_size=EXPORT_BATCH_SIZE):
+    if fmt not in ('ndjson', 'csv'):
+        raise ValueError('unsupported format: %s' % fmt)
+    started = time.perf_counter()
+    columns = [getattr(Question, column) for column in EXPORT_COLUMNS]
+    rows = db.session.query(*columns).order_by(Question.id) \
+        .execution_options(stream_results=True).yield_per(batch_size)
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if fmt == 'csv':
+        writer.writerow(EXPORT_COLUMNS)
+    exported = 0
+    for row in rows:
+        if fmt == 'csv':
+            writer.writerow(row)
+        else:
+            buffer.write(json.dumps(dict(zip(EXPORT_COLUMNS, row))) + '\n')
+        exported += 1
+        if exported % batch_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+    seconds = time.perf_counter() - started
+    logger.info('exported %d questions at %.1f rows/s', exported, exported / seconds if seconds else 0)
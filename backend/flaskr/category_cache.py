@@ -0,0 +1,49 @@
+import threading
+import time
+
+from models import db, Category
+from changes import on_commit
+
+CATEGORY_CACHE_TTL = 300
+
+"""
+CategoryCache
+    process-local id -> type map of all categories, shared by every
+    endpoint that needs category names. Entries live for `ttl` seconds
+    and are dropped as soon as a transaction that wrote a Category
+    commits, so other workers pick up changes within one TTL at most.
+"""
+class CategoryCache:
+
+    def __init__(self, ttl=CATEGORY_CACHE_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._categories = None
+        self._loaded_at = 0
+
+    def get(self):
+        categories = self._categories
+        if categories is not None and time.monotonic() - self._loaded_at < self.ttl:
+            return categories
+        with self._lock:
+            if self._categories is None or time.monotonic() - self._loaded_at >= self.ttl:
+                rows = db.session.query(Category.id, Category.type).all()
+                self._categories = {category_id: category_type for category_id, category_type in rows}
+                self._loaded_at = time.monotonic()
+            return self._categories
+
+    def type_of(self, category_id):
+        return self.get().get(int(category_id))
+
+    def invalidate(self):
+        with self._lock:
+            self._categories = None
+
+
+category_cache = CategoryCache()
+
+
+@on_commit
+def invalidate_category_cache(changes):
+    if changes.categories_changed:
+        category_cache.invalidate()
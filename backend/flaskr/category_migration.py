@@ -0,0 +1,208 @@
+import logging
+import time
+
+from sqlalchemy import inspect, text
+
+from models import db
+from changes import pending_changes, reload_indexes
+
+MIGRATION_BATCH_SIZE = 5000
+MIGRATION_PAUSE = 0.05
+MAX_REPORTED_ROWS = 20
+LOCK_TIMEOUT = '5s'
+
+logger = logging.getLogger(__name__)
+
+"""
+Online migration of questions.category from a string column to an
+integer foreign key on categories.id, for databases created before the
+column was typed. Every step can be re-run; an interrupted migration
+resumes where it stopped.
+
+1. add the integer column `category_id` next to `category`, plus a
+   trigger that fills it for every row written from then on
+2. backfill the existing rows by id range, one short transaction per
+   batch, pausing between batches to leave room for live traffic
+3. refuse to go on while any row has a category that is not a known id
+4. add the foreign key (NOT VALID, then VALIDATE on Postgres, so writes
+   are not blocked while it is checked) and build the (category, id)
+   index, CONCURRENTLY on Postgres
+5. swap the columns in one short transaction: `category` becomes
+   `category_old`, `category_id` becomes `category`
+6. with drop_old, drop `category_old`
+
+Old code keeps working after the swap, since both databases convert the
+string ids it writes into the integer column.
+"""
+
+# the string column cast to an integer, NULL unless it holds only digits
+CATEGORY_CAST = {
+    'postgresql': "CASE WHEN trim({column}) ~ '^[0-9]+$' THEN trim({column})::integer END",
+    'sqlite': "CASE WHEN trim({column}) <> '' AND trim({column}) NOT GLOB '*[^0-9]*' "
+              "THEN CAST(trim({column}) AS INTEGER) END"
+}
+
+SYNC_TRIGGER = {
+    'postgresql': [
+        "CREATE OR REPLACE FUNCTION questions_sync_category_id() RETURNS trigger AS $$ "
+        "BEGIN NEW.category_id := %s; RETURN NEW; END $$ LANGUAGE plpgsql"
+        % CATEGORY_CAST['postgresql'].format(column='NEW.category'),
+        "DROP TRIGGER IF EXISTS questions_sync_category_id ON questions",
+        "CREATE TRIGGER questions_sync_category_id BEFORE INSERT OR UPDATE OF category ON questions "
+        "FOR EACH ROW EXECUTE PROCEDURE questions_sync_category_id()"
+    ],
+    'sqlite': [
+        "CREATE TRIGGER IF NOT EXISTS questions_sync_category_id_insert AFTER INSERT ON questions "
+        "BEGIN UPDATE questions SET category_id = %s WHERE id = NEW.id; END"
+        % CATEGORY_CAST['sqlite'].format(column='NEW.category'),
+        "CREATE TRIGGER IF NOT EXISTS questions_sync_category_id_update AFTER UPDATE OF category ON questions "
+        "BEGIN UPDATE questions SET category_id = %s WHERE id = NEW.id; END"
+        % CATEGORY_CAST['sqlite'].format(column='NEW.category')
+    ]
+}
+
+DROP_TRIGGER = {
+    'postgresql': [
+        "DROP TRIGGER IF EXISTS questions_sync_category_id ON questions",
+        "DROP FUNCTION IF EXISTS questions_sync_category_id()"
+    ],
+    'sqlite': [
+        "DROP TRIGGER IF EXISTS questions_sync_category_id_insert",
+        "DROP TRIGGER IF EXISTS questions_sync_category_id_update"
+    ]
+}
+
+
+def question_columns(engine):
+    return {column['name']: column for column in inspect(engine).get_columns('questions')}
+
+
+def is_migrated(engine):
+    columns = question_columns(engine)
+    return 'category_id' not in columns and columns['category']['type'].python_type is int
+
+
+def add_column(engine, dialect):
+    with engine.begin() as connection:
+        if 'category_id' not in question_columns(connection):
+            references = ' REFERENCES categories (id)' if dialect == 'sqlite' else ''
+            connection.execute(text('ALTER TABLE questions ADD COLUMN category_id INTEGER' + references))
+        for statement in SYNC_TRIGGER[dialect]:
+            connection.execute(text(statement))
+
+
+def backfill(engine, dialect, batch_size, pause, echo):
+    statement = text('UPDATE questions SET category_id = %s WHERE id > :low AND id <= :high '
+                     'AND category_id IS NULL AND category IS NOT NULL'
+                     % CATEGORY_CAST[dialect].format(column='category'))
+    with engine.connect() as connection:
+        low, high = connection.execute(text('SELECT min(id) - 1, max(id) FROM questions')).fetchone()
+    if high is None:
+        return 0
+    updated = 0
+    while low < high:
+        with engine.begin() as connection:
+            updated += connection.execute(statement, low=low, high=low + batch_size).rowcount
+        low += batch_size
+        echo('backfilled up to id %d (%d rows)' % (min(low, high), updated))
+        if pause:
+            time.sleep(pause)
+    return updated
+
+
+def invalid_rows(engine):
+    with engine.connect() as connection:
+        return connection.execute(text(
+            'SELECT id, category FROM questions WHERE category IS NOT NULL AND (category_id IS NULL '
+            'OR category_id NOT IN (SELECT id FROM categories)) ORDER BY id LIMIT %d' % MAX_REPORTED_ROWS)).fetchall()
+
+
+def add_constraints(engine, dialect):
+    if dialect == 'postgresql':
+        with engine.begin() as connection:
+            exists = connection.execute(text(
+                "SELECT 1 FROM pg_constraint WHERE conname = 'fk_questions_category'")).scalar()
+            if not exists:
+                connection.execute(text('ALTER TABLE questions ADD CONSTRAINT fk_questions_category '
+                                        'FOREIGN KEY (category_id) REFERENCES categories (id) NOT VALID'))
+        with engine.begin() as connection:
+            connection.execute(text('ALTER TABLE questions VALIDATE CONSTRAINT fk_questions_category'))
+        with engine.connect() as connection:
+            # CONCURRENTLY cannot run inside a transaction
+            autocommit = connection.execution_options(isolation_level='AUTOCOMMIT')
+            build_index_concurrently(autocommit)
+    else:
+        with engine.begin() as connection:
+            connection.execute(text('CREATE INDEX IF NOT EXISTS ix_questions_category_id '
+                                    'ON questions (category_id, id)'))
+
+
+def index_valid(connection):
+    # None when the index does not exist
+    return connection.execute(text(
+        "SELECT i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+        "WHERE c.relname = 'ix_questions_category_id'")).scalar()
+
+"""
+build_index_concurrently(connection)
+    builds ix_questions_category_id without blocking writes. A build that
+    failed or was interrupted leaves an INVALID index behind, which IF NOT
+    EXISTS would keep; it is dropped and built again. Raises
+    RuntimeError if the new index is still invalid.
+"""
+def build_index_concurrently(connection):
+    if index_valid(connection) is False:
+        connection.execute(text('DROP INDEX CONCURRENTLY IF EXISTS ix_questions_category_id'))
+    connection.execute(text('CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_questions_category_id '
+                            'ON questions (category_id, id)'))
+    if not index_valid(connection):
+        raise RuntimeError('building ix_questions_category_id failed, run the migration again')
+
+
+def swap_columns(engine, dialect):
+    with engine.begin() as connection:
+        if dialect == 'postgresql':
+            connection.execute(text("SET LOCAL lock_timeout = '%s'" % LOCK_TIMEOUT))
+        for statement in DROP_TRIGGER[dialect]:
+            connection.execute(text(statement))
+        connection.execute(text('ALTER TABLE questions RENAME COLUMN category TO category_old'))
+        connection.execute(text('ALTER TABLE questions RENAME COLUMN category_id TO category'))
+
+
+def drop_old_column(engine):
+    with engine.begin() as connection:
+        if 'category_old' in question_columns(connection):
+            connection.execute(text('ALTER TABLE questions DROP COLUMN category_old'))
+
+"""
+migrate_category(batch_size, pause, drop_old, echo)
+    runs the steps above against the primary database, reporting
+    progress through `echo`. Raises RuntimeError, before anything is
+    swapped, if rows reference categories that do not exist.
+"""
+def migrate_category(batch_size=MIGRATION_BATCH_SIZE, pause=MIGRATION_PAUSE, drop_old=False, echo=logger.info):
+    engine = db.engine
+    dialect = engine.dialect.name
+    if dialect not in CATEGORY_CAST:
+        raise RuntimeError('no category migration for %s' % dialect)
+
+    if not is_migrated(engine):
+        add_column(engine, dialect)
+        echo('backfilling category_id in batches of %d' % batch_size)
+        updated = backfill(engine, dialect, batch_size, pause, echo)
+        invalid = invalid_rows(engine)
+        if invalid:
+            raise RuntimeError('questions with unknown categories, fix them and run again: %s'
+                               % ', '.join('%s (%r)' % (question_id, category) for question_id, category in invalid))
+        add_constraints(engine, dialect)
+        swap_columns(engine, dialect)
+        echo('questions.category is now an integer foreign key (%d rows converted)' % updated)
+        # an empty commit through the change feed makes the other workers rebuild too
+        pending_changes(db.session).reload = True
+        db.session.commit()
+        reload_indexes()
+    else:
+        echo('questions.category is already an integer foreign key')
+    if drop_old:
+        drop_old_column(engine)
+        echo('dropped questions.category_old')
@@ -0,0 +1,297 @@
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+
+from sqlalchemy import event, inspect, select
+from sqlalchemy.exc import IntegrityError
+
+from models import db, Question, Category, ChangeVersion, ChangeLogEntry
+from instrumentation import registry, Counter
+
+CHANGE_SYNC_INTERVAL = 1.0
+# entries kept in change_log; a process further behind than this reloads
+CHANGE_LOG_KEEP = 10000
+CHANGE_LOG_PRUNE_EVERY = 100
+# entries replayed in one sync; past that a reload is cheaper
+CHANGE_REPLAY_LIMIT = 1000
+RELOAD_ATTEMPTS = 3
+
+logger = logging.getLogger(__name__)
+
+"""
+Commit notifications for the in-process indexes.
+
+Every flush records the Question rows it inserted or removed (as
+format() snapshots) into a ChangeSet kept on the session. Once the
+transaction commits, each listener registered with @on_commit receives
+that ChangeSet; a rollback discards it. Updates are reported as the old
+row removed plus the new row added.
+
+Bulk statements that bypass the unit of work cannot produce snapshots;
+they set the ChangeSet's `reload` flag and, after committing, callers
+run reload_indexes() so every reloader registered with @on_reload
+rebuilds its state from the database.
+
+Other processes see the same changes through the change feed: while
+committing, every transaction with a non-empty ChangeSet bumps the
+change_version row and writes its ChangeSet to change_log under the new
+version, in the same transaction. Before serving, each process checks
+change_version at most every CHANGE_SYNC_INTERVAL seconds and replays
+the entries written by other processes through the same listeners, or
+reloads when it is too far behind. A write is therefore visible to
+every worker within about one interval.
+"""
+_listeners = []
+_reloaders = []
+
+change_replays = registry.register(Counter(
+    'trivia_change_replays_total', 'Changes of other processes applied from the change log, by kind.', ('kind',)))
+
+
+class ChangeSet:
+
+    def __init__(self):
+        self.questions_added = []
+        self.questions_removed = []
+        self.categories_changed = False
+        self.reload = False
+        # change_version of the transaction, set while it commits
+        self.version = None
+
+    def __bool__(self):
+        return bool(self.questions_added or self.questions_removed or self.categories_changed or self.reload)
+
+    def payload(self):
+        return json.dumps({
+            'questions_added': self.questions_added,
+            'questions_removed': self.questions_removed,
+            'categories_changed': self.categories_changed,
+            'reload': self.reload
+        })
+
+    @classmethod
+    def from_payload(cls, payload, version):
+        changes = cls()
+        vars(changes).update(json.loads(payload))
+        changes.version = version
+        return changes
+
+
+def on_commit(listener):
+    _listeners.append(listener)
+    return listener
+
+
+def on_reload(reloader):
+    _reloaders.append(reloader)
+    return reloader
+
+
+def publish(changes):
+    for listener in _listeners:
+        listener(changes)
+
+
+def reload_indexes():
+    for reloader in _reloaders:
+        reloader()
+
+
+def pending_changes(session):
+    return session.info.setdefault('pending_changes', ChangeSet())
+
+
+def previous_snapshot(question):
+    state = inspect(question)
+    snapshot = question.format()
+    for key in snapshot:
+        history = state.attrs[key].history
+        if history.deleted:
+            snapshot[key] = history.deleted[0]
+    return snapshot
+
+"""
+ChangeFeed
+    this process's position in the shared change log: `applied` is the
+    highest version up to which every change is reflected in memory.
+    It starts once the indexes are built (start) and is kept current by
+    this process's own commits and by sync().
+"""
+class ChangeFeed:
+
+    def __init__(self):
+        self.interval = CHANGE_SYNC_INTERVAL
+        self.applied = None
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._next_sync = 0.0
+        self._token = secrets.token_hex(6)
+
+    def origin(self):
+        # unique per process, including workers forked after import
+        return '%s-%d' % (self._token, os.getpid())
+
+    def head(self):
+        with db.engine.connect() as connection:
+            return connection.scalar(select([ChangeVersion.version]).where(ChangeVersion.id == 1)) or 0
+
+    def write(self, session, changes):
+        table = ChangeVersion.__table__
+        bumped = session.execute(table.update().where(table.c.id == 1).values(version=table.c.version + 1))
+        if not bumped.rowcount:
+            session.execute(table.insert().values(id=1, version=1))
+        version = session.execute(select([table.c.version]).where(table.c.id == 1)).scalar()
+        log = ChangeLogEntry.__table__
+        session.execute(log.insert().values(version=version, origin=self.origin(), payload=changes.payload(),
+                                            created_at=time.time()))
+        if version % CHANGE_LOG_PRUNE_EVERY == 0:
+            session.execute(log.delete().where(log.c.version <= version - CHANGE_LOG_KEEP))
+        changes.version = version
+
+    def committed(self, version):
+        with self._lock:
+            if self.applied is not None and version == self.applied + 1:
+                self.applied = version
+
+    """
+    start(since)
+        begins following the log from version `since`, read before the
+        indexes were built. If another transaction committed while they
+        were being built, they are rebuilt until the version holds still,
+        so no change is either missed or applied twice.
+    """
+    def start(self, since):
+        self.interval = float(os.environ.get('CHANGE_SYNC_INTERVAL', CHANGE_SYNC_INTERVAL))
+        try:
+            with db.engine.connect() as connection:
+                connection.execute(ChangeVersion.__table__.insert().values(id=1, version=0))
+        except IntegrityError:
+            pass
+        for _ in range(RELOAD_ATTEMPTS):
+            head = self.head()
+            if head == since:
+                break
+            since = head
+            reload_indexes()
+        else:
+            logger.warning("indexes rebuilt while writes kept committing", extra={'version': since})
+        with self._lock:
+            self.applied = since
+        self._next_sync = time.monotonic() + self.interval
+
+    def reload(self):
+        since = self.head()
+        reload_indexes()
+        self.start(since)
+        change_replays.inc('reload')
+
+    """
+    sync()
+        applies the changes other processes committed since the last
+        sync, if CHANGE_SYNC_INTERVAL has passed. Only one thread syncs
+        at a time; the others carry on with what is in memory.
+    """
+    def due(self):
+        return self.applied is not None and time.monotonic() >= self._next_sync
+
+    def sync(self):
+        if not self.due():
+            return
+        if not self._sync_lock.acquire(blocking=False):
+            return
+        try:
+            self._next_sync = time.monotonic() + self.interval
+            head = self.head()
+            since = self.applied
+            if head <= since:
+                return
+            if head - since > CHANGE_REPLAY_LIMIT:
+                self.reload()
+                return
+            log = ChangeLogEntry.__table__
+            with db.engine.connect() as connection:
+                rows = connection.execute(
+                    select([log.c.version, log.c.origin, log.c.payload])
+                    .where(log.c.version > since).where(log.c.version <= head).order_by(log.c.version)).fetchall()
+            if [row.version for row in rows] != list(range(since + 1, head + 1)):
+                # pruned before this process got to it
+                self.reload()
+                return
+            origin = self.origin()
+            for version, written_by, payload in rows:
+                if version <= self.applied:
+                    continue
+                if written_by != origin:
+                    changes = ChangeSet.from_payload(payload, version)
+                    if changes.reload:
+                        self.reload()
+                        return
+                    publish(changes)
+                    change_replays.inc('changes')
+                with self._lock:
+                    self.applied = max(self.applied, version)
+        finally:
+            self._sync_lock.release()
+
+
+change_feed = ChangeFeed()
+
+"""
+init_change_feed(app)
+    syncs the change feed before every request. Register it before
+    any hook that reads the in-memory state; it does nothing until
+    change_feed.start() has run.
+"""
+def init_change_feed(app):
+
+    @app.before_request
+    def sync_changes():
+        change_feed.sync()
+
+
+@event.listens_for(db.session, 'after_flush')
+def collect_changes(session, flush_context):
+    changes = pending_changes(session)
+    for obj in session.new:
+        if isinstance(obj, Question):
+            changes.questions_added.append(obj.format())
+        elif isinstance(obj, Category):
+            changes.categories_changed = True
+    for obj in session.deleted:
+        if isinstance(obj, Question):
+            changes.questions_removed.append(obj.format())
+        elif isinstance(obj, Category):
+            changes.categories_changed = True
+    for obj in session.dirty:
+        if not session.is_modified(obj):
+            continue
+        if isinstance(obj, Question):
+            changes.questions_removed.append(previous_snapshot(obj))
+            changes.questions_added.append(obj.format())
+        elif isinstance(obj, Category):
+            changes.categories_changed = True
+
+
+@event.listens_for(db.session, 'before_commit')
+def log_changes(session):
+    # flushed first so the logged ChangeSet is complete
+    session.flush()
+    changes = session.info.get('pending_changes')
+    if changes:
+        change_feed.write(session, changes)
+
+
+@event.listens_for(db.session, 'after_commit')
+def publish_changes(session):
+    changes = session.info.pop('pending_changes', None)
+    if changes:
+        publish(changes)
+        change_feed.committed(changes.version)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def discard_changes(session):
+    session.info.pop('pending_changes', None)
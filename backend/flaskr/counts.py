@@ -0,0 +1,65 @@
+import threading
+from collections import Counter
+
+from sqlalchemy import func
+
+from models import db, Question
+from changes import on_commit, on_reload
+
+"""
+QuestionCounts
+    process-local question totals, global and per category.
+    Built from one GROUP BY query and afterwards kept current by the
+    commit listener below, so only committed changes are counted;
+    changes committed by other processes arrive through the change
+    feed (see changes.py). Category keys are normalized with str(), so
+    the integer column and ids sent as strings map to the same entry.
+"""
+class QuestionCounts:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_category = Counter()
+        self._total = 0
+
+    def rebuild(self):
+        rows = db.session.query(Question.category, func.count(Question.id)) \
+            .group_by(Question.category).all()
+        by_category = Counter({str(category): count for category, count in rows})
+        with self._lock:
+            self._by_category = by_category
+            self._total = sum(by_category.values())
+
+    def apply(self, deltas):
+        with self._lock:
+            for category, delta in deltas.items():
+                if not delta:
+                    continue
+                self._by_category[category] += delta
+                self._total += delta
+                if self._by_category[category] <= 0:
+                    del self._by_category[category]
+
+    def total(self):
+        return self._total
+
+    def count(self, category):
+        return self._by_category.get(str(category), 0)
+
+    def by_category(self):
+        with self._lock:
+            return dict(self._by_category)
+
+
+question_counts = QuestionCounts()
+on_reload(question_counts.rebuild)
+
+
+@on_commit
+def apply_question_changes(changes):
+    deltas = Counter()
+    for question in changes.questions_added:
+        deltas[str(question['category'])] += 1
+    for question in changes.questions_removed:
+        deltas[str(question['category'])] -= 1
+    question_counts.apply(deltas)
@@ -0,0 +1,387 @@
+import heapq
+import operator
+import os
+import random
+import threading
+from array import array
+from collections import Counter as Tally
+
+from models import db, Question
+from changes import on_commit, on_reload
+from search import tokenize
+from instrumentation import registry, Counter, Gauge
+
+DEDUP_OFF = 'off'
+DEDUP_FLAG = 'flag'
+DEDUP_REJECT = 'reject'
+DEDUP_MODES = (DEDUP_OFF, DEDUP_FLAG, DEDUP_REJECT)
+DEDUP_THRESHOLD = 0.8
+DEDUP_SHINGLE_SIZE = 4
+DEDUP_BANDS = 12
+DEDUP_ROWS = 5
+DEDUP_MAX_CANDIDATES = 64
+DEDUP_BATCH_SIZE = 10000
+# representatives compared per LSH bucket by the clustering job, so a huge bucket stays linear
+CLUSTER_BUCKET_REPRESENTATIVES = 8
+MASK64 = (1 << 64) - 1
+MASK32 = (1 << 32) - 1
+
+"""
+Near-duplicate detection for questions with MinHash and LSH.
+
+A question is compared through its shingles: the overlapping
+DEDUP_SHINGLE_SIZE-character windows of its normalized question and
+answer text. Two questions are near-duplicates when the Jaccard
+similarity of their shingle sets reaches DEDUP_THRESHOLD.
+
+Every question gets a MinHash signature of DEDUP_BANDS * DEDUP_ROWS
+values. It is computed by one-permutation hashing: each shingle is
+hashed once and falls into one of the signature's bins, and each bin
+keeps its smallest hash. That costs one hash per shingle rather than
+one per shingle and value. The signature is cut into bands, and a question lands in one
+bucket per band. Questions that share any bucket are candidates, so a
+lookup is a dict lookup per band rather than a scan. With 12 bands
+of 5 rows, pairs at 0.8 similarity share a bucket 99% of the time and
+pairs at 0.3 only 3% of the time. Candidates are then checked exactly.
+
+Shingles are hashed with Python's per-process salted str hash, so
+signatures are only meaningful inside one process and are never stored.
+"""
+
+SIGNATURE_SIZE = DEDUP_BANDS * DEDUP_ROWS
+# for each bin, the fixed order in which an empty bin borrows from the others
+_probe_source = random.Random(20240611)
+PROBE_ORDER = tuple(tuple(_probe_source.sample([other for other in range(SIGNATURE_SIZE) if other != position],
+                                               SIGNATURE_SIZE - 1))
+                    for position in range(SIGNATURE_SIZE))
+
+duplicates_found = registry.register(Counter(
+    'trivia_duplicate_questions_total', 'Inserts that matched an existing question.', ('action',)))
+
+
+def normalize(question, answer):
+    return '%s | %s' % (' '.join(tokenize(question)), ' '.join(tokenize(answer)))
+
+
+def shingles(question, answer):
+    text = normalize(question, answer)
+    if len(text) <= DEDUP_SHINGLE_SIZE:
+        return {text}
+    return {text[start:start + DEDUP_SHINGLE_SIZE] for start in range(len(text) - DEDUP_SHINGLE_SIZE + 1)}
+
+
+def jaccard(first, second):
+    if not first and not second:
+        return 1.0
+    return len(first & second) / len(first | second)
+
+"""
+signature(shingle_set)
+    the MinHash signature of a shingle set, by one-permutation hashing.
+    A short question leaves some bins empty. Each empty bin takes the
+    value of the first filled bin in its PROBE_ORDER, offset by its own
+    position. Two questions then fill the same bin the same way, which
+    keeps the equal-value rate an estimate of their Jaccard similarity.
+"""
+def signature(shingle_set):
+    values = [None] * SIGNATURE_SIZE
+    for hashed in map(MASK64.__and__, map(hash, shingle_set)):
+        position = hashed % SIGNATURE_SIZE
+        if values[position] is None or hashed < values[position]:
+            values[position] = hashed
+    filled = list(values)
+    for position, value in enumerate(filled):
+        if value is None:
+            for other in PROBE_ORDER[position]:
+                if filled[other] is not None:
+                    values[position] = filled[other] + position
+                    break
+    return values
+
+
+def band_keys(values):
+    # one 32-bit bucket per band
+    return [hash(tuple(values[band * DEDUP_ROWS:(band + 1) * DEDUP_ROWS])) & MASK32 for band in range(DEDUP_BANDS)]
+
+
+# a bucket holds a bare id until a second question lands in it, which saves a set per question and band
+def bucket_add(band, key, question_id):
+    members = band.get(key)
+    if members is None:
+        band[key] = question_id
+    elif isinstance(members, set):
+        members.add(question_id)
+    elif members != question_id:
+        band[key] = {members, question_id}
+
+
+def bucket_discard(band, key, question_id):
+    members = band.get(key)
+    if members == question_id:
+        del band[key]
+    elif isinstance(members, set):
+        members.discard(question_id)
+        if len(members) == 1:
+            band[key] = members.pop()
+
+
+def bucket_members(band, key):
+    members = band.get(key)
+    if members is None:
+        return ()
+    return members if isinstance(members, set) else (members,)
+
+"""
+DuplicateIndex
+    in-process LSH index over every question. Each band is a dict from
+    bucket to the ids in it (see bucket_add), about 1 KB per question
+    over all bands. A lookup is one dict lookup per band, and an insert
+    or delete touches only the question's own buckets.
+
+    The index is built by the first lookup (ensure_ready), not at
+    startup, so workers that never screen a question never pay for it.
+    Commits published while it is being built are held back and
+    applied once it is in place; adds and removes are idempotent, so a
+    change the build already saw is not applied twice.
+"""
+class DuplicateIndex:
+
+    def __init__(self, threshold=DEDUP_THRESHOLD):
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self.ready = False
+        self._bands = [{} for _ in range(DEDUP_BANDS)]
+        self._size = 0
+        self._backlog = None
+
+    def __len__(self):
+        return self._size
+
+    def clear(self):
+        # forget everything; the next lookup builds the index again
+        with self._build_lock, self._lock:
+            self._bands = [{} for _ in range(DEDUP_BANDS)]
+            self._size = 0
+            self.ready = False
+
+    def ensure_ready(self):
+        if self.ready:
+            return
+        with self._build_lock:
+            if not self.ready:
+                self.rebuild()
+
+    def reload(self):
+        # rebuilds an index in use; a build already running is waited for, never overlapped
+        with self._build_lock:
+            if self.ready:
+                self.rebuild()
+
+    # the app only builds through ensure_ready() and reload(), whose _build_lock keeps one build owning the backlog
+    def rebuild(self, batch_size=DEDUP_BATCH_SIZE):
+        with self._lock:
+            self._backlog = []
+        try:
+            bands = [{} for _ in range(DEDUP_BANDS)]
+            size = 0
+            rows = db.session.query(Question.id, Question.question, Question.answer) \
+                .order_by(Question.id).yield_per(batch_size)
+            for question_id, question, answer in rows:
+                for band, key in zip(bands, band_keys(signature(shingles(question, answer)))):
+                    bucket_add(band, key, question_id)
+                size += 1
+        except Exception:
+            with self._lock:
+                self._backlog = None
+            raise
+        with self._lock:
+            self._bands, self._size = bands, size
+            backlog, self._backlog = self._backlog, None
+            for changes in backlog:
+                self._apply(changes)
+            self.ready = True
+
+    def update(self, changes):
+        with self._lock:
+            if self._backlog is not None:
+                self._backlog.append(changes)
+            elif self.ready:
+                self._apply(changes)
+
+    def add(self, question):
+        with self._lock:
+            self._add(question)
+
+    def remove(self, question):
+        with self._lock:
+            self._remove(question)
+
+    def _apply(self, changes):
+        for question in changes.questions_removed:
+            self._remove(question)
+        for question in changes.questions_added:
+            self._add(question)
+
+    def _add(self, question):
+        keys = band_keys(signature(shingles(question['question'], question['answer'])))
+        if question['id'] not in bucket_members(self._bands[0], keys[0]):
+            self._size += 1
+        for band, key in zip(self._bands, keys):
+            bucket_add(band, key, question['id'])
+
+    def _remove(self, question):
+        keys = band_keys(signature(shingles(question['question'], question['answer'])))
+        if question['id'] in bucket_members(self._bands[0], keys[0]):
+            self._size -= 1
+        for band, key in zip(self._bands, keys):
+            bucket_discard(band, key, question['id'])
+
+    def candidates(self, question, answer, limit=DEDUP_MAX_CANDIDATES):
+        keys = band_keys(signature(shingles(question, answer)))
+        hits = Tally()
+        with self._lock:
+            for band, key in zip(self._bands, keys):
+                hits.update(bucket_members(band, key))
+        # questions sharing the most bands are the likeliest matches
+        return heapq.nlargest(limit, hits, key=hits.__getitem__)
+
+    """
+    find(question, answer)
+        existing questions whose text is at least `threshold` similar,
+        most similar first, as dicts with id, question, answer and
+        similarity. Candidates are loaded from the database and compared
+        exactly, so the answer has no false positives.
+    """
+    def find(self, question, answer):
+        candidate_ids = self.candidates(question, answer)
+        if not candidate_ids:
+            return []
+        wanted = shingles(question, answer)
+        matches = []
+        rows = db.session.query(Question.id, Question.question, Question.answer) \
+            .filter(Question.id.in_(candidate_ids))
+        for question_id, other_question, other_answer in rows:
+            similarity = jaccard(wanted, shingles(other_question, other_answer))
+            if similarity >= self.threshold:
+                matches.append({
+                    'id': question_id,
+                    'question': other_question,
+                    'answer': other_answer,
+                    'similarity': round(similarity, 3)
+                })
+        matches.sort(key=lambda match: (-match['similarity'], match['id']))
+        return matches
+
+
+class DisjointSet:
+
+    def __init__(self, size):
+        self.parent = array('I', range(size))
+
+    def find(self, item):
+        root = item
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[item] != root:
+            self.parent[item], item = root, self.parent[item]
+        return root
+
+    def union(self, first, second):
+        first, second = self.find(first), self.find(second)
+        if first != second:
+            self.parent[max(first, second)] = min(first, second)
+
+"""
+cluster_duplicates(threshold, batch_size, echo)
+    groups of near-duplicate question ids across the whole table, largest
+    first, each sorted by id. The table is streamed once to sign every
+    row and bucket it per band. Only rows that share a bucket are
+    compared, by the share of equal signature values, which estimates
+    their Jaccard similarity; no pairs are compared across the table.
+    Memory is about 350 bytes per question.
+"""
+def cluster_duplicates(threshold=DEDUP_THRESHOLD, batch_size=DEDUP_BATCH_SIZE, echo=None):
+    width = SIGNATURE_SIZE
+    ids, signatures = array('I'), array('I')
+    bands = [array('Q') for _ in range(DEDUP_BANDS)]
+    rows = db.session.query(Question.id, Question.question, Question.answer) \
+        .order_by(Question.id).yield_per(batch_size)
+    for position, (question_id, question, answer) in enumerate(rows):
+        values = signature(shingles(question, answer))
+        ids.append(question_id)
+        signatures.extend(value & MASK32 for value in values)
+        for band, key in zip(bands, band_keys(values)):
+            band.append(key << 32 | position)
+        if echo and (position + 1) % batch_size == 0:
+            echo('signed %d questions' % (position + 1))
+
+    def similar(first, second):
+        same = sum(map(operator.eq, signatures[first * width:(first + 1) * width],
+                       signatures[second * width:(second + 1) * width]))
+        return same >= threshold * width
+
+    groups = DisjointSet(len(ids))
+    for band in bands:
+        band = sorted(band)
+        start = 0
+        while start < len(band):
+            end = start + 1
+            while end < len(band) and band[end] >> 32 == band[start] >> 32:
+                end += 1
+            representatives = []
+            for entry in band[start:end]:
+                position = entry & MASK32
+                for representative in representatives:
+                    if groups.find(position) == groups.find(representative) or similar(position, representative):
+                        groups.union(position, representative)
+                        break
+                else:
+                    if len(representatives) < CLUSTER_BUCKET_REPRESENTATIVES:
+                        representatives.append(position)
+            start = end
+
+    clusters = {}
+    for position in range(len(ids)):
+        clusters.setdefault(groups.find(position), []).append(ids[position])
+    return sorted((members for members in clusters.values() if len(members) > 1), key=lambda members: (-len(members), members[0]))
+
+
+def dedup_mode():
+    mode = os.environ.get('DEDUP_MODE', DEDUP_OFF).lower()
+    if mode not in DEDUP_MODES:
+        raise ValueError('DEDUP_MODE must be one of %s, not %r' % (', '.join(DEDUP_MODES), mode))
+    return mode
+
+
+"""
+screen(question, answer, mode)
+    the near-duplicates of a question about to be inserted, and whether
+    `mode` rejects it for them. Matches are counted by outcome in
+    trivia_duplicate_questions_total.
+"""
+def screen(question, answer, mode):
+    if mode == DEDUP_OFF:
+        return [], False
+    duplicate_index.ensure_ready()
+    duplicates = duplicate_index.find(question, answer)
+    if not duplicates:
+        return [], False
+    rejected = mode == DEDUP_REJECT
+    duplicates_found.inc('rejected' if rejected else 'flagged')
+    return duplicates, rejected
+
+
+duplicate_index = DuplicateIndex(float(os.environ.get('DEDUP_THRESHOLD', DEDUP_THRESHOLD)))
+registry.register(Gauge('trivia_duplicate_index_questions', 'Questions in the near-duplicate index.',
+                        collect=lambda: len(duplicate_index)))
+
+
+@on_commit
+def update_duplicate_index(changes):
+    duplicate_index.update(changes)
+
+
+@on_reload
+def reload_duplicate_index():
+    duplicate_index.reload()
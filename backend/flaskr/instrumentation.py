@@ -0,0 +1,272 @@
+import json
+import logging
+import threading
+import time
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100)
+
+logger = logging.getLogger('trivia.requests')
+
+"""
+Instrumentation for the trivia API.
+
+Request timing per route, SQL statement counts and durations per request
+(via SQLAlchemy cursor events) and rows returned by each statement are
+kept in a small in-process registry and exported in the Prometheus text
+format at /metrics. The row count comes from cursor.rowcount, which
+Postgres reports for SELECTs and SQLite does not.
+
+Logging goes out as one JSON object per line; every request logs its
+route, status, duration and SQL totals.
+"""
+
+
+def format_labels(names, values):
+    if not names:
+        return ''
+    pairs = ['%s="%s"' % (name, str(value).replace('\\', '\\\\').replace('"', '\\"')) for name, value in zip(names, values)]
+    return '{' + ','.join(pairs) + '}'
+
+
+class Counter:
+
+    kind = 'counter'
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            for label_values, value in sorted(self._values.items()):
+                yield self.name + format_labels(self.labels, label_values), value
+
+
+"""
+Gauge
+    a value that goes up and down. With `collect`, the value is read from
+    that callable each time /metrics is scraped instead of being set.
+"""
+class Gauge(Counter):
+
+    kind = 'gauge'
+
+    def __init__(self, name, help, labels=(), collect=None):
+        super().__init__(name, help, labels)
+        self.collect = collect
+
+    def set(self, *label_values, value):
+        with self._lock:
+            self._values[label_values] = value
+
+    def samples(self):
+        if self.collect is not None:
+            yield self.name, self.collect()
+            return
+        yield from super().samples()
+
+
+class Histogram:
+
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, *label_values, value):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * len(self.buckets), 0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def samples(self):
+        names = self.labels + ('le',)
+        with self._lock:
+            for label_values, (counts, total, count) in sorted(self._series.items()):
+                for bound, bucket_count in zip(self.buckets, counts):
+                    yield self.name + '_bucket' + format_labels(names, label_values + (bound,)), bucket_count
+                yield self.name + '_bucket' + format_labels(names, label_values + ('+Inf',)), count
+                yield self.name + '_sum' + format_labels(self.labels, label_values), total
+                yield self.name + '_count' + format_labels(self.labels, label_values), count
+
+
+class Registry:
+
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics = [existing for existing in self.metrics if existing.name != metric.name]
+        self.metrics.append(metric)
+        return metric
+
+    def exposition(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append('# HELP %s %s' % (metric.name, metric.help))
+            lines.append('# TYPE %s %s' % (metric.name, metric.kind))
+            for sample, value in metric.samples():
+                lines.append('%s %s' % (sample, value))
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+http_requests = registry.register(Counter(
+    'trivia_http_requests_total', 'HTTP requests by route, method and status.', ('route', 'method', 'status')))
+http_latency = registry.register(Histogram(
+    'trivia_http_request_duration_seconds', 'Time spent handling a request.', ('route', 'method')))
+db_queries = registry.register(Counter(
+    'trivia_db_queries_total', 'SQL statements executed, by route.', ('route',)))
+db_latency = registry.register(Histogram(
+    'trivia_db_query_duration_seconds', 'Time spent in single SQL statements, by route.', ('route',)))
+db_rows = registry.register(Counter(
+    'trivia_db_rows_total', 'Rows returned or affected by SQL statements, by route.', ('route',)))
+db_queries_per_request = registry.register(Histogram(
+    'trivia_db_queries_per_request', 'SQL statements per request.', ('route',), QUERY_COUNT_BUCKETS))
+
+
+POOL_GAUGES = (
+    ('size', 'trivia_db_pool_size', 'Connections the pool keeps open.'),
+    ('checked_out', 'trivia_db_pool_checked_out', 'Connections currently in use.'),
+    ('checked_in', 'trivia_db_pool_checked_in', 'Idle connections in the pool.'),
+    ('overflow', 'trivia_db_pool_overflow', 'Connections open beyond the pool size.'),
+    ('waits', 'trivia_db_pool_waits_total', 'Checkouts that waited for a free connection.'),
+    ('wait_seconds', 'trivia_db_pool_wait_seconds_total', 'Time spent waiting for a free connection.')
+)
+
+"""
+register_pool_metrics(stats)
+    exports the connection pool figures returned by the `stats` callable
+    (see models.pool_stats) as gauges, read on every scrape.
+"""
+def register_pool_metrics(stats):
+    for key, name, help in POOL_GAUGES:
+        registry.register(Gauge(name, help, collect=lambda key=key: stats()[key]))
+
+
+def current_route():
+    if has_request_context() and request.url_rule is not None:
+        return request.url_rule.rule
+    return 'unmatched' if has_request_context() else 'background'
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def start_query_timer(connection, cursor, statement, parameters, context, executemany):
+    connection.info.setdefault('query_started', []).append((context, time.perf_counter()))
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def record_query(connection, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - connection.info['query_started'].pop()[1]
+    route = current_route()
+    rows = max(cursor.rowcount, 0)
+    db_queries.inc(route)
+    db_latency.observe(route, value=elapsed)
+    db_rows.inc(route, amount=rows)
+    if has_request_context() and 'sql_stats' in g:
+        stats = g.sql_stats
+        stats['queries'] += 1
+        stats['seconds'] += elapsed
+        stats['rows'] += rows
+        if 'sql_log' in g:
+            g.sql_log.append({'statement': statement, 'parameters': parameters,
+                              'ms': round(elapsed * 1000, 3), 'rows': rows})
+
+
+# a statement that raises never reaches after_cursor_execute; drop its start time here
+@event.listens_for(Engine, 'handle_error')
+def discard_query_timer(context):
+    if context.connection is None:
+        return
+    started = context.connection.info.get('query_started')
+    if started and started[-1][0] is context.execution_context:
+        started.pop()
+
+
+class JsonFormatter(logging.Formatter):
+
+    RESERVED = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime'}
+
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record, '%Y-%m-%dT%H:%M:%S'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage()
+        }
+        entry.update((key, value) for key, value in vars(record).items() if key not in self.RESERVED)
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure_logging(level=logging.INFO):
+    root = logging.getLogger()
+    if any(isinstance(handler.formatter, JsonFormatter) for handler in root.handlers):
+        return
+    handler = logging.StreamHandler()
+    handler.setFormatter(JsonFormatter())
+    root.addHandler(handler)
+    root.setLevel(level)
+
+"""
+init_instrumentation(app)
+    registers the timing hooks and /metrics on `app`. Call it before any
+    other before_request hook so that short-circuited responses such as
+    304s are timed as well.
+"""
+def init_instrumentation(app):
+    configure_logging()
+
+    @app.before_request
+    def start_request_timer():
+        g.request_started = time.perf_counter()
+        g.sql_stats = {'queries': 0, 'seconds': 0.0, 'rows': 0}
+
+    @app.after_request
+    def record_request(response):
+        if 'request_started' not in g:
+            return response
+        elapsed = time.perf_counter() - g.request_started
+        route = current_route()
+        stats = g.sql_stats
+        http_requests.inc(route, request.method, response.status_code)
+        http_latency.observe(route, request.method, value=elapsed)
+        db_queries_per_request.observe(route, value=stats['queries'])
+        logger.info('request', extra={
+            'method': request.method,
+            'route': route,
+            'path': request.full_path.rstrip('?'),
+            'status': response.status_code,
+            'duration_ms': round(elapsed * 1000, 3),
+            'sql_queries': stats['queries'],
+            'sql_ms': round(stats['seconds'] * 1000, 3),
+            'sql_rows': stats['rows']
+        })
+        return response
+
+    @app.route('/metrics')
+    def metrics():
+        return app.response_class(registry.exposition(), mimetype='text/plain; version=0.0.4')
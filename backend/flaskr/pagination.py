@@ -0,0 +1,125 @@
+import base64
+import json
+
+from flask import abort
+
+from models import Question
+from serialization import project_questions, question_dict, QUESTION_COLUMNS
+
+QUESTIONS_PER_PAGE = 10
+
+"""
+paginate_selection(request, selection)
+    pushes the page window of the `page` query argument into SQL
+    as LIMIT/OFFSET and serializes only the rows that come back.
+    `selection` is an unexecuted query, e.g. Question.query.order_by(Question.id)
+"""
+def paginate_selection(request, selection, per_page=QUESTIONS_PER_PAGE):
+    page = request.args.get('page', 1, type=int)
+    if page < 1:
+        return []
+    start = (page - 1) * per_page
+
+    return project_questions(selection.limit(per_page).offset(start))
+
+
+def encode_cursor(direction, question_id):
+    raw = json.dumps({direction: question_id}).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    padded = cursor + '=' * (-len(cursor) % 4)
+    payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    if not isinstance(payload, dict) or len(payload) != 1:
+        raise ValueError('malformed cursor')
+    (direction, question_id), = payload.items()
+    # ids and search positions are never negative; bool is an int subclass
+    if direction not in ('after', 'before') or not isinstance(question_id, int) \
+            or isinstance(question_id, bool) or question_id < 0:
+        raise ValueError('malformed cursor')
+    return direction, question_id
+
+"""
+paginate_cursor(request, selection)
+    keyset pagination on Question.id. An empty `cursor` argument asks for
+    the first page, otherwise it must be a next_cursor/prev_cursor value
+    from an earlier response. Every page is a single indexed range scan,
+    so deep pages cost the same as the first one.
+"""
+def paginate_cursor(request, selection, per_page=QUESTIONS_PER_PAGE):
+    cursor = request.args.get('cursor', '')
+    direction, question_id = 'after', None
+    if cursor:
+        try:
+            direction, question_id = decode_cursor(cursor)
+        except (ValueError, TypeError):
+            abort(422)
+
+    selection = selection.with_entities(*QUESTION_COLUMNS).order_by(None)
+    if direction == 'after':
+        if question_id is not None:
+            selection = selection.filter(Question.id > question_id)
+        rows = selection.order_by(Question.id).limit(per_page + 1).all()
+        has_more = len(rows) > per_page
+        rows = rows[:per_page]
+        has_next, has_prev = has_more, question_id is not None
+    else:
+        selection = selection.filter(Question.id < question_id)
+        rows = selection.order_by(Question.id.desc()).limit(per_page + 1).all()
+        has_more = len(rows) > per_page
+        rows = rows[:per_page][::-1]
+        has_next, has_prev = True, has_more
+
+    cursors = {
+        'next_cursor': encode_cursor('after', rows[-1].id) if rows and has_next else None,
+        'prev_cursor': encode_cursor('before', rows[0].id) if rows and has_prev else None
+    }
+    return [question_dict(row) for row in rows], cursors
+
+"""
+paginate(request, selection)
+    dispatches to cursor mode when the request carries a `cursor`
+    argument and to page mode otherwise. Returns the formatted page and
+    the cursor fields to merge into the response (empty in page mode).
+"""
+def paginate(request, selection, per_page=QUESTIONS_PER_PAGE):
+    if 'cursor' in request.args:
+        return paginate_cursor(request, selection, per_page)
+    return paginate_selection(request, selection, per_page), {}
+
+"""
+paginate_search(request, engine, term, include_answers)
+    pages through relevance-ranked search hits. The engine returns only
+    the ids of the requested window and the hit count; just those rows
+    are then loaded. Ranked results have no stable id order, so in
+    cursor mode the cursor carries the position in the ranking.
+"""
+def paginate_search(request, engine, term, include_answers=False, per_page=QUESTIONS_PER_PAGE):
+    cursor = request.args.get('cursor')
+    if cursor is None:
+        page = request.args.get('page', 1, type=int)
+        if page < 1:
+            return [], 0, {}
+        offset = (page - 1) * per_page
+    elif cursor:
+        try:
+            direction, position = decode_cursor(cursor)
+        except (ValueError, TypeError):
+            abort(422)
+        offset = position if direction == 'after' else max(position - per_page, 0)
+    else:
+        offset = 0
+
+    ids, total = engine.search(term, include_answers, offset, per_page)
+    rows = {question['id']: question for question in project_questions(Question.query.filter(Question.id.in_(ids)))} if ids else {}
+    questions = [rows[question_id] for question_id in ids if question_id in rows]
+
+    cursors = {}
+    if cursor is not None:
+        end = offset + len(ids)
+        cursors = {
+            'next_cursor': encode_cursor('after', end) if end < total else None,
+            'prev_cursor': encode_cursor('before', offset) if offset > 0 else None
+        }
+    return questions, total, cursors
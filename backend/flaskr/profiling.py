@@ -0,0 +1,81 @@
+import cProfile
+import hmac
+import json
+import os
+import random
+import re
+import time
+
+from flask import g, request
+
+PROFILE_HEADER = 'X-Profile'
+PROFILE_DIR = '/tmp/trivia-profiles'
+PROFILE_MAX_FILES = 200
+
+"""
+On-demand request profiling.
+
+Disabled unless PROFILE_TOKEN or PROFILE_SAMPLE_RATE is set, in which
+case no hook is even registered. A request is profiled when it carries
+an X-Profile header equal to PROFILE_TOKEN, or when it falls into the
+PROFILE_SAMPLE_RATE sample (0..1). It then runs under cProfile, and its
+pstats dump plus a JSON log of its SQL statements are written to
+PROFILE_DIR, which keeps at most PROFILE_MAX_FILES profiles.
+"""
+
+
+def prune(directory, max_files):
+    profiles = sorted(name for name in os.listdir(directory) if name.endswith('.prof'))
+    for name in profiles[:max(len(profiles) - max_files, 0)]:
+        for path in (name, name[:-len('.prof')] + '.sql.json'):
+            try:
+                os.remove(os.path.join(directory, path))
+            except OSError:
+                pass
+
+
+def init_profiling(app):
+    token = os.environ.get('PROFILE_TOKEN')
+    sample_rate = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+    if not token and sample_rate <= 0:
+        return
+    directory = os.environ.get('PROFILE_DIR', PROFILE_DIR)
+    max_files = int(os.environ.get('PROFILE_MAX_FILES', PROFILE_MAX_FILES))
+    os.makedirs(directory, exist_ok=True)
+
+    def wanted():
+        header = request.headers.get(PROFILE_HEADER)
+        if token and header and hmac.compare_digest(header, token):
+            return True
+        return sample_rate > 0 and random.random() < sample_rate
+
+    @app.before_request
+    def start_profile():
+        if not wanted():
+            return
+        g.sql_log = []
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+
+    @app.after_request
+    def save_profile(response):
+        profiler = g.pop('profiler', None)
+        if profiler is None:
+            return response
+        profiler.disable()
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        name = '%d-%d-%s-%s' % (time.time() * 1000, os.getpid(), request.method,
+                                re.sub(r'[^A-Za-z0-9]+', '_', route).strip('_') or 'root')
+        profiler.dump_stats(os.path.join(directory, name + '.prof'))
+        with open(os.path.join(directory, name + '.sql.json'), 'w') as log:
+            json.dump({'path': request.full_path.rstrip('?'), 'status': response.status_code,
+                       'queries': g.pop('sql_log', [])}, log, indent=2, default=str)
+        prune(directory, max_files)
+        response.headers['X-Profile-Id'] = name
+        return response
+
+    @app.teardown_request
+    def stop_profile(exception):
+        profiler = g.pop('profiler', None)
+        if profiler is not None:
+            profiler.disable()
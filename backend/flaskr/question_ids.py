@@ -0,0 +1,183 @@
+import random
+import threading
+
+from models import db, Question
+from changes import on_commit, on_reload
+
+ALL_CATEGORIES = None
+ANY_DIFFICULTY = None
+DIFFICULTIES = range(1, 6)
+REJECTION_ATTEMPTS = 32
+
+"""
+IdList
+    ids of one category in an array plus an id -> slot map, so adding,
+    removing (swap with the last slot) and drawing a random id are all O(1).
+"""
+class IdList:
+
+    def __init__(self):
+        self.ids = []
+        self.slots = {}
+
+    def add(self, question_id):
+        if question_id not in self.slots:
+            self.slots[question_id] = len(self.ids)
+            self.ids.append(question_id)
+
+    def remove(self, question_id):
+        slot = self.slots.pop(question_id, None)
+        if slot is None:
+            return
+        last = self.ids.pop()
+        if last != question_id:
+            self.ids[slot] = last
+            self.slots[last] = slot
+
+    def __len__(self):
+        return len(self.ids)
+
+"""
+sample_unseen(ids, excluded, count)
+    up to `count` distinct, uniformly random ids of the sequence `ids`
+    that are not in `excluded`. Uses rejection sampling while it keeps
+    hitting unseen ids, then one reservoir-sampling pass over the rest
+    for whatever is still missing.
+"""
+def sample_unseen(ids, excluded=(), count=1):
+    excluded = set(excluded)
+    chosen = []
+    if not len(ids):
+        return chosen
+    for _ in range(REJECTION_ATTEMPTS * count):
+        if len(chosen) == count:
+            return chosen
+        question_id = ids[random.randrange(len(ids))]
+        if question_id not in excluded:
+            excluded.add(question_id)
+            chosen.append(question_id)
+
+    missing = count - len(chosen)
+    reservoir, seen = [], 0
+    for question_id in ids:
+        if question_id in excluded:
+            continue
+        seen += 1
+        if len(reservoir) < missing:
+            reservoir.append(question_id)
+        else:
+            slot = random.randrange(seen)
+            if slot < missing:
+                reservoir[slot] = question_id
+    random.shuffle(reservoir)
+    return chosen + reservoir
+
+def nearest_difficulties(difficulty):
+    # `difficulty` first, then d-1, d+1, d-2, ... within DIFFICULTIES
+    return sorted(DIFFICULTIES, key=lambda level: (abs(level - difficulty), level))
+
+
+def target_difficulty(value):
+    # the difficulty a quiz asks for: ANY_DIFFICULTY when absent, else one of DIFFICULTIES
+    if value is None:
+        return ANY_DIFFICULTY
+    if isinstance(value, bool) or not isinstance(value, int) or value not in DIFFICULTIES:
+        raise ValueError('difficulty must be an integer from %d to %d' % (DIFFICULTIES[0], DIFFICULTIES[-1]))
+    return value
+
+"""
+QuestionIdIndex
+    process-local question ids per category (and for all categories),
+    each also split by difficulty, loaded with one three-column query and
+    kept current on commit. random_unseen() draws an id without touching
+    the database.
+"""
+class QuestionIdIndex:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._lists = {}
+        self.ready = False
+
+    def rebuild(self, batch_size=10000):
+        lists = {}
+        rows = db.session.query(Question.id, Question.category, Question.difficulty).yield_per(batch_size)
+        for question_id, category, difficulty in rows:
+            for key in self._keys(category, difficulty):
+                lists.setdefault(key, IdList()).add(question_id)
+        with self._lock:
+            self._lists = lists
+            self.ready = True
+
+    def _keys(self, category, difficulty):
+        # every list a question belongs to: all or its category, any or its difficulty
+        try:
+            difficulty = int(difficulty)
+        except (TypeError, ValueError):
+            difficulty = ANY_DIFFICULTY
+        return {(category_key, difficulty_key)
+                for category_key in (ALL_CATEGORIES, str(category))
+                for difficulty_key in (ANY_DIFFICULTY, difficulty)}
+
+    def add(self, question_id, category, difficulty=ANY_DIFFICULTY):
+        with self._lock:
+            for key in self._keys(category, difficulty):
+                self._lists.setdefault(key, IdList()).add(question_id)
+
+    def remove(self, question_id, category, difficulty=ANY_DIFFICULTY):
+        with self._lock:
+            for key in self._keys(category, difficulty):
+                id_list = self._lists.get(key)
+                if id_list is not None:
+                    id_list.remove(question_id)
+
+    def _list(self, category, difficulty=ANY_DIFFICULTY):
+        key = ALL_CATEGORIES if category is ALL_CATEGORIES else str(category)
+        return self._lists.get((key, difficulty)) or IdList()
+
+    def ids(self, category=ALL_CATEGORIES, difficulty=ANY_DIFFICULTY):
+        with self._lock:
+            return list(self._list(category, difficulty).ids)
+
+    """
+    random_unseen_many(category, excluded, count, difficulty)
+        up to `count` distinct random ids of `category` not in
+        `excluded`. With a `difficulty`, ids of that difficulty come
+        first, then of the nearest ones (d-1, d+1, d-2, ...), so a
+        targeted quiz only runs dry with its category.
+    """
+    def random_unseen_many(self, category=ALL_CATEGORIES, excluded=(), count=1, difficulty=ANY_DIFFICULTY):
+        with self._lock:
+            if difficulty is ANY_DIFFICULTY:
+                return sample_unseen(self._list(category).ids, excluded, count)
+            excluded = set(excluded)
+            chosen = []
+            for nearby in nearest_difficulties(difficulty):
+                chosen += sample_unseen(self._list(category, nearby).ids, excluded, count - len(chosen))
+                if len(chosen) == count:
+                    break
+                excluded.update(chosen)
+            return chosen
+
+    def random_unseen(self, category=ALL_CATEGORIES, excluded=(), difficulty=ANY_DIFFICULTY):
+        chosen = self.random_unseen_many(category, excluded, 1, difficulty)
+        return chosen[0] if chosen else None
+
+
+question_ids = QuestionIdIndex()
+
+
+@on_commit
+def update_question_ids(changes):
+    if not question_ids.ready:
+        return
+    for question in changes.questions_removed:
+        question_ids.remove(question['id'], question['category'], question['difficulty'])
+    for question in changes.questions_added:
+        question_ids.add(question['id'], question['category'], question['difficulty'])
+
+
+@on_reload
+def reload_question_ids():
+    if question_ids.ready:
+        question_ids.rebuild()
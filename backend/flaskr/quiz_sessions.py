@@ -0,0 +1,114 @@
+import random
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+from question_ids import question_ids, target_difficulty, ALL_CATEGORIES
+
+QUIZ_SESSION_TTL = 30 * 60
+QUIZ_SESSION_LIMIT = 10000
+QUIZ_DECK_SIZE = 50
+# largest deck a session may ask for; bigger requests get this many
+QUIZ_DECK_LIMIT = 200
+# most questions one POST /quizzes with `count` may return
+QUIZ_PREFETCH_LIMIT = 20
+
+"""
+QuizSession
+    a pre-shuffled deck of question ids; next_id() pops from the end,
+    so each round costs O(1) whatever the number of rounds played.
+"""
+class QuizSession:
+
+    def __init__(self, deck):
+        self.deck = deck
+        self.touched_at = time.monotonic()
+
+    def next_id(self):
+        return self.deck.pop() if self.deck else None
+
+"""
+parse_session_request(body)
+    the category, difficulty and deck size of a POST /quizzes/sessions
+    body. Raises ValueError unless `quiz_category` is an object and
+    `questions` a positive integer; decks are capped at QUIZ_DECK_LIMIT.
+"""
+def parse_session_request(body):
+    if not isinstance(body, dict):
+        raise ValueError('body is not an object')
+    quiz_category = body.get('quiz_category')
+    deck_size = body.get('questions', QUIZ_DECK_SIZE)
+    if not isinstance(quiz_category, dict):
+        raise ValueError('quiz_category must be an object')
+    if not isinstance(deck_size, int) or isinstance(deck_size, bool) or deck_size < 1:
+        raise ValueError('questions must be a positive integer')
+    difficulty = target_difficulty(body.get('difficulty'))
+    category = ALL_CATEGORIES
+    if quiz_category.get('type') != 'click' and quiz_category.get('id'):
+        category = quiz_category['id']
+        if isinstance(category, bool) or not isinstance(category, (int, str)):
+            raise ValueError('quiz_category id must be an integer')
+    return category, difficulty, min(deck_size, QUIZ_DECK_LIMIT)
+
+
+def deal_deck(category, difficulty, deck_size):
+    # a random draw of the deck, without copying the category's whole id list
+    return question_ids.random_unseen_many(category, (), deck_size, difficulty)
+
+"""
+QuizSessionStore
+    bounded, process-local store of quiz sessions keyed by an opaque
+    token. Sessions expire `ttl` seconds after their last use; when the
+    store is full the least recently used session is evicted. With
+    several worker processes, a session only exists in the worker that
+    created it.
+"""
+class QuizSessionStore:
+
+    def __init__(self, limit=QUIZ_SESSION_LIMIT, ttl=QUIZ_SESSION_TTL):
+        self.limit = limit
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._sessions = OrderedDict()
+
+    def create(self, question_ids, size=QUIZ_DECK_SIZE):
+        deck = random.sample(question_ids, min(size, len(question_ids)))
+        session_id = secrets.token_urlsafe(16)
+        with self._lock:
+            self._expire()
+            self._sessions[session_id] = QuizSession(deck)
+            while len(self._sessions) > self.limit:
+                self._sessions.popitem(last=False)
+        return session_id, len(deck)
+
+    def get(self, session_id):
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return None
+            now = time.monotonic()
+            if now - session.touched_at > self.ttl:
+                del self._sessions[session_id]
+                return None
+            session.touched_at = now
+            self._sessions.move_to_end(session_id)
+            return session
+
+    def discard(self, session_id):
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def _expire(self):
+        deadline = time.monotonic() - self.ttl
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if session.touched_at > deadline:
+                break
+            del self._sessions[session_id]
+
+    def __len__(self):
+        return len(self._sessions)
+
+
+quiz_sessions = QuizSessionStore()
@@ -0,0 +1,78 @@
+import time
+
+from flask import request
+
+from models import db, db_setting, replicas
+from instrumentation import registry, Counter, Gauge
+from versions import data_versions
+
+STICKY_COOKIE = 'trivia_primary_until'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+"""
+Read-replica routing for the read-only endpoints.
+
+Requests to the endpoints passed to init_replicas() read from a replica
+chosen round-robin among the healthy ones (models.ReplicaSet); every
+other request, and any transaction once it writes, uses the primary.
+
+Read-your-writes: a successful write response sets a cookie holding the
+time until which that client's reads stay on the primary
+(DB_STICKY_SECONDS, 10 by default). For the same window after this
+process commits or applies another worker's write from the change feed,
+all of its reads go to the primary, so the response cache and the ETags
+it derives from data_versions never describe data a replica has not
+replayed yet.
+
+A replica that passed its last check may be up to DB_REPLICA_MAX_LAG
+seconds behind, and may fall further behind until the next check
+DB_REPLICA_CHECK_INTERVAL seconds later. The window has to cover both,
+so init_replicas() refuses a shorter one.
+"""
+
+db_reads = registry.register(Counter(
+    'trivia_db_read_requests_total', 'Read-only requests by the database they read from.', ('target',)))
+
+
+def sticky(now=None):
+    try:
+        until = float(request.cookies.get(STICKY_COOKIE, 0))
+    except ValueError:
+        return False
+    return until > (now if now is not None else time.time())
+
+"""
+init_replicas(app, endpoints)
+    routes the requests to `endpoints` (endpoint names) to the replicas
+    configured by setup_db; does nothing if there are none.
+"""
+def init_replicas(app, endpoints):
+    registry.register(Gauge(
+        'trivia_db_replicas_healthy', 'Read replicas that passed their last health check.',
+        collect=lambda: sum(healthy for _, healthy in replicas.stats())))
+    if not replicas.engines:
+        return
+    sticky_seconds = db_setting(app, 'DB_STICKY_SECONDS')
+    behind = db_setting(app, 'DB_REPLICA_MAX_LAG') + db_setting(app, 'DB_REPLICA_CHECK_INTERVAL')
+    if sticky_seconds < behind:
+        raise ValueError('DB_STICKY_SECONDS (%s) must be at least DB_REPLICA_MAX_LAG + DB_REPLICA_CHECK_INTERVAL (%s)'
+                         % (sticky_seconds, behind))
+
+    @app.before_request
+    def route_reads():
+        db.session.info.pop('read_engine', None)
+        if request.endpoint not in endpoints:
+            return
+        settled = time.time() - data_versions.last_modified(('questions', 'categories')) >= sticky_seconds
+        engine = replicas.choose() if settled and not sticky() else None
+        db_reads.inc('replica' if engine is not None else 'primary')
+        if engine is not None:
+            db.session.info['read_engine'] = engine
+
+    @app.after_request
+    def stick_to_primary(response):
+        writes = request.method not in SAFE_METHODS and request.endpoint not in endpoints
+        if writes and response.status_code < 400 and sticky_seconds:
+            response.set_cookie(STICKY_COOKIE, '%.3f' % (time.time() + sticky_seconds),
+                                max_age=int(sticky_seconds) + 1, httponly=True)
+        return response
@@ -0,0 +1,281 @@
+import functools
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app, request
+
+from changes import change_feed, on_commit, on_reload
+from versions import data_versions
+
+RESPONSE_CACHE_TTL = 60
+RESPONSE_CACHE_MAX_BYTES = 32 * 1024 * 1024
+RESPONSE_CACHE_MAX_ENTRIES = 10000
+ALL_QUESTIONS_TAG = 'all'
+
+"""
+Response cache for the paginated question listings.
+
+Entries are keyed by endpoint, route arguments and query string, and
+tagged with what they depend on: 'all' for listings across every
+category, 'category:<id>' for one category. A committed question write
+drops only the tags of the categories it touched plus 'all'; category
+writes and bulk reloads clear everything.
+
+Two backends share one interface: MemoryResponseCache (per process) and
+SQLiteResponseCache, a local file that every gunicorn worker on the
+host reads and invalidates. Both only store a page if no invalidation
+of its tags has overtaken it: the memory cache compares this process's
+data versions, the SQLite cache the change feed versions recorded with
+each invalidation (see changes.py).
+"""
+
+
+def category_tag(category):
+    return 'category:%s' % category
+
+
+def cache_key(endpoint, view_args, args):
+    parts = [endpoint]
+    parts += ['%s=%s' % item for item in sorted(view_args.items())]
+    parts += ['%s=%s' % item for item in sorted(args.items(multi=True))]
+    return '|'.join(parts)
+
+"""
+MemoryResponseCache
+    LRU over an OrderedDict with a per-entry deadline, bounded both by
+    entry count and by the total size of the cached bodies.
+"""
+class MemoryResponseCache:
+
+    def __init__(self, max_bytes=RESPONSE_CACHE_MAX_BYTES, max_entries=RESPONSE_CACHE_MAX_ENTRIES):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._tags = {}
+        self._bytes = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            body, mimetype, tags, expires_at = entry
+            if expires_at < time.monotonic():
+                self._drop(key)
+                return None
+            self._entries.move_to_end(key)
+            return body, mimetype
+
+    def set(self, key, body, mimetype, tags, ttl, version=None):
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            self._drop(key)
+            self._entries[key] = (body, mimetype, tags, time.monotonic() + ttl)
+            self._bytes += len(body)
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while self._bytes > self.max_bytes or len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+
+    def invalidate(self, tags, version=None):
+        with self._lock:
+            for tag in tags:
+                for key in list(self._tags.get(tag, ())):
+                    self._drop(key)
+
+    def clear(self, version=None):
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+            self._bytes = 0
+
+    def _drop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        body, mimetype, tags, expires_at = entry
+        self._bytes -= len(body)
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+"""
+SQLiteResponseCache
+    the same cache in a local SQLite file, so that all worker processes
+    on a host share hits and invalidations. Runs in WAL mode with one
+    connection per thread; least recently used rows are trimmed once
+    the stored bodies exceed max_bytes.
+
+    Workers apply each other's writes a little late, so a worker may
+    build a page from data another worker has already invalidated.
+    tag_versions keeps the change feed version of the last invalidation
+    of each tag ('*' for a clear), and set() refuses a page built at an
+    older version.
+"""
+class SQLiteResponseCache:
+
+    def __init__(self, path, max_bytes=RESPONSE_CACHE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        connection = self._connection()
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, body BLOB, '
+                           'mimetype TEXT, expires_at REAL, used_at REAL)')
+        connection.execute('CREATE TABLE IF NOT EXISTS entry_tags (tag TEXT, key TEXT)')
+        connection.execute('CREATE INDEX IF NOT EXISTS ix_entry_tags_tag ON entry_tags (tag)')
+        connection.execute('CREATE INDEX IF NOT EXISTS ix_entries_used_at ON entries (used_at)')
+        connection.execute('CREATE TABLE IF NOT EXISTS tag_versions (tag TEXT PRIMARY KEY, version INTEGER)')
+        connection.commit()
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+        return connection
+
+    def get(self, key):
+        connection = self._connection()
+        now = time.time()
+        row = connection.execute('SELECT body, mimetype FROM entries WHERE key = ? AND expires_at > ?',
+                                 (key, now)).fetchone()
+        if row is None:
+            return None
+        connection.execute('UPDATE entries SET used_at = ? WHERE key = ?', (now, key))
+        return bytes(row[0]), row[1]
+
+    def set(self, key, body, mimetype, tags, ttl, version=None):
+        if len(body) > self.max_bytes or version is None:
+            return
+        connection = self._connection()
+        now = time.time()
+        checked = list(tags) + ['*']
+        with connection:
+            connection.execute('BEGIN IMMEDIATE')
+            invalidated, = connection.execute('SELECT max(version) FROM tag_versions WHERE tag IN (%s)'
+                                              % ', '.join('?' * len(checked)), checked).fetchone()
+            if invalidated is not None and invalidated > version:
+                return
+            connection.execute('DELETE FROM entry_tags WHERE key = ?', (key,))
+            connection.execute('INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)',
+                               (key, body, mimetype, now + ttl, now))
+            connection.executemany('INSERT INTO entry_tags VALUES (?, ?)', [(tag, key) for tag in tags])
+            connection.execute('DELETE FROM entries WHERE expires_at <= ?', (now,))
+            total, = connection.execute('SELECT coalesce(sum(length(body)), 0) FROM entries').fetchone()
+            while total > self.max_bytes:
+                oldest = connection.execute('SELECT key, length(body) FROM entries ORDER BY used_at LIMIT 1').fetchone()
+                connection.execute('DELETE FROM entries WHERE key = ?', (oldest[0],))
+                total -= oldest[1]
+            connection.execute('DELETE FROM entry_tags WHERE key NOT IN (SELECT key FROM entries)')
+
+    def invalidate(self, tags, version=None):
+        connection = self._connection()
+        marks = ', '.join('?' * len(tags))
+        with connection:
+            connection.execute('BEGIN IMMEDIATE')
+            if version is not None:
+                self._record(connection, tags, version)
+            connection.execute('DELETE FROM entries WHERE key IN (SELECT key FROM entry_tags WHERE tag IN (%s))' % marks,
+                               list(tags))
+            connection.execute('DELETE FROM entry_tags WHERE tag IN (%s)' % marks, list(tags))
+
+    def clear(self, version=None):
+        connection = self._connection()
+        with connection:
+            connection.execute('BEGIN IMMEDIATE')
+            if version is not None:
+                self._record(connection, ['*'], version)
+            connection.execute('DELETE FROM entries')
+            connection.execute('DELETE FROM entry_tags')
+
+    def _record(self, connection, tags, version):
+        # versions only move forward, whichever worker gets here first
+        connection.executemany('INSERT OR IGNORE INTO tag_versions VALUES (?, 0)', [(tag,) for tag in tags])
+        connection.executemany('UPDATE tag_versions SET version = max(version, ?) WHERE tag = ?',
+                               [(version, tag) for tag in tags])
+
+"""
+ResponseCache
+    holds the configured backend (None disables caching) and provides
+    the @cached(tags) view decorator. A response is only stored if no
+    write this process knows of committed while it was being built, and
+    the page carries the change feed version it was built at for the
+    backend to check against other workers' invalidations.
+"""
+class ResponseCache:
+
+    def __init__(self):
+        self.backend = None
+        self.ttl = RESPONSE_CACHE_TTL
+
+    def configure(self, setting=None, ttl=None):
+        setting = setting if setting is not None else os.environ.get('RESPONSE_CACHE', 'memory')
+        self.ttl = ttl if ttl is not None else int(os.environ.get('RESPONSE_CACHE_TTL', RESPONSE_CACHE_TTL))
+        if setting == 'off':
+            self.backend = None
+        elif setting == 'memory':
+            self.backend = MemoryResponseCache()
+        elif setting.startswith('sqlite:///'):
+            self.backend = SQLiteResponseCache(setting[len('sqlite:///'):])
+        else:
+            raise ValueError('unknown RESPONSE_CACHE setting: %s' % setting)
+
+    def cached(self, tags):
+        def decorator(view):
+            @functools.wraps(view)
+            def wrapper(**view_args):
+                backend = self.backend
+                if backend is None:
+                    return view(**view_args)
+                key = cache_key(request.endpoint, view_args, request.args)
+                hit = backend.get(key)
+                if hit is not None:
+                    body, mimetype = hit
+                    return current_app.response_class(body, mimetype=mimetype)
+
+                versions = (data_versions.version('questions'), data_versions.version('categories'))
+                # every change up to this version is visible to the view's queries
+                applied = change_feed.applied
+                response = current_app.make_response(view(**view_args))
+                unchanged = versions == (data_versions.version('questions'), data_versions.version('categories'))
+                if response.status_code == 200 and not response.is_streamed and unchanged:
+                    backend.set(key, response.get_data(), response.mimetype, tags(view_args), self.ttl, applied)
+                return response
+            return wrapper
+        return decorator
+
+    def invalidate(self, tags, version=None):
+        if self.backend is not None and tags:
+            self.backend.invalidate(tags, version)
+
+    def clear(self, version=None):
+        if self.backend is not None:
+            self.backend.clear(version)
+
+
+response_cache = ResponseCache()
+
+
+@on_commit
+def invalidate_responses(changes):
+    if changes.categories_changed or changes.reload:
+        response_cache.clear(changes.version)
+        return
+    questions = changes.questions_added + changes.questions_removed
+    if questions:
+        tags = {ALL_QUESTIONS_TAG}
+        tags.update(category_tag(question['category']) for question in questions)
+        response_cache.invalidate(tags, changes.version)
+
+
+on_reload(response_cache.clear)
@@ -0,0 +1,243 @@
+import bisect
+import heapq
+import math
+import os
+import re
+import threading
+from collections import Counter, defaultdict
+
+from sqlalchemy import func, text
+
+from models import db, Question
+from changes import on_commit, on_reload
+
+TOKEN_PATTERN = re.compile(r'\w+', re.UNICODE)
+SEARCH_FIELDS = ('question', 'answer')
+ANSWER_WEIGHT = 0.5
+PREFIX_EXPANSION_LIMIT = 64
+
+"""
+tokenize(text)
+    lower-cased word tokens of `text`; shared by both search backends so
+    that a query means the same thing on Postgres and in memory.
+"""
+def tokenize(text):
+    if not text:
+        return []
+    return TOKEN_PATTERN.findall(text.lower())
+
+"""
+MemorySearchIndex
+    in-process inverted index over Question.question and Question.answer,
+    used when the database has no full-text support (SQLite, tests).
+    Every query term must match; the last term also matches as a prefix
+    so partially typed words still find results. Hits are ranked with
+    BM25, answer matches counting ANSWER_WEIGHT of a question match.
+"""
+class MemorySearchIndex:
+
+    k1 = 1.2
+    b = 0.75
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.ready = False
+        self._clear()
+
+    def _clear(self):
+        self._postings = {field: defaultdict(dict) for field in SEARCH_FIELDS}
+        self._lengths = {field: {} for field in SEARCH_FIELDS}
+        self._total_length = {field: 0 for field in SEARCH_FIELDS}
+        self._vocabulary = []
+
+    def rebuild(self, batch_size=10000):
+        rows = db.session.query(Question.id, Question.question, Question.answer) \
+            .order_by(Question.id).yield_per(batch_size)
+        with self._lock:
+            self._clear()
+            for question_id, question, answer in rows:
+                self._add(question_id, {'question': question, 'answer': answer}, sort=False)
+            self._vocabulary.sort()
+            self.ready = True
+
+    def add(self, question):
+        with self._lock:
+            self._add(question['id'], question)
+
+    def remove(self, question):
+        with self._lock:
+            self._remove(question['id'], question)
+
+    def _add(self, question_id, document, sort=True):
+        for field in SEARCH_FIELDS:
+            terms = Counter(tokenize(document.get(field)))
+            postings = self._postings[field]
+            for term, frequency in terms.items():
+                if term not in self._postings['question'] and term not in self._postings['answer']:
+                    if sort:
+                        bisect.insort(self._vocabulary, term)
+                    else:
+                        self._vocabulary.append(term)
+                postings[term][question_id] = frequency
+            length = sum(terms.values())
+            self._lengths[field][question_id] = length
+            self._total_length[field] += length
+
+    def _remove(self, question_id, document):
+        for field in SEARCH_FIELDS:
+            postings = self._postings[field]
+            for term in set(tokenize(document.get(field))):
+                documents = postings.get(term)
+                if documents is None:
+                    continue
+                documents.pop(question_id, None)
+                if not documents:
+                    del postings[term]
+                    if term not in self._postings['question'] and term not in self._postings['answer']:
+                        position = bisect.bisect_left(self._vocabulary, term)
+                        if position < len(self._vocabulary) and self._vocabulary[position] == term:
+                            del self._vocabulary[position]
+            self._total_length[field] -= self._lengths[field].pop(question_id, 0)
+
+    def _expand_prefix(self, prefix):
+        start = bisect.bisect_left(self._vocabulary, prefix)
+        terms = []
+        for term in self._vocabulary[start:start + PREFIX_EXPANSION_LIMIT]:
+            if not term.startswith(prefix):
+                break
+            terms.append(term)
+        return terms
+
+    def _score(self, field, terms, candidates, scores, weight):
+        lengths = self._lengths[field]
+        count = len(lengths) or 1
+        average = self._total_length[field] / count or 1
+        postings = self._postings[field]
+        for term in terms:
+            documents = postings.get(term)
+            if not documents:
+                continue
+            idf = math.log(1 + (count - len(documents) + 0.5) / (len(documents) + 0.5))
+            boost = weight * idf * (self.k1 + 1)
+            base = self.k1 * (1 - self.b)
+            slope = self.k1 * self.b / average
+            matched = documents.keys() if len(candidates) >= len(documents) else candidates
+            for question_id in matched:
+                frequency = documents.get(question_id)
+                if frequency is None or question_id not in candidates:
+                    continue
+                scores[question_id] += boost * frequency / (frequency + base + slope * lengths[question_id])
+
+    def search(self, term, include_answers=False, offset=0, limit=None):
+        tokens = tokenize(term)
+        if not tokens:
+            return [], 0
+        fields = SEARCH_FIELDS if include_answers else ('question',)
+        with self._lock:
+            expanded = [[token] for token in tokens[:-1]]
+            expanded.append(self._expand_prefix(tokens[-1]))
+
+            candidates = None
+            for alternatives in expanded:
+                matches = set()
+                for field in fields:
+                    postings = self._postings[field]
+                    for alternative in alternatives:
+                        matches.update(postings.get(alternative, ()))
+                candidates = matches if candidates is None else candidates & matches
+                if not candidates:
+                    return [], 0
+
+            scores = Counter({question_id: 0.0 for question_id in candidates})
+            all_terms = [alternative for alternatives in expanded for alternative in alternatives]
+            for field in fields:
+                weight = 1.0 if field == 'question' else ANSWER_WEIGHT
+                self._score(field, all_terms, candidates, scores, weight)
+
+        rank = lambda question_id: (-scores[question_id], question_id)
+        if limit is None:
+            ranked = sorted(scores, key=rank)
+        else:
+            ranked = heapq.nsmallest(offset + limit, scores, key=rank)
+        return ranked[offset:], len(scores)
+
+"""
+PostgresSearch
+    full-text search on Postgres through GIN indexes over
+    to_tsvector('english', ...) expressions. The database maintains the
+    indexes on every insert, update and delete, so there is nothing to
+    keep in sync here; results are ranked with ts_rank.
+"""
+class PostgresSearch:
+
+    ready = True
+    config = 'english'
+
+    def setup(self):
+        db.session.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_questions_question_fts ON questions "
+            "USING GIN (to_tsvector('english', coalesce(question, '')))"))
+        db.session.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_questions_question_answer_fts ON questions "
+            "USING GIN (to_tsvector('english', coalesce(question, '') || ' ' || coalesce(answer, '')))"))
+        db.session.commit()
+
+    def _document(self, include_answers):
+        document = func.coalesce(Question.question, '')
+        if include_answers:
+            document = document.op('||')(' ').op('||')(func.coalesce(Question.answer, ''))
+        return func.to_tsvector(self.config, document)
+
+    def search(self, term, include_answers=False, offset=0, limit=None):
+        tokens = tokenize(term)
+        if not tokens:
+            return [], 0
+        # tokens are plain word characters, so they are safe to_tsquery operands
+        expression = ' & '.join(tokens[:-1] + [tokens[-1] + ':*'])
+        query = func.to_tsquery(self.config, expression)
+        document = self._document(include_answers)
+        matches = db.session.query(Question.id, func.count().over()) \
+            .filter(document.op('@@')(query)) \
+            .order_by(func.ts_rank(document, query).desc(), Question.id) \
+            .offset(offset).limit(limit).all()
+        if matches:
+            return [question_id for question_id, _ in matches], matches[0][1]
+        total = db.session.query(func.count(Question.id)) \
+            .filter(document.op('@@')(query)).scalar()
+        return [], total
+
+
+memory_index = MemorySearchIndex()
+
+
+@on_commit
+def update_memory_index(changes):
+    if not memory_index.ready:
+        return
+    for question in changes.questions_removed:
+        memory_index.remove(question)
+    for question in changes.questions_added:
+        memory_index.add(question)
+
+
+@on_reload
+def reload_memory_index():
+    if memory_index.ready:
+        memory_index.rebuild()
+
+"""
+init_search()
+    picks the search backend: SEARCH_BACKEND=postgres|memory in the
+    environment, otherwise Postgres full-text search when the database
+    is Postgres and the in-memory index for anything else.
+"""
+def init_search():
+    backend = os.environ.get('SEARCH_BACKEND')
+    if backend is None:
+        backend = 'postgres' if db.engine.dialect.name == 'postgresql' else 'memory'
+    if backend == 'postgres':
+        engine = PostgresSearch()
+        engine.setup()
+        return engine
+    memory_index.rebuild()
+    return memory_index
@@ -0,0 +1,64 @@
+import json
+import os
+
+from flask import current_app
+
+from models import Question
+
+QUESTION_FIELDS = ('id', 'question', 'answer', 'category', 'difficulty')
+QUESTION_COLUMNS = tuple(getattr(Question, field) for field in QUESTION_FIELDS)
+
+"""
+Read-path serialization for question payloads.
+
+project_questions() selects only the five question columns, so rows come
+back as plain tuples with no ORM instances and no identity-map work, and
+turns them into the same dicts Question.format() builds.
+
+json_response() encodes with the JSON_BACKEND named in the environment
+(orjson, ujson or json), defaulting to the fastest one installed. Keys
+are sorted like Flask's jsonify, so payloads keep their field names and
+order. The json and ujson backends produce the same bytes as jsonify;
+orjson writes non-ASCII characters as UTF-8 instead of \\u escapes.
+"""
+
+
+def question_dict(row):
+    return dict(zip(QUESTION_FIELDS, row))
+
+
+def project_questions(selection):
+    return [question_dict(row) for row in selection.with_entities(*QUESTION_COLUMNS)]
+
+
+def stdlib_dumps(payload):
+    return json.dumps(payload, sort_keys=True, separators=(',', ':')) + '\n'
+
+
+def load_backend(name=None):
+    name = name or os.environ.get('JSON_BACKEND')
+    candidates = [name] if name else ['orjson', 'ujson', 'json']
+    for candidate in candidates:
+        if candidate == 'orjson':
+            try:
+                import orjson
+            except ImportError:
+                continue
+            options = orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS | orjson.OPT_APPEND_NEWLINE
+            return 'orjson', lambda payload: orjson.dumps(payload, option=options)
+        if candidate == 'ujson':
+            try:
+                import ujson
+            except ImportError:
+                continue
+            return 'ujson', lambda payload: ujson.dumps(payload, sort_keys=True, escape_forward_slashes=False) + '\n'
+        if candidate == 'json':
+            return 'json', stdlib_dumps
+    raise ValueError('JSON backend %s is not available' % name)
+
+
+json_backend, json_dumps = load_backend()
+
+
+def json_response(payload, status=200):
+    return current_app.response_class(json_dumps(payload), status=status, mimetype='application/json')
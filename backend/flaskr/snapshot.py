@@ -0,0 +1,244 @@
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+from array import array
+
+from models import db, Question, Category
+
+SNAPSHOT_MAGIC = b'TRIVSNAP'
+SNAPSHOT_VERSION = 1
+SNAPSHOT_CHECK_INTERVAL = 1.0
+SNAPSHOT_BATCH_SIZE = 10000
+NULL_INT = -2 ** 31
+
+"""
+Columnar, memory-mapped snapshots of the question bank.
+
+A snapshot file holds `questions` and `categories` as flat arrays that
+a worker maps read-only and reads in place, so every worker on a host
+shares the same pages through the OS page cache and nothing is parsed
+at startup:
+
+    header     magic, version, byte order, row counts, section table
+    q_ids      int32, ascending            q_category, q_difficulty int32
+    q_offsets  int64 offsets into q_text: question i spans 2i..2i+1,
+               its answer 2i+1..2i+2
+    q_text     UTF-8 question and answer text
+    c_ids      int32, ascending            c_type int64 offsets into c_text
+    c_text     UTF-8 category names
+    g_ids      int32 category values       g_offsets int64 into g_members
+    g_members  int32 row numbers of each category's questions, by id
+
+NULL integers are stored as NULL_INT and NULL text as an empty string.
+write_snapshot() writes a temporary file next to the target and renames
+it into place, so readers only ever see a complete snapshot;
+SnapshotHolder notices the new file and maps it on the next request.
+"""
+
+SECTIONS = (
+    ('q_ids', 'i'), ('q_category', 'i'), ('q_difficulty', 'i'),
+    ('q_offsets', 'q'), ('q_text', 'B'),
+    ('c_ids', 'i'), ('c_type', 'q'), ('c_text', 'B'),
+    ('g_ids', 'i'), ('g_offsets', 'q'), ('g_members', 'i')
+)
+HEADER = struct.Struct('<8sHBxIIq')
+SECTION_ENTRY = struct.Struct('<qq')
+
+
+def null_int(value):
+    return NULL_INT if value is None else int(value)
+
+
+def read_int(value):
+    return None if value == NULL_INT else value
+
+
+class TextColumn:
+
+    def __init__(self):
+        self.offsets = array('q', [0])
+        self.text = bytearray()
+
+    def append(self, value):
+        self.text += (value or '').encode('utf-8')
+        self.offsets.append(len(self.text))
+
+"""
+write_snapshot(path, batch_size)
+    exports the questions and categories tables into a snapshot at
+    `path`, reading `batch_size` rows at a time, and atomically replaces
+    whatever file was there. Returns the number of questions written.
+"""
+def write_snapshot(path, batch_size=SNAPSHOT_BATCH_SIZE):
+    ids, categories, difficulties = array('i'), array('i'), array('i')
+    texts = TextColumn()
+    rows = db.session.query(Question.id, Question.question, Question.answer, Question.category, Question.difficulty) \
+        .order_by(Question.id).yield_per(batch_size)
+    for question_id, question, answer, category, difficulty in rows:
+        ids.append(question_id)
+        categories.append(null_int(category))
+        difficulties.append(null_int(difficulty))
+        texts.append(question)
+        texts.append(answer)
+
+    category_ids, category_types = array('i'), TextColumn()
+    for category_id, category_type in db.session.query(Category.id, Category.type).order_by(Category.id):
+        category_ids.append(category_id)
+        category_types.append(category_type)
+
+    groups = {}
+    for position, category in enumerate(categories):
+        groups.setdefault(category, array('i')).append(position)
+    group_ids, group_offsets, members = array('i'), array('q', [0]), array('i')
+    for category in sorted(set(groups) | set(category_ids)):
+        group_ids.append(category)
+        members.extend(groups.get(category, ()))
+        group_offsets.append(len(members))
+
+    sections = {
+        'q_ids': ids, 'q_category': categories, 'q_difficulty': difficulties,
+        'q_offsets': texts.offsets, 'q_text': texts.text,
+        'c_ids': category_ids, 'c_type': category_types.offsets, 'c_text': category_types.text,
+        'g_ids': group_ids, 'g_offsets': group_offsets, 'g_members': members
+    }
+    byte_order = 0 if sys.byteorder == 'little' else 1
+    offset = HEADER.size + SECTION_ENTRY.size * len(SECTIONS)
+    table, payloads = [], []
+    for name, _ in SECTIONS:
+        payload = bytes(sections[name]) if isinstance(sections[name], bytearray) else sections[name].tobytes()
+        offset += -offset % 8
+        table.append(SECTION_ENTRY.pack(offset, len(payload)))
+        payloads.append((offset, payload))
+        offset += len(payload)
+
+    temporary = '%s.tmp-%d' % (path, os.getpid())
+    with open(temporary, 'wb') as stream:
+        stream.write(HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, byte_order, len(ids), len(category_ids),
+                                 int(time.time())))
+        stream.write(b''.join(table))
+        for start, payload in payloads:
+            stream.write(b'\0' * (start - stream.tell()))
+            stream.write(payload)
+        stream.flush()
+        os.fsync(stream.fileno())
+    os.replace(temporary, path)
+    return len(ids)
+
+"""
+Snapshot
+    one mapped snapshot file. Rows are addressed by position (0..total-1)
+    in id order; the arrays are memoryviews over the mapping, so reading
+    a question touches only its own pages.
+"""
+class Snapshot:
+
+    def __init__(self, path):
+        with open(path, 'rb') as stream:
+            self.inode = os.fstat(stream.fileno()).st_ino
+            self._map = mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, byte_order, self.total, category_count, self.created_at = HEADER.unpack_from(self._map)
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+            raise ValueError('%s is not a version %d trivia snapshot' % (path, SNAPSHOT_VERSION))
+        if byte_order != (0 if sys.byteorder == 'little' else 1):
+            raise ValueError('%s was written on a machine with a different byte order' % path)
+        view = memoryview(self._map)
+        for index, (name, typecode) in enumerate(SECTIONS):
+            start, length = SECTION_ENTRY.unpack_from(self._map, HEADER.size + SECTION_ENTRY.size * index)
+            setattr(self, name, view[start:start + length].cast(typecode))
+        self.etag = '%x-%x' % (self.created_at, self.inode)
+        self._categories = {self.c_ids[index]: self._text(self.c_text, self.c_type, index)
+                            for index in range(category_count)}
+        self._groups = {self.g_ids[index]: index for index in range(len(self.g_ids))}
+        self._by_difficulty = {}
+
+    def _text(self, blob, offsets, index):
+        return bytes(blob[offsets[index]:offsets[index + 1]]).decode('utf-8')
+
+    def question(self, position):
+        return {
+            'id': self.q_ids[position],
+            'question': self._text(self.q_text, self.q_offsets, 2 * position),
+            'answer': self._text(self.q_text, self.q_offsets, 2 * position + 1),
+            'category': read_int(self.q_category[position]),
+            'difficulty': read_int(self.q_difficulty[position])
+        }
+
+    def position(self, question_id):
+        low, high = 0, self.total
+        while low < high:
+            middle = (low + high) // 2
+            if self.q_ids[middle] < question_id:
+                low = middle + 1
+            else:
+                high = middle
+        return low if low < self.total and self.q_ids[low] == question_id else None
+
+    def categories(self):
+        return dict(self._categories)
+
+    def members(self, category=None):
+        # row numbers of a category's questions in id order; every row for None
+        if category is None:
+            return range(self.total)
+        index = self._groups.get(category)
+        if index is None:
+            return range(0)
+        return self.g_members[self.g_offsets[index]:self.g_offsets[index + 1]]
+
+    def members_of_difficulty(self, category, difficulty):
+        # the members() of one difficulty, filtered on first use; the file never changes
+        key = (category, difficulty)
+        members = self._by_difficulty.get(key)
+        if members is None:
+            members = self._by_difficulty[key] = array(
+                'i', (position for position in self.members(category) if self.q_difficulty[position] == difficulty))
+        return members
+
+    def counts(self):
+        return {str(read_int(category)): self.g_offsets[index + 1] - self.g_offsets[index]
+                for category, index in self._groups.items() if self.g_offsets[index + 1] > self.g_offsets[index]}
+
+"""
+MemberIds
+    the question ids of a members() selection as a read-only sequence,
+    for question_ids.sample_unseen().
+"""
+class MemberIds:
+
+    def __init__(self, snapshot, members):
+        self.snapshot = snapshot
+        self.members = members
+
+    def __len__(self):
+        return len(self.members)
+
+    def __getitem__(self, index):
+        return self.snapshot.q_ids[self.members[index]]
+
+"""
+SnapshotHolder
+    the current Snapshot for `path`. At most every `check_interval`
+    seconds it stats the path and maps the file again if it was
+    replaced; requests keep the Snapshot they started with, and the old
+    mapping is released once nothing refers to it.
+"""
+class SnapshotHolder:
+
+    def __init__(self, path, check_interval=SNAPSHOT_CHECK_INTERVAL):
+        self.path = path
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._snapshot = Snapshot(path)
+        self._checked_at = time.monotonic()
+
+    def current(self):
+        if time.monotonic() - self._checked_at >= self.check_interval:
+            with self._lock:
+                if time.monotonic() - self._checked_at >= self.check_interval:
+                    self._checked_at = time.monotonic()
+                    if os.stat(self.path).st_ino != self._snapshot.inode:
+                        self._snapshot = Snapshot(self.path)
+        return self._snapshot
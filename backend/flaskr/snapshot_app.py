@@ -0,0 +1,173 @@
+import bisect
+import os
+
+from flask import Flask, request, abort, jsonify
+from flask_cors import CORS
+from werkzeug.exceptions import HTTPException
+
+from pagination import decode_cursor, encode_cursor, QUESTIONS_PER_PAGE
+from question_ids import nearest_difficulties, sample_unseen, target_difficulty, ALL_CATEGORIES, ANY_DIFFICULTY
+from quiz_sessions import QUIZ_PREFETCH_LIMIT
+from serialization import json_response
+from snapshot import MemberIds, SnapshotHolder, SNAPSHOT_CHECK_INTERVAL
+from instrumentation import init_instrumentation
+
+"""
+Read-only serving mode for frozen question banks.
+
+create_snapshot_app() serves GET /questions, GET /categories,
+GET /categories/<id>/questions and POST /quizzes from a snapshot file
+written by `flask export-snapshot` (see snapshot.py), with the same JSON
+and quiz options (count, difficulty) as create_app() but without ever
+connecting to a database. Every other
+route is absent. Responses carry the snapshot's ETag, so conditional
+GETs are answered with 304 until a new snapshot is swapped in.
+"""
+
+
+def draw_quiz(snapshot, category, excluded, count, difficulty=ANY_DIFFICULTY):
+    # like QuestionIdIndex.random_unseen_many(): the nearest difficulties fill in once one runs dry
+    if difficulty is ANY_DIFFICULTY:
+        return sample_unseen(MemberIds(snapshot, snapshot.members(category)), excluded, count)
+    excluded = set(excluded)
+    chosen = []
+    for nearby in nearest_difficulties(difficulty):
+        members = snapshot.members_of_difficulty(category, nearby)
+        chosen += sample_unseen(MemberIds(snapshot, members), excluded, count - len(chosen))
+        if len(chosen) == count:
+            break
+        excluded.update(chosen)
+    return chosen
+
+
+def page_of(snapshot, members, args):
+    # the rows of one page of `members` and the cursor fields, like pagination.paginate()
+    ids = MemberIds(snapshot, members)
+    if 'cursor' not in args:
+        page = args.get('page', 1, type=int)
+        if page < 1:
+            return [], {}
+        start = (page - 1) * QUESTIONS_PER_PAGE
+        return [snapshot.question(position) for position in members[start:start + QUESTIONS_PER_PAGE]], {}
+
+    direction, question_id = 'after', None
+    if args['cursor']:
+        try:
+            direction, question_id = decode_cursor(args['cursor'])
+        except (ValueError, TypeError):
+            abort(422)
+    if direction == 'after':
+        start = bisect.bisect_right(ids, question_id) if question_id is not None else 0
+        end = min(start + QUESTIONS_PER_PAGE, len(ids))
+        has_next, has_prev = end < len(ids), question_id is not None
+    else:
+        end = bisect.bisect_left(ids, question_id)
+        start = max(end - QUESTIONS_PER_PAGE, 0)
+        has_next, has_prev = True, start > 0
+    rows = [snapshot.question(position) for position in members[start:end]]
+    return rows, {
+        'next_cursor': encode_cursor('after', rows[-1]['id']) if rows and has_next else None,
+        'prev_cursor': encode_cursor('before', rows[0]['id']) if rows and has_prev else None
+    }
+
+"""
+create_snapshot_app(path, test_config)
+    the read-only app over the snapshot at `path`, which is checked for
+    replacement every SNAPSHOT_CHECK_INTERVAL seconds.
+"""
+def create_snapshot_app(path, test_config=None):
+    app = Flask(__name__)
+    app.config.from_mapping(test_config or {})
+    init_instrumentation(app)
+    CORS(app, resources={'/': {'origins': '*'}})
+    interval = float(os.environ.get('SNAPSHOT_CHECK_INTERVAL', SNAPSHOT_CHECK_INTERVAL))
+    snapshots = SnapshotHolder(path, interval)
+
+    @app.after_request
+    def after_request(response):
+        response.headers.add('Access-Control-Allow-Headers', 'Content-Type, Authorization')
+        response.headers.add('Access-Control-Allow-Headers', 'GET, POST, PATCH, DELETE, OPTIONS')
+        if request.method == 'GET' and response.status_code == 200:
+            response.set_etag(snapshots.current().etag)
+            response.make_conditional(request)
+        return response
+
+    @app.route('/questions')
+    def get_questions():
+        snapshot = snapshots.current()
+        questions, cursors = page_of(snapshot, snapshot.members(), request.args)
+        if len(questions) == 0:
+            abort(404)
+        return json_response({
+            'success': True,
+            'questions': questions,
+            'total_questions': snapshot.total,
+            'categories': snapshot.categories(),
+            **cursors
+        })
+
+    @app.route('/categories')
+    def get_categories():
+        snapshot = snapshots.current()
+        categories = snapshot.categories()
+        if len(categories) == 0:
+            abort(404)
+        return jsonify({
+            'success': True,
+            'categories': categories,
+            'question_counts': snapshot.counts()
+        })
+
+    @app.route('/categories/<int:category_id>/questions')
+    def get_categories_questions(category_id):
+        snapshot = snapshots.current()
+        current = snapshot.categories().get(category_id)
+        if current is None:
+            abort(404)
+        members = snapshot.members(category_id)
+        try:
+            questions, cursors = page_of(snapshot, members, request.args)
+        except HTTPException:
+            raise
+        except Exception:
+            abort(404)
+        return json_response({
+            'success': True,
+            'questions': questions,
+            'Total_Questions_category': len(members),
+            'current_cat': current,
+            **cursors
+        })
+
+    @app.route('/quizzes', methods=['POST'])
+    def play_trivia():
+        snapshot = snapshots.current()
+        try:
+            body = request.get_json()
+            quiz_category = body.get('quiz_category')
+            previous_questions = body.get('previous_questions')
+            if (quiz_category or previous_questions) == None:
+                abort(422)
+            category = ALL_CATEGORIES if quiz_category['type'] == 'click' else int(quiz_category['id'])
+            difficulty = target_difficulty(body.get('difficulty'))
+            count = body.get('count', 1)
+            if not isinstance(count, int) or isinstance(count, bool) or count < 1:
+                abort(422)
+            chosen = draw_quiz(snapshot, category, previous_questions, min(count, QUIZ_PREFETCH_LIMIT), difficulty)
+            questions = [snapshot.question(snapshot.position(question_id)) for question_id in chosen]
+        except Exception:
+            abort(422)
+        payload = {'success': True, 'question': questions[0] if questions else None}
+        if 'count' in body:
+            payload['questions'] = questions
+        return json_response(payload)
+
+    @app.errorhandler(404)
+    def not_found(error):
+        return jsonify({'success': False, 'error': 404, 'message': 'Data not found'}), 404
+
+    @app.errorhandler(422)
+    def unprocessed(error):
+        return jsonify({'success': False, 'error': 404, 'message': 'The request can not be processed'}), 422
+
+    return app
@@ -0,0 +1,188 @@
+import bisect
+import heapq
+import os
+import sys
+import threading
+
+from models import db, Question
+from changes import on_commit, on_reload
+from search import tokenize
+from instrumentation import registry, Gauge
+
+SUGGEST_LIMIT = 8
+SUGGEST_MAX_LIMIT = 20
+SUGGEST_MAX_BYTES = 64 * 1024 * 1024
+SUGGEST_TITLE_CHARS = 120
+# top terms are cached for prefixes up to this length, whose ranges are the widest
+CACHED_PREFIX_LENGTH = 2
+
+"""
+SuggestIndex
+    in-process prefix index for search-as-you-type over question text
+    (answers are never suggested). Two sorted arrays answer a prefix
+    with a binary search: the distinct terms, ranked by how many
+    questions use them, and the lower-cased question titles, completed
+    in alphabetical order.
+
+    Memory is estimated as entries are added. Once the estimate reaches
+    `max_bytes`, new titles are no longer indexed (terms still are, the
+    vocabulary grows slowly) and are counted in skipped_titles until the
+    next rebuild.
+"""
+class SuggestIndex:
+
+    def __init__(self, max_bytes=SUGGEST_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.ready = False
+        self._clear()
+
+    def _clear(self):
+        self._terms = []
+        self._frequency = {}
+        self._titles = []
+        self._title_of = {}
+        self._top_terms = {}
+        self.bytes = 0
+        self.skipped_titles = 0
+
+    def rebuild(self, batch_size=10000):
+        rows = db.session.query(Question.id, Question.question).order_by(Question.id).yield_per(batch_size)
+        with self._lock:
+            self._clear()
+            for question_id, question in rows:
+                self._add(question_id, question, sort=False)
+            self._terms.sort()
+            self._titles.sort()
+            self.ready = True
+
+    def add(self, question):
+        with self._lock:
+            self._add(question['id'], question['question'])
+
+    def remove(self, question):
+        with self._lock:
+            self._remove(question['id'], question['question'])
+
+    def _add(self, question_id, text, sort=True):
+        for term in set(tokenize(text)):
+            if term not in self._frequency:
+                self._frequency[term] = 0
+                if sort:
+                    bisect.insort(self._terms, term)
+                else:
+                    self._terms.append(term)
+                self.bytes += term_cost(term)
+            self._frequency[term] += 1
+            self._forget(term)
+
+        title = (text or '').strip()[:SUGGEST_TITLE_CHARS]
+        if not title or question_id in self._title_of:
+            return
+        if self.bytes + title_cost(title) > self.max_bytes:
+            self.skipped_titles += 1
+            return
+        entry = (title.lower(), question_id)
+        if sort:
+            bisect.insort(self._titles, entry)
+        else:
+            self._titles.append(entry)
+        self._title_of[question_id] = title
+        self.bytes += title_cost(title)
+
+    def _remove(self, question_id, text):
+        for term in set(tokenize(text)):
+            count = self._frequency.get(term)
+            if not count:
+                continue
+            if count == 1:
+                del self._frequency[term]
+                del self._terms[bisect.bisect_left(self._terms, term)]
+                self.bytes -= term_cost(term)
+            else:
+                self._frequency[term] = count - 1
+            self._forget(term)
+
+        title = self._title_of.pop(question_id, None)
+        if title is not None:
+            entry = (title.lower(), question_id)
+            index = bisect.bisect_left(self._titles, entry)
+            if index < len(self._titles) and self._titles[index] == entry:
+                del self._titles[index]
+            self.bytes -= title_cost(title)
+
+    def _forget(self, term):
+        for length in range(1, CACHED_PREFIX_LENGTH + 1):
+            self._top_terms.pop(term[:length], None)
+
+    def _rank_terms(self, prefix, limit):
+        start = bisect.bisect_left(self._terms, prefix)
+        end = bisect.bisect_left(self._terms, prefix_end(prefix))
+        # nlargest is stable, so equally frequent terms stay in alphabetical order
+        return heapq.nlargest(limit, self._terms[start:end], key=self._frequency.__getitem__)
+
+    def _top(self, prefix, limit):
+        if len(prefix) > CACHED_PREFIX_LENGTH:
+            return self._rank_terms(prefix, limit)
+        top = self._top_terms.get(prefix)
+        if top is None:
+            top = self._top_terms[prefix] = self._rank_terms(prefix, SUGGEST_MAX_LIMIT)
+        return top[:limit]
+
+    """
+    suggest(prefix, limit)
+        up to `limit` completions of the last word of `prefix`, and up to
+        `limit` (id, title) pairs of questions whose text starts with it.
+    """
+    def suggest(self, prefix, limit=SUGGEST_LIMIT):
+        tokens = tokenize(prefix)
+        typed = prefix.lower().lstrip()
+        if not tokens:
+            return [], []
+        with self._lock:
+            terms = self._top(tokens[-1], limit) if typed.endswith(tokens[-1]) else []
+            questions = []
+            index = bisect.bisect_left(self._titles, (typed,))
+            while len(questions) < limit and index < len(self._titles) and self._titles[index][0].startswith(typed):
+                question_id = self._titles[index][1]
+                questions.append((question_id, self._title_of[question_id]))
+                index += 1
+        return terms, questions
+
+
+def prefix_end(prefix):
+    # the smallest string greater than every string starting with `prefix`
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def term_cost(term):
+    # the string, its list slot and its frequency entry
+    return sys.getsizeof(term) + 8 + 100
+
+
+def title_cost(title):
+    # the title and its lower-cased copy, the (title, id) tuple and list slot, the id -> title entry
+    return 2 * sys.getsizeof(title) + 64 + 8 + 100
+
+
+suggest_index = SuggestIndex(int(os.environ.get('SUGGEST_MAX_BYTES', SUGGEST_MAX_BYTES)))
+registry.register(Gauge('trivia_suggest_index_bytes', 'Estimated memory used by the suggest index.',
+                        collect=lambda: suggest_index.bytes))
+registry.register(Gauge('trivia_suggest_skipped_titles', 'Titles left out of the suggest index by its memory budget.',
+                        collect=lambda: suggest_index.skipped_titles))
+
+
+@on_commit
+def update_suggest_index(changes):
+    if not suggest_index.ready:
+        return
+    for question in changes.questions_removed:
+        suggest_index.remove(question)
+    for question in changes.questions_added:
+        suggest_index.add(question)
+
+
+@on_reload
+def reload_suggest_index():
+    if suggest_index.ready:
+        suggest_index.rebuild()
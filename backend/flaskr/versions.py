@@ -0,0 +1,56 @@
+import secrets
+import threading
+import time
+
+from changes import on_commit, on_reload
+
+"""
+DataVersions
+    per-table change counters, bumped whenever a committed transaction
+    touches questions or categories. ETags are built from the epoch of
+    this process plus the versions of the tables a response depends on,
+    so they can be checked without querying the database. The epoch
+    keeps two workers from ever sharing an ETag for different data.
+    Writes made by other workers bump the counters once the change feed
+    replays them (see changes.py), so an ETag can be answered with a
+    304 for at most about CHANGE_SYNC_INTERVAL seconds after it went
+    stale.
+"""
+class DataVersions:
+
+    def __init__(self, tables=('questions', 'categories')):
+        self.epoch = secrets.token_hex(4)
+        self._lock = threading.Lock()
+        now = time.time()
+        self._versions = {table: 0 for table in tables}
+        self._modified = {table: now for table in tables}
+
+    def bump(self, table):
+        with self._lock:
+            self._versions[table] += 1
+            self._modified[table] = time.time()
+
+    def version(self, table):
+        return self._versions[table]
+
+    def etag(self, tables):
+        return '-'.join([self.epoch] + ['%s%d' % (table[0], self._versions[table]) for table in tables])
+
+    def last_modified(self, tables):
+        return max(self._modified[table] for table in tables)
+
+
+data_versions = DataVersions()
+
+
+@on_commit
+def bump_versions(changes):
+    if changes.questions_added or changes.questions_removed:
+        data_versions.bump('questions')
+    if changes.categories_changed:
+        data_versions.bump('categories')
+
+
+@on_reload
+def bump_question_version():
+    data_versions.bump('questions')
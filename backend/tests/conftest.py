@@ -0,0 +1,74 @@
+import os
+import sys
+
+import pytest
+
+# the app's modules import each other by bare name, as when run from flaskr/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'flaskr'))
+
+from app import create_app
+from models import db, Category, Question
+
+CATEGORIES = ('Science', 'Art', 'Geography', 'History', 'Entertainment', 'Sports')
+
+# (question, answer, category, difficulty)
+QUESTIONS = [
+    ('What is the heaviest organ in the human body?', 'The Liver', 1, 4),
+    ('Who discovered penicillin?', 'Alexander Fleming', 1, 3),
+    ('Hematology is a branch of medicine involving the study of what?', 'Blood', 1, 4),
+    ('Which Dutch graphic artist was a creator of optical illusions?', 'Escher', 2, 1),
+    ('La Giaconda is better known as what?', 'Mona Lisa', 2, 3),
+    ('Which American artist was a pioneer of Abstract Expressionism?', 'Jackson Pollock', 2, 2),
+    ('What is the largest lake in Africa?', 'Lake Victoria', 3, 2),
+    ('In which royal palace would you find the Hall of Mirrors?', 'The Palace of Versailles', 3, 3),
+    ('The Taj Mahal is located in which Indian city?', 'Agra', 3, 2),
+    ('Whose autobiography is entitled I Know Why the Caged Bird Sings?', 'Maya Angelou', 4, 2),
+    ('What boxer was known as Cassius Clay?', 'Muhammad Ali', 4, 1),
+    ('Which country won the first ever soccer World Cup in 1930?', 'Uruguay', 6, 4),
+]
+
+# settings a developer's shell might carry into the suite
+ISOLATED_SETTINGS = (
+    'DATABASE_URL', 'DATABASE_REPLICA_URLS', 'SNAPSHOT_PATH', 'RESPONSE_CACHE', 'DEDUP_MODE', 'SEARCH_BACKEND',
+    'ADMISSION', 'ADMISSION_LIMITS', 'ADMISSION_QUEUE_SIZE', 'ADMISSION_QUEUE_TIMEOUT', 'ADMISSION_TRUST_PROXY',
+    'RATE_LIMIT_PER_SECOND', 'RATE_LIMIT_BURST', 'DB_POOL', 'PROFILE_TOKEN', 'PROFILE_SAMPLE_RATE'
+)
+
+
+@pytest.fixture
+def make_app(tmp_path, monkeypatch):
+    # builds an app over a fresh, seeded SQLite database; `env` is applied before create_app()
+    def build(env=None, **config):
+        for name in ISOLATED_SETTINGS:
+            monkeypatch.delenv(name, raising=False)
+        # sync the change feed on every request
+        monkeypatch.setenv('CHANGE_SYNC_INTERVAL', '0')
+        for name, value in (env or {}).items():
+            monkeypatch.setenv(name, value)
+        config.setdefault('SQLALCHEMY_DATABASE_URI', 'sqlite:///%s' % (tmp_path / 'trivia.db'))
+        config.setdefault('TESTING', True)
+        app = create_app(config)
+        with app.app_context():
+            db.session.add_all([Category(name) for name in CATEGORIES])
+            db.session.commit()
+            db.session.add_all([Question(*row) for row in QUESTIONS])
+            db.session.commit()
+            db.session.remove()
+        return app
+    return build
+
+
+@pytest.fixture
+def app(make_app):
+    return make_app()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def quiz_body(category=None, previous=(), **fields):
+    # a POST /quizzes body for one category id, or for all categories
+    quiz_category = {'type': 'click', 'id': 0} if category is None else {'type': 'Category', 'id': category}
+    return dict(fields, quiz_category=quiz_category, previous_questions=list(previous))
@@ -0,0 +1,140 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from admission import AsyncConcurrencyLimit, ConcurrencyLimit, RateLimiter, client_key, parse_limits, retry_after
+
+from conftest import quiz_body
+
+
+def test_rate_limiter_spends_and_refills_tokens():
+    limiter = RateLimiter(rate=2.0, burst=3)
+    assert [limiter.take('client', now=0.0) for _ in range(3)] == [0, 0, 0]
+    assert limiter.take('client', now=0.0) == pytest.approx(0.5)
+    assert limiter.take('client', now=0.5) == 0
+    # a full bucket does not keep filling
+    assert [limiter.take('client', now=100.0) for _ in range(4)][-1] > 0
+    assert limiter.take('someone else', now=0.5) == 0
+
+
+def test_rate_limiter_forgets_least_recent_clients():
+    limiter = RateLimiter(rate=1.0, burst=1, max_clients=2)
+    limiter.take('first', now=0.0)
+    limiter.take('second', now=0.0)
+    limiter.take('first', now=0.0)
+    limiter.take('third', now=0.0)
+    assert len(limiter) == 2
+    # 'second' was evicted and comes back with a full bucket
+    assert limiter.take('second', now=0.0) == 0
+
+
+def test_concurrency_limit_queues_then_sheds():
+    limit = ConcurrencyLimit('test', 1, queue_size=1, timeout=5)
+    assert limit.acquire() is None
+    outcomes = []
+    waiter = threading.Thread(target=lambda: outcomes.append(limit.acquire()))
+    waiter.start()
+    while not limit.waiting:
+        time.sleep(0.001)
+    assert limit.acquire() == 'queue_full'
+    limit.release()
+    waiter.join()
+    assert outcomes == [None]
+    assert limit.in_flight == 1
+
+
+def test_concurrency_limit_times_out():
+    limit = ConcurrencyLimit('test', 1, queue_size=4, timeout=0.01)
+    assert limit.acquire() is None
+    assert limit.acquire() == 'timeout'
+    assert limit.waiting == 0
+    limit.release()
+    assert limit.in_flight == 0
+
+
+def test_async_limit_hands_slots_to_the_oldest_waiter():
+    async def scenario():
+        limit = AsyncConcurrencyLimit('test', 1, queue_size=2, timeout=1)
+        order = []
+
+        async def request(name):
+            if await limit.acquire() is None:
+                order.append(name)
+                await asyncio.sleep(0)
+                limit.release()
+
+        assert await limit.acquire() is None
+        waiters = [asyncio.ensure_future(request(name)) for name in ('first', 'second')]
+        await asyncio.sleep(0)
+        assert await limit.acquire() == 'queue_full'
+        limit.release()
+        await asyncio.gather(*waiters)
+        return order, limit.in_flight
+
+    assert asyncio.run(scenario()) == (['first', 'second'], 0)
+
+
+def test_async_limit_times_out():
+    async def scenario():
+        limit = AsyncConcurrencyLimit('test', 1, queue_size=2, timeout=0.01)
+        await limit.acquire()
+        return await limit.acquire(), limit.waiting
+
+    assert asyncio.run(scenario()) == ('timeout', 0)
+
+
+def test_parse_limits():
+    defaults = {'play_trivia': 16, 'next_quiz_question': 16}
+    assert parse_limits('', defaults) == defaults
+    assert parse_limits(' play_trivia=4, next_quiz_question=0 ,', defaults) == {'play_trivia': 4, 'next_quiz_question': 0}
+    with pytest.raises(ValueError):
+        parse_limits('get_categories=4', defaults)
+    with pytest.raises(ValueError):
+        parse_limits('play_trivia=many', defaults)
+
+
+def test_client_key_only_trusts_a_proxy_when_told():
+    assert client_key('10.0.0.1', '203.0.113.9, 10.0.0.1', False) == '10.0.0.1'
+    assert client_key('10.0.0.1', '203.0.113.9, 10.0.0.1', True) == '203.0.113.9'
+    assert client_key('10.0.0.1', None, True) == '10.0.0.1'
+    assert client_key(None, None, False) == 'unknown'
+
+
+def test_retry_after():
+    assert retry_after('rate_limited', 0.2) == 1
+    assert retry_after('rate_limited', 2.5) == 3
+    assert retry_after('timeout') in (1, 2)
+
+
+def test_rate_limit_is_off_by_default(client):
+    for _ in range(60):
+        assert client.post('/quizzes', json=quiz_body()).status_code == 200
+
+
+def test_rate_limit_returns_429(make_app):
+    client = make_app({'RATE_LIMIT_PER_SECOND': '0.001', 'RATE_LIMIT_BURST': '2'}).test_client()
+    assert client.post('/quizzes', json=quiz_body()).status_code == 200
+    assert client.post('/quizzes/sessions', json=quiz_body()).status_code == 200
+    response = client.post('/quizzes', json=quiz_body())
+    assert response.status_code == 429
+    assert response.get_json() == {'success': False, 'error': 429, 'message': 'Too many requests, slow down'}
+    assert int(response.headers['Retry-After']) >= 1
+    # endpoints without admission control are never limited
+    assert client.get('/categories').status_code == 200
+
+
+def test_rate_limit_tells_proxied_clients_apart(make_app):
+    client = make_app({'RATE_LIMIT_PER_SECOND': '0.001', 'RATE_LIMIT_BURST': '1',
+                       'ADMISSION_TRUST_PROXY': '1'}).test_client()
+    for address in ('203.0.113.1', '203.0.113.2'):
+        headers = {'X-Forwarded-For': address}
+        assert client.post('/quizzes', json=quiz_body(), headers=headers).status_code == 200
+    assert client.post('/quizzes', json=quiz_body(), headers={'X-Forwarded-For': '203.0.113.1'}).status_code == 429
+
+
+def test_admission_off_disables_the_rate_limit(make_app):
+    client = make_app({'ADMISSION': 'off', 'RATE_LIMIT_PER_SECOND': '0.001', 'RATE_LIMIT_BURST': '1'}).test_client()
+    for _ in range(3):
+        assert client.post('/quizzes', json=quiz_body()).status_code == 200
@@ -0,0 +1,197 @@
+import pytest
+from sqlalchemy import event
+
+from models import db, AnswerEvent, AnswerWatermark, Question
+from answers import AnswerPipeline, aggregate_answers, answer_pipeline, calibrated_difficulty, claim_events, \
+    parse_answers, ANSWER_BATCH_LIMIT
+from changes import change_feed
+from versions import data_versions
+
+from conftest import quiz_body
+
+
+def log_answers(app, question_id, correct, wrong, recorded_at=0.0):
+    # answer events as a flush would have written them
+    with app.app_context():
+        db.session.execute(AnswerEvent.__table__.insert(), [
+            {'question_id': question_id, 'correct': number < correct, 'answered_at': recorded_at,
+             'recorded_at': recorded_at} for number in range(correct + wrong)])
+        db.session.commit()
+
+
+def difficulty_of(app, question_id):
+    with app.app_context():
+        return Question.query.get(question_id).difficulty
+
+
+@pytest.fixture
+def pipeline(app, monkeypatch):
+    # the shared pipeline without its background threads, flushed by hand
+    monkeypatch.setattr(answer_pipeline, 'start', lambda: None)
+    monkeypatch.setattr(answer_pipeline, '_events', [])
+    return answer_pipeline
+
+
+def test_parse_answers():
+    events = parse_answers({'question_id': 4, 'correct': True})
+    assert [(event['question_id'], event['correct']) for event in events] == [(4, True)]
+    events = parse_answers({'answers': [{'question_id': 1, 'correct': False}, {'question_id': 2, 'correct': True}]})
+    assert [event['question_id'] for event in events] == [1, 2]
+    assert events[0]['answered_at'] == events[1]['answered_at']
+
+
+@pytest.mark.parametrize('body', [
+    None,
+    [{'question_id': 1, 'correct': True}],
+    {'answers': []},
+    {'answers': {'question_id': 1, 'correct': True}},
+    {'answers': [{'question_id': 1, 'correct': True}] * (ANSWER_BATCH_LIMIT + 1)},
+    {'answers': [{'question_id': 1, 'correct': True}, 'wrong']},
+    {'question_id': '1', 'correct': True},
+    {'question_id': True, 'correct': True},
+    {'question_id': 1, 'correct': 1},
+    {'question_id': 1}
+])
+def test_parse_answers_refuses_malformed_bodies(body):
+    with pytest.raises(ValueError):
+        parse_answers(body)
+
+
+@pytest.mark.parametrize('answers, correct, current, expected', [
+    (19, 19, None, None),
+    (20, 20, None, 1),
+    (20, 16, None, 1),
+    (20, 15, None, 2),
+    (20, 8, None, 3),
+    (20, 0, None, 5),
+    # a difficulty outside 1..5 is replaced by the matching one
+    (20, 0, 0, 5),
+    (20, 20, 9, 1),
+    # hovering at an edge keeps the current difficulty
+    (100, 82, 2, 2),
+    (100, 57, 2, 2),
+    (100, 86, 2, 1),
+    (100, 54, 2, 3),
+    (100, 3, 5, 5)
+])
+def test_calibrated_difficulty(answers, correct, current, expected):
+    assert calibrated_difficulty(answers, correct, 20, current) == expected
+
+
+def test_answers_are_buffered_then_flushed(client, app, pipeline):
+    response = client.post('/answers', json={'answers': [{'question_id': 1, 'correct': True},
+                                                         {'question_id': 2, 'correct': False}]})
+    assert response.status_code == 202 and response.get_json() == {'success': True, 'accepted': 2}
+    assert client.post('/answers', json={'question_id': 'one'}).status_code == 422
+    assert len(pipeline) == 2
+    with app.app_context():
+        assert AnswerEvent.query.count() == 0
+
+    assert pipeline.flush() == 2
+    assert pipeline.flush() == 0
+    with app.app_context():
+        assert sorted((row.question_id, row.correct) for row in AnswerEvent.query) == [(1, True), (2, False)]
+
+
+def test_full_buffer_answers_503(client, pipeline, monkeypatch):
+    monkeypatch.setattr(pipeline, 'buffer_limit', 1)
+    assert client.post('/answers', json={'question_id': 1, 'correct': True}).status_code == 202
+    response = client.post('/answers', json={'question_id': 2, 'correct': True})
+    assert response.status_code == 503 and response.get_json()['error'] == 503
+
+
+def test_failed_flush_keeps_its_events(app, monkeypatch):
+    pipeline = AnswerPipeline()
+    pipeline.configure(app)
+    monkeypatch.setattr(pipeline, 'start', lambda: None)
+    pipeline.buffer_limit = 3
+    pipeline.record(parse_answers({'answers': [{'question_id': 1, 'correct': True}, {'question_id': 2, 'correct': True}]}))
+
+    def fail(*args, **kwargs):
+        # the events have been taken out of the buffer by now, so more can arrive
+        pipeline.record(parse_answers({'answers': [{'question_id': 3, 'correct': True}] * 2}))
+        raise RuntimeError('database is down')
+    monkeypatch.setattr(db.session, 'execute', fail)
+    assert pipeline.flush() == 0
+    # older events first, as far as the buffer has room
+    assert [event['question_id'] for event in pipeline._events] == [1, 3, 3]
+
+    monkeypatch.undo()
+    assert pipeline.flush() == 3
+    with app.app_context():
+        assert AnswerEvent.query.count() == 3
+
+
+def test_claims_move_the_watermark(app):
+    log_answers(app, 1, 3, 0)
+    with app.app_context():
+        assert claim_events(2, 0) == (0, 2)
+        db.session.commit()
+        assert claim_events(100, 0) == (2, 3)
+        db.session.commit()
+        assert claim_events(100, 0) is None
+        db.session.rollback()
+    # events still settling wait for a later run
+    log_answers(app, 1, 1, 0, recorded_at=4102444800.0)
+    with app.app_context():
+        assert claim_events(100, 5) is None
+        db.session.rollback()
+
+
+def test_two_aggregators_cannot_claim_the_same_range(app):
+    log_answers(app, 1, 5, 0)
+    with app.app_context():
+        assert claim_events(100, 0) == (0, 5)
+        db.session.rollback()
+        engine = db.engine
+        other_worker = engine.connect()
+        moved = []
+
+        # the other worker claims the range between this one's read of the watermark and its update
+        def claim_first(connection, cursor, statement, parameters, context, executemany):
+            if statement.startswith('UPDATE answer_watermark') and not moved:
+                moved.append(True)
+                other_worker.execute(AnswerWatermark.__table__.update().values(last_event_id=5))
+        event.listen(engine, 'before_cursor_execute', claim_first)
+        try:
+            assert claim_events(100, 0) is None
+            assert moved
+            db.session.rollback()
+        finally:
+            event.remove(engine, 'before_cursor_execute', claim_first)
+            other_worker.close()
+        assert aggregate_answers(settle=0)['events'] == 0
+
+
+def test_aggregation_rolls_up_and_recalibrates(client, app):
+    log_answers(app, 2, 20, 0)
+    log_answers(app, 4, 3, 1)
+    versions = data_versions.version('questions')
+    with app.app_context():
+        assert aggregate_answers(settle=0) == {'events': 24, 'questions': 2, 'recalibrated': 1}
+        assert aggregate_answers(settle=0) == {'events': 0, 'questions': 0, 'recalibrated': 0}
+    assert client.get('/questions/2/stats').get_json() == {
+        'success': True, 'difficulty': 1, 'question_id': 2, 'answers': 20, 'correct': 20, 'correct_rate': 1.0}
+    # too few answers to move question 4
+    assert client.get('/questions/4/stats').get_json()['difficulty'] == 1
+    assert data_versions.version('questions') == versions + 1
+    assert client.post('/quizzes', json=quiz_body(1, difficulty=1)).get_json()['question']['id'] == 2
+
+
+def test_aggregation_without_difficulty_changes_keeps_the_versions(client, app):
+    # question 2 is already difficulty 3, which a 45% correct rate confirms
+    log_answers(app, 2, 9, 11)
+    etag = client.get('/questions').headers['ETag']
+    with app.app_context():
+        head = change_feed.head()
+        assert aggregate_answers(settle=0) == {'events': 20, 'questions': 1, 'recalibrated': 0}
+        assert change_feed.head() == head
+    assert client.get('/questions', headers={'If-None-Match': etag}).status_code == 304
+    assert difficulty_of(app, 2) == 3
+
+
+def test_recalibration_can_be_turned_off(app):
+    log_answers(app, 2, 20, 0)
+    result = app.test_cli_runner().invoke(args=['aggregate-answers', '--settle', '0', '--no-recalibrate'])
+    assert 'aggregated 20 answers to 1 questions, recalibrated 0' in result.output
+    assert difficulty_of(app, 2) == 3
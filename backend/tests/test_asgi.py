@@ -0,0 +1,153 @@
+import asyncio
+import json
+
+import pytest
+
+from asgi import TriviaAsgi
+
+from conftest import quiz_body
+
+
+@pytest.fixture(params=['threads', 'aiosqlite'])
+def asgi_app(request, make_app, monkeypatch):
+    if request.param == 'aiosqlite':
+        pytest.importorskip('aiosqlite')
+    monkeypatch.setenv('ASYNC_DB_DRIVER', request.param)
+    app = make_app()
+    return app, TriviaAsgi(app, threads=4)
+
+
+async def call(asgi, method, path, body=None, content_type='application/json'):
+    if body is not None and not isinstance(body, bytes):
+        body = json.dumps(body).encode()
+    headers = [(b'content-type', content_type.encode())] if body is not None else []
+    scope = {'type': 'http', 'method': method, 'path': path, 'query_string': b'', 'headers': headers,
+             'client': ('127.0.0.1', 5000), 'server': ('testserver', 80)}
+    # the body arrives in two parts, as a server may hand it over
+    parts = [body[:3], body[3:]] if body else [b'']
+    messages = [{'type': 'http.request', 'body': part, 'more_body': index < len(parts) - 1}
+                for index, part in enumerate(parts)]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    await asgi(scope, receive, send)
+    content = b''.join(message.get('body', b'') for message in sent[1:])
+    return sent[0]['status'], dict(sent[0]['headers']), content
+
+
+async def call_json(asgi, method, path, body=None, **kwargs):
+    status, _, content = await call(asgi, method, path, body, **kwargs)
+    return status, json.loads(content)
+
+
+def run(asgi, scenario):
+    # one event loop for the whole scenario, so the store is opened and closed on it
+    async def main():
+        await asgi.open_store()
+        try:
+            return await scenario()
+        finally:
+            await asgi.store.close()
+    return asyncio.run(main())
+
+
+def test_quiz_draws_through_the_async_store(asgi_app):
+    app, asgi = asgi_app
+
+    async def scenario():
+        status, payload = await call_json(asgi, 'POST', '/quizzes', quiz_body(2, previous=[4, 5]))
+        assert status == 200 and payload['question'] == {
+            'id': 6, 'question': 'Which American artist was a pioneer of Abstract Expressionism?',
+            'answer': 'Jackson Pollock', 'category': 2, 'difficulty': 2}
+        assert (await call_json(asgi, 'POST', '/quizzes', quiz_body(2, previous=[4, 5, 6])))[1]['question'] is None
+        _, round = await call_json(asgi, 'POST', '/quizzes', quiz_body(1, previous=[2], count=10))
+        assert sorted(question['id'] for question in round['questions']) == [1, 3]
+        assert (await call_json(asgi, 'POST', '/quizzes', quiz_body(count=True)))[0] == 422
+    run(asgi, scenario)
+
+
+def test_sessions_deal_through_the_async_store(asgi_app):
+    app, asgi = asgi_app
+
+    async def scenario():
+        status, created = await call_json(asgi, 'POST', '/quizzes/sessions', quiz_body(3))
+        assert status == 200 and created['total_questions'] == 3
+        path = '/quizzes/sessions/%s/next' % created['session_id']
+        drawn = []
+        for remaining in (2, 1, 0):
+            _, round = await call_json(asgi, 'POST', path)
+            assert round['remaining'] == remaining
+            drawn.append(round['question']['id'])
+        assert sorted(drawn) == [7, 8, 9]
+        assert (await call_json(asgi, 'POST', path))[1]['question'] is None
+        # deleting goes through Flask, which shares the session store
+        assert (await call(asgi, 'DELETE', '/quizzes/sessions/%s' % created['session_id']))[0] == 200
+        assert await call_json(asgi, 'POST', path) == (404, {'success': False, 'error': 404, 'message': 'Data not found'})
+    run(asgi, scenario)
+
+
+@pytest.mark.parametrize('path, body, content_type', [
+    ('/quizzes', None, 'application/json'),
+    ('/quizzes', b'{"quiz_category": ', 'application/json'),
+    ('/quizzes', quiz_body(), 'text/plain'),
+    ('/quizzes', [1], 'application/json'),
+    ('/quizzes', dict(quiz_body(), previous_questions=5), 'application/json'),
+    ('/quizzes', dict(quiz_body(), count='3'), 'application/json'),
+    ('/quizzes/sessions', b'not json', 'application/json'),
+    ('/quizzes/sessions', {'quiz_category': 'bad'}, 'application/json'),
+    ('/quizzes/sessions', dict(quiz_body(), questions=True), 'application/json'),
+    ('/answers', {'answers': 'none'}, 'application/json'),
+    ('/answers', b'[', 'application/json')
+])
+def test_malformed_bodies_answer_like_flask(asgi_app, path, body, content_type):
+    app, asgi = asgi_app
+    if body is None or isinstance(body, bytes):
+        expected = app.test_client().post(path, data=body, content_type=content_type)
+    else:
+        expected = app.test_client().post(path, data=json.dumps(body), content_type=content_type)
+    status, headers, content = run(asgi, lambda: call(asgi, 'POST', path, body, content_type=content_type))
+    assert status == expected.status_code and status in (400, 422)
+    if status == 422:
+        assert json.loads(content) == expected.get_json()
+    assert headers[b'access-control-allow-origin'] == b'*'
+
+
+def test_other_routes_run_flask_through_the_bridge(asgi_app):
+    app, asgi = asgi_app
+    client = app.test_client()
+
+    async def scenario():
+        status, headers, content = await call(asgi, 'GET', '/questions')
+        expected = client.get('/questions')
+        assert status == 200 and headers[b'etag'] == expected.headers['ETag'].encode()
+        assert json.loads(content) == expected.get_json()
+        assert (await call(asgi, 'GET', '/questions/999/stats'))[0] == 404
+
+        # a write through the bridge reaches the coroutines' id index
+        status, created = await call_json(asgi, 'POST', '/questions', {
+            'question': 'Which planet is known as the Red Planet?', 'answer': 'Mars', 'category': 6, 'difficulty': 1})
+        assert status == 200
+        _, round = await call_json(asgi, 'POST', '/quizzes', quiz_body(6, previous=[12]))
+        assert round['question']['id'] == created['New_question_ID']
+    run(asgi, scenario)
+
+
+def test_lifespan_opens_and_closes_the_store(asgi_app):
+    app, asgi = asgi_app
+    messages = [{'type': 'lifespan.startup'}, {'type': 'lifespan.shutdown'}]
+    replies = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        replies.append(message['type'])
+
+    asyncio.run(asgi({'type': 'lifespan'}, receive, send))
+    assert replies == ['lifespan.startup.complete', 'lifespan.shutdown.complete']
+    assert asgi.store is not None
@@ -0,0 +1,67 @@
+import pytest
+
+from conftest import QUESTIONS
+
+
+def test_batch_create_reports_each_item(client):
+    response = client.post('/questions/batch', json={'questions': [
+        {'question': 'What is the capital of Peru?', 'answer': 'Lima', 'category': 3, 'difficulty': 2},
+        {'question': 'Missing answer?', 'category': 3, 'difficulty': 2},
+        'not an object',
+        {'question': 'Odd difficulty?', 'answer': 'Yes', 'category': 3, 'difficulty': [2]},
+        {'question': 'What is the capital of Chile?', 'answer': 'Santiago', 'category': 3, 'difficulty': 2}
+    ]})
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['created'] == 2
+    assert [result['status'] for result in body['results']] == ['created', 'invalid', 'invalid', 'invalid', 'created']
+    assert body['results'][2]['error'] == 'row is not an object'
+    assert body['total_questions'] == len(QUESTIONS) + 2
+    created = [result['id'] for result in body['results'] if result['status'] == 'created']
+    assert client.get('/categories').get_json()['question_counts']['3'] == 5
+    assert created[-1] in [question['id'] for question in client.get('/questions/search?search=chile').get_json()['Questions']]
+
+
+def test_batch_delete_reports_missing_ids(client):
+    response = client.delete('/questions/batch', json={'ids': [1, 2, 999]})
+    body = response.get_json()
+    assert body['deleted'] == 2
+    assert body['results'] == [
+        {'id': 1, 'status': 'deleted'}, {'id': 2, 'status': 'deleted'}, {'id': 999, 'status': 'not_found'}]
+    assert body['total_questions'] == len(QUESTIONS) - 2
+    assert client.get('/questions/search?search=penicillin').get_json()['Questions'] == []
+
+
+@pytest.mark.parametrize('body', [
+    [1, 2],
+    'questions',
+    {},
+    {'questions': []},
+    {'questions': {'question': 'Why?'}},
+    {'questions': [{}] * 1001}
+])
+def test_batch_create_refuses_malformed_bodies(client, body):
+    response = client.post('/questions/batch', json=body)
+    assert response.status_code == 422
+    assert response.get_json()['success'] is False
+
+
+@pytest.mark.parametrize('body', [[1, 2], {}, {'ids': []}, {'ids': '1,2'}, {'ids': [1, '2']}, {'ids': [1.0]}])
+def test_batch_delete_refuses_malformed_bodies(client, body):
+    assert client.delete('/questions/batch', json=body).status_code == 422
+
+
+@pytest.mark.parametrize('body', [[1, 2], 'question', 7])
+def test_create_question_refuses_non_object_bodies(client, body):
+    assert client.post('/questions', json=body).status_code == 422
+
+
+def test_batch_create_rejects_near_duplicates(make_app):
+    client = make_app({'DEDUP_MODE': 'reject'}).test_client()
+    copy = {'question': 'Who discovered penicillin', 'answer': 'Alexander Fleming', 'category': 1, 'difficulty': 3}
+    body = client.post('/questions/batch', json={'questions': [copy]}).get_json()
+    assert body['results'] == [{'index': 0, 'status': 'duplicate', 'duplicates': [2]}]
+    assert body['created'] == 0
+
+    body = client.post('/questions/batch', json={'questions': [copy], 'allow_duplicate': True}).get_json()
+    assert body['results'][0]['status'] == 'created' and body['results'][0]['duplicates'] == [2]
@@ -0,0 +1,131 @@
+import csv
+import io
+import json
+
+import pytest
+
+from bulk import import_questions, validate_row
+from counts import question_counts
+from dedup import duplicate_index
+from conftest import QUESTIONS
+
+CATEGORIES = {1: 'Science', 2: 'Art'}
+
+
+def ndjson(*rows):
+    return ''.join((row if isinstance(row, str) else json.dumps(row)) + '\n' for row in rows)
+
+
+def test_validate_row_normalizes_fields():
+    row = validate_row({'question': ' Why? ', 'answer': 'Because ', 'category': '2', 'difficulty': 3}, CATEGORIES)
+    assert row == {'question': 'Why?', 'answer': 'Because', 'category': 2, 'difficulty': 3}
+
+
+@pytest.mark.parametrize('row, error', [
+    (['Why?', 'Because', 1, 1], 'row is not an object'),
+    ({'question': '', 'answer': 'Because', 'category': 1, 'difficulty': 1}, 'question and answer are required'),
+    ({'question': 'Why?', 'category': 1, 'difficulty': 1}, 'question and answer are required'),
+    ({'question': ['Why?'], 'answer': 'Because', 'category': 1, 'difficulty': 1}, 'question must be a string'),
+    ({'question': 'Why?', 'answer': 42, 'category': 1, 'difficulty': 1}, 'answer must be a string'),
+    ({'question': 'Why?', 'answer': 'Because', 'category': 'one', 'difficulty': 1}, 'category must be an integer'),
+    ({'question': 'Why?', 'answer': 'Because', 'category': True, 'difficulty': 1}, 'category must be an integer'),
+    ({'question': 'Why?', 'answer': 'Because', 'category': 1, 'difficulty': 1.5}, 'difficulty must be an integer'),
+    ({'question': 'Why?', 'answer': 'Because', 'category': 1}, 'difficulty must be an integer'),
+    ({'question': 'Why?', 'answer': 'Because', 'category': 9, 'difficulty': 1}, 'unknown category 9')
+])
+def test_validate_row_refuses_malformed_rows(row, error):
+    with pytest.raises(ValueError, match=error):
+        validate_row(row, CATEGORIES)
+
+
+def test_import_ndjson_reports_bad_rows(client):
+    body = ndjson(
+        {'question': 'Who painted The Starry Night?', 'answer': 'Vincent van Gogh', 'category': 2, 'difficulty': 2},
+        '{"question": "truncated',
+        '',
+        [1, 2, 3],
+        {'question': 'Who wrote Hamlet?', 'answer': 'Shakespeare', 'category': 9, 'difficulty': 2},
+        {'question': 'What is H2O?', 'answer': 'Water', 'category': '1', 'difficulty': '1'})
+    response = client.post('/questions/import?batch_size=1', data=body, content_type='application/x-ndjson')
+    assert response.status_code == 200
+    stats = response.get_json()
+    assert (stats['inserted'], stats['rejected']) == (2, 3)
+    assert [error['row'] for error in stats['errors']] == [2, 3, 4]
+    assert stats['errors'][2]['error'] == 'unknown category 9'
+    assert stats['total_questions'] == len(QUESTIONS) + 2
+    assert client.get('/questions/suggest?prefix=who painted').get_json()['questions']
+
+
+def test_import_csv(client):
+    body = 'question,answer,category,difficulty\r\n' \
+           '"Who sculpted ""The Thinker""?",Rodin,2,3\r\n' \
+           'No answer,,1,1\r\n'
+    response = client.post('/questions/import', data=body, content_type='text/csv')
+    stats = response.get_json()
+    assert (stats['inserted'], stats['rejected']) == (1, 1)
+    found = client.get('/questions/search?search=thinker').get_json()['Questions']
+    assert [question['answer'] for question in found] == ['Rodin']
+
+
+def test_import_skips_screening_unless_it_rejects(make_app):
+    client = make_app({'DEDUP_MODE': 'flag'}).test_client()
+    rows = [{'question': 'Who discovered penicillin', 'answer': 'Alexander Fleming', 'category': 1, 'difficulty': 3},
+            {'question': 'Who discovered radium?', 'answer': 'Marie Curie', 'category': 1, 'difficulty': 3}]
+    stats = client.post('/questions/import', data=ndjson(*rows), content_type='application/x-ndjson').get_json()
+    assert (stats['inserted'], stats['screened']) == (2, 0)
+    # nothing asked for the duplicate index, so it was never built
+    assert not duplicate_index.ready
+
+
+def test_import_rejects_near_duplicates(make_app):
+    client = make_app({'DEDUP_MODE': 'reject'}).test_client()
+    copy = {'question': 'Who discovered penicillin', 'answer': 'Alexander Fleming', 'category': 1, 'difficulty': 3}
+    fresh = {'question': 'Who discovered radium?', 'answer': 'Marie Curie', 'category': 1, 'difficulty': 3}
+    stats = client.post('/questions/import', data=ndjson(copy, fresh, ['bad']),
+                        content_type='application/x-ndjson').get_json()
+    assert (stats['inserted'], stats['rejected'], stats['screened']) == (1, 2, 2)
+    assert stats['errors'][0] == {'row': 1, 'error': 'duplicate of question 2'}
+
+    stats = client.post('/questions/import?allow_duplicate=true', data=ndjson(copy),
+                        content_type='application/x-ndjson').get_json()
+    assert (stats['inserted'], stats['screened']) == (1, 0)
+
+
+def test_import_refuses_bad_requests(client):
+    assert client.post('/questions/import?format=xml', data='').status_code == 422
+    assert client.post('/questions/import?batch_size=0', data='').status_code == 422
+    response = client.post('/questions/import', data=b'\xff\xfe\n', content_type='application/x-ndjson')
+    assert response.status_code == 422
+
+
+def test_import_function_commits_batches(app):
+    stream = io.StringIO(ndjson(*[
+        {'question': 'Generated %d?' % number, 'answer': 'Yes', 'category': 5, 'difficulty': 1}
+        for number in range(5)]))
+    with app.app_context():
+        stats = import_questions(stream, 'ndjson', batch_size=2)
+        assert stats['inserted'] == 5
+        assert question_counts.count(5) == 5
+
+
+def test_export_ndjson_and_csv(client):
+    lines = client.get('/questions/export').get_data(as_text=True).splitlines()
+    exported = [json.loads(line) for line in lines]
+    assert [question['id'] for question in exported] == list(range(1, len(QUESTIONS) + 1))
+    assert exported[0] == dict(zip(('question', 'answer', 'category', 'difficulty'), QUESTIONS[0]), id=1)
+
+    response = client.get('/questions/export?format=csv')
+    assert response.mimetype == 'text/csv'
+    rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+    assert len(rows) == len(QUESTIONS)
+    assert rows[3]['answer'] == 'Escher'
+
+    assert client.get('/questions/export?format=xml').status_code == 422
+
+
+def test_export_roundtrips_through_import(make_app, tmp_path):
+    exported = make_app().test_client().get('/questions/export').get_data(as_text=True)
+    client = make_app(SQLALCHEMY_DATABASE_URI='sqlite:///%s' % (tmp_path / 'copy.db')).test_client()
+    stats = client.post('/questions/import', data=exported, content_type='application/x-ndjson').get_json()
+    assert stats['inserted'] == len(QUESTIONS)
+    assert stats['total_questions'] == 2 * len(QUESTIONS)
@@ -0,0 +1,93 @@
+import sqlite3
+
+import pytest
+from sqlalchemy import text
+
+from models import db
+from category_migration import add_column, backfill, invalid_rows, is_migrated, question_columns
+
+from test_changes import create
+
+# questions as they were before category became a foreign key
+LEGACY_SCHEMA = ('CREATE TABLE questions (id INTEGER PRIMARY KEY, question VARCHAR, answer VARCHAR, '
+                 'category VARCHAR, difficulty INTEGER)')
+
+
+@pytest.fixture
+def legacy_app(make_app, tmp_path):
+    connection = sqlite3.connect(str(tmp_path / 'trivia.db'))
+    connection.execute(LEGACY_SCHEMA)
+    connection.commit()
+    connection.close()
+    return make_app()
+
+
+def category_ids(client, category_id):
+    return [question['id'] for question in client.get('/categories/%s/questions' % category_id).get_json()['questions']]
+
+
+def stored_categories(app):
+    with app.app_context():
+        return db.session.execute(text('SELECT category, typeof(category) FROM questions ORDER BY id')).fetchall()
+
+
+def test_shadow_column_trigger_and_backfill(legacy_app):
+    with legacy_app.app_context():
+        engine = db.engine
+        assert question_columns(engine)['category']['type'].python_type is str
+        add_column(engine, 'sqlite')
+        # rows written from now on are converted by the trigger
+        engine.execute(text("INSERT INTO questions (question, answer, category, difficulty) "
+                            "VALUES ('Typed?', 'Yes', ' 4', 1)"))
+        assert engine.execute(text('SELECT category_id FROM questions WHERE question = :question'),
+                              question='Typed?').scalar() == 4
+
+        messages = []
+        assert backfill(engine, 'sqlite', 5, 0, messages.append) == 12
+        assert messages[-1] == 'backfilled up to id 13 (12 rows)' and len(messages) == 3
+        assert engine.execute(text('SELECT count(*) FROM questions WHERE category_id IS NULL')).scalar() == 0
+        assert not invalid_rows(engine)
+        # a second run finds nothing left to do
+        assert backfill(engine, 'sqlite', 5, 0, messages.append) == 0
+
+
+def test_migration_swaps_in_the_integer_column(legacy_app):
+    client = legacy_app.test_client()
+    before = create(client, category='2')['New_question_ID']
+    assert category_ids(client, 2) == [4, 5, 6, before]
+    assert stored_categories(legacy_app)[-1] == ('2', 'text')
+
+    result = legacy_app.test_cli_runner().invoke(args=['migrate-category', '--batch-size', '5', '--pause', '0'])
+    assert result.exit_code == 0, result.output
+    assert 'questions.category is now an integer foreign key (13 rows converted)' in result.output
+    with legacy_app.app_context():
+        assert is_migrated(db.engine)
+        columns = question_columns(db.engine)
+        assert 'category_old' in columns and 'category_id' not in columns
+        indexes = db.session.execute(text("SELECT name FROM sqlite_master WHERE type = 'index'")).fetchall()
+        assert ('ix_questions_category_id',) in indexes
+    assert {category_type for _, category_type in stored_categories(legacy_app)} == {'integer'}
+
+    # string category ids still work against the typed column
+    after = create(client, category='2')['New_question_ID']
+    assert category_ids(client, '2') == [4, 5, 6, before, after]
+    assert stored_categories(legacy_app)[-1] == (2, 'integer')
+    assert client.get('/categories').get_json()['question_counts']['2'] == 5
+
+    result = legacy_app.test_cli_runner().invoke(args=['migrate-category', '--drop-old'])
+    assert 'already an integer foreign key' in result.output
+    with legacy_app.app_context():
+        assert 'category_old' not in question_columns(db.engine)
+
+
+def test_unknown_categories_stop_the_migration_before_the_swap(legacy_app):
+    with legacy_app.app_context():
+        db.session.execute(text("UPDATE questions SET category = 'Science' WHERE id = 1"))
+        db.session.execute(text("UPDATE questions SET category = '99' WHERE id = 2"))
+        db.session.commit()
+    result = legacy_app.test_cli_runner().invoke(args=['migrate-category', '--pause', '0'])
+    assert result.exit_code == 1
+    assert "1 ('Science'), 2 ('99')" in result.output
+    with legacy_app.app_context():
+        assert not is_migrated(db.engine)
+        assert 'category_id' in question_columns(db.engine)
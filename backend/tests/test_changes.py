@@ -0,0 +1,102 @@
+import json
+
+from models import db, Question, ChangeLogEntry
+from changes import ChangeSet, change_feed, pending_changes
+from counts import question_counts
+
+NEW_QUESTION = {
+    'question': 'Which planet is known as the Red Planet?',
+    'answer': 'Mars',
+    'category': 1,
+    'difficulty': 1
+}
+
+
+def create(client, **fields):
+    response = client.post('/questions', json=dict(NEW_QUESTION, **fields))
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def science_count(client):
+    return client.get('/categories').get_json()['question_counts']['1']
+
+
+def log_as_other_worker(changes):
+    # writes `changes` to the change log as if another process had committed them
+    change_feed.write(db.session, changes)
+    db.session.execute(ChangeLogEntry.__table__.update().values(origin='another-worker')
+                       .where(ChangeLogEntry.version == changes.version))
+    db.session.commit()
+
+
+def test_create_and_delete_update_counts(client):
+    before = science_count(client)
+    question_id = create(client)['New_question_ID']
+    assert science_count(client) == before + 1
+    assert client.get('/categories/1/questions').get_json()['Total_Questions_category'] == before + 1
+
+    assert client.delete('/questions/%d' % question_id).status_code == 200
+    assert science_count(client) == before
+
+
+def test_rollback_discards_pending_changes(app):
+    with app.app_context():
+        total = question_counts.total()
+        db.session.add(Question('Discarded?', 'Yes', 1, 1))
+        db.session.flush()
+        assert pending_changes(db.session).questions_added
+        db.session.rollback()
+        assert 'pending_changes' not in db.session.info
+        assert question_counts.total() == total
+
+
+def test_changes_of_other_processes_are_replayed(app):
+    with app.app_context():
+        total = question_counts.total()
+        question_id = db.session.execute(Question.__table__.insert().values(
+            question='Logged elsewhere?', answer='Yes', category=3, difficulty=2)).inserted_primary_key[0]
+        changes = ChangeSet()
+        changes.questions_added.append(
+            {'id': question_id, 'question': 'Logged elsewhere?', 'answer': 'Yes', 'category': 3, 'difficulty': 2})
+        log_as_other_worker(changes)
+        assert question_counts.total() == total
+
+        change_feed.sync()
+        assert change_feed.applied == changes.version
+        assert question_counts.total() == total + 1
+        assert question_counts.count(3) == 4
+
+
+def test_own_changes_are_not_replayed(client, app):
+    create(client)
+    with app.app_context():
+        total = question_counts.total()
+        change_feed.sync()
+        assert question_counts.total() == total
+
+
+def test_reload_flag_rebuilds_indexes(app):
+    with app.app_context():
+        total = question_counts.total()
+        # rows bulk-inserted by another worker, which can only ask everyone to reload
+        db.session.execute(Question.__table__.insert(), [
+            {'question': 'Bulk %d?' % number, 'answer': 'Yes', 'category': 4, 'difficulty': 1} for number in range(3)])
+        changes = ChangeSet()
+        changes.reload = True
+        log_as_other_worker(changes)
+        assert question_counts.total() == total
+
+        change_feed.sync()
+        assert question_counts.total() == total + 3
+        assert change_feed.applied == changes.version
+
+
+def test_change_set_payload_roundtrip():
+    changes = ChangeSet()
+    changes.questions_removed.append({'id': 1})
+    changes.categories_changed = True
+    copy = ChangeSet.from_payload(changes.payload(), 7)
+    assert json.loads(copy.payload()) == json.loads(changes.payload())
+    assert copy.version == 7
+    assert not ChangeSet()
@@ -0,0 +1,114 @@
+import threading
+
+import pytest
+
+from models import db, Question
+from dedup import DuplicateIndex, bucket_add, bucket_discard, bucket_members, cluster_duplicates, duplicate_index, \
+    jaccard, normalize, shingles
+
+from test_changes import create, NEW_QUESTION
+
+REWORDED = 'Which planet is known as the red planet'
+
+
+def test_shingles_and_similarity():
+    assert normalize('Who painted "La Giaconda"?', ' Leonardo ') == 'who painted la giaconda | leonardo'
+    assert shingles('', '') == {' | '}
+    assert jaccard(set(), set()) == 1.0
+    assert jaccard(shingles(REWORDED, 'Mars'), shingles(NEW_QUESTION['question'], 'Mars')) == 1.0
+    assert jaccard(shingles('Who discovered penicillin?', 'Fleming'), shingles('Who discovered radium?', 'Curie')) < 0.8
+
+
+def test_buckets_hold_a_bare_id_until_shared():
+    band = {}
+    bucket_add(band, 7, 1)
+    bucket_add(band, 7, 1)
+    assert band == {7: 1}
+    bucket_add(band, 7, 2)
+    assert band == {7: {1, 2}} and sorted(bucket_members(band, 7)) == [1, 2]
+    bucket_discard(band, 7, 1)
+    assert band == {7: 2}
+    bucket_discard(band, 7, 3)
+    bucket_discard(band, 7, 2)
+    assert band == {} and bucket_members(band, 7) == ()
+
+
+def test_index_adds_and_removes_once():
+    index = DuplicateIndex()
+    first = dict(NEW_QUESTION, id=1)
+    second = dict(NEW_QUESTION, id=2, question=REWORDED)
+    for question in (first, first, second):
+        index.add(question)
+    assert len(index) == 2
+    assert sorted(index.candidates(NEW_QUESTION['question'], 'Mars')) == [1, 2]
+    for question in (first, first):
+        index.remove(question)
+    assert len(index) == 1
+    assert index.candidates(NEW_QUESTION['question'], 'Mars') == [2]
+
+
+def test_default_mode_never_builds_the_index(client):
+    create(client)
+    assert create(client)['duplicates'] == []
+    assert not duplicate_index.ready
+
+
+def test_flag_mode_reports_duplicates_and_follows_writes(make_app):
+    client = make_app({'DEDUP_MODE': 'flag'}).test_client()
+    first = create(client)
+    assert first['duplicates'] == []
+    second = create(client, question=REWORDED)
+    assert [duplicate['id'] for duplicate in second['duplicates']] == [first['New_question_ID']]
+    assert second['duplicates'][0]['similarity'] == 1.0
+
+    client.delete('/questions/%d' % first['New_question_ID'])
+    client.delete('/questions/%d' % second['New_question_ID'])
+    assert duplicate_index.find(NEW_QUESTION['question'], NEW_QUESTION['answer']) == []
+    assert len(duplicate_index) == 12
+
+
+def test_reject_mode_refuses_duplicates_unless_allowed(make_app):
+    client = make_app({'DEDUP_MODE': 'reject'}).test_client()
+    copy = dict(NEW_QUESTION, question='Who discovered penicillin', answer='Alexander Fleming')
+    response = client.post('/questions', json=copy)
+    assert response.status_code == 409
+    assert [duplicate['id'] for duplicate in response.get_json()['duplicates']] == [2]
+    allowed = client.post('/questions', json=dict(copy, allow_duplicate=True)).get_json()
+    assert allowed['success'] and [duplicate['id'] for duplicate in allowed['duplicates']] == [2]
+
+
+def test_unknown_mode_is_refused(make_app):
+    with pytest.raises(ValueError):
+        make_app({'DEDUP_MODE': 'warn'})
+
+
+def test_reload_waits_for_a_running_build(make_app):
+    app = make_app({'DEDUP_MODE': 'flag'})
+    create(app.test_client())
+    assert len(duplicate_index) == 13
+    with app.app_context():
+        # rows another worker bulk-inserted without logging them one by one
+        db.session.execute(Question.__table__.insert(), [
+            {'question': 'Bulk %d?' % number, 'answer': 'Yes', 'category': 4, 'difficulty': 1} for number in range(3)])
+        db.session.commit()
+
+    def reload():
+        with app.app_context():
+            duplicate_index.reload()
+
+    with duplicate_index._build_lock:
+        reloading = threading.Thread(target=reload)
+        reloading.start()
+        reloading.join(0.2)
+        assert reloading.is_alive()
+    reloading.join(5)
+    assert not reloading.is_alive()
+    assert len(duplicate_index) == 16
+
+
+def test_cluster_duplicates(app):
+    with app.app_context():
+        db.session.add_all([Question('Who discovered penicillin', 'Alexander Fleming', 1, 3),
+                            Question('Who discovered penicillin??', 'Alexander Fleming', 1, 3)])
+        db.session.commit()
+        assert cluster_duplicates() == [[2, 13, 14]]
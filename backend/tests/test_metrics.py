@@ -0,0 +1,86 @@
+import re
+
+import pytest
+from sqlalchemy.exc import OperationalError
+
+from models import db
+from instrumentation import Counter, Gauge, Histogram, Registry, format_labels
+
+SAMPLE = re.compile(r'^[a-z_]+(\{[^}]*\})? [0-9.e+-]+$')
+
+
+def scrape(client):
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.content_type == 'text/plain; version=0.0.4; charset=utf-8'
+    return response.get_data(as_text=True)
+
+
+def sample(text, name):
+    for line in text.splitlines():
+        if line.startswith(name + ' '):
+            return float(line.rsplit(' ', 1)[1])
+    return None
+
+
+def test_exposition_format():
+    registry = Registry()
+    requests = registry.register(Counter('requests_total', 'Requests.', ('route',)))
+    latency = registry.register(Histogram('latency_seconds', 'Latency.', ('route',), (0.1, 1.0)))
+    registry.register(Gauge('pool_size', 'Pool size.', collect=lambda: 5))
+    requests.inc('/a')
+    requests.inc('/a', amount=2)
+    for value in (0.05, 0.5, 3):
+        latency.observe('/a', value=value)
+
+    assert registry.exposition().splitlines() == [
+        '# HELP requests_total Requests.',
+        '# TYPE requests_total counter',
+        'requests_total{route="/a"} 3',
+        '# HELP latency_seconds Latency.',
+        '# TYPE latency_seconds histogram',
+        'latency_seconds_bucket{route="/a",le="0.1"} 1',
+        'latency_seconds_bucket{route="/a",le="1.0"} 2',
+        'latency_seconds_bucket{route="/a",le="+Inf"} 3',
+        'latency_seconds_sum{route="/a"} 3.55',
+        'latency_seconds_count{route="/a"} 3',
+        '# HELP pool_size Pool size.',
+        '# TYPE pool_size gauge',
+        'pool_size 5'
+    ]
+    # registering a name again replaces the old metric
+    registry.register(Counter('requests_total', 'Requests.', ('route',)))
+    assert 'requests_total{' not in registry.exposition()
+
+
+def test_label_values_are_escaped():
+    assert format_labels(('path',), ('a"b\\c',)) == '{path="a\\"b\\\\c"}'
+    assert format_labels((), ()) == ''
+
+
+def test_requests_and_queries_are_counted_per_route(client):
+    before = scrape(client)
+    client.get('/questions')
+    client.get('/questions')
+    client.get('/no/such/route')
+    after = scrape(client)
+
+    for line in after.splitlines():
+        assert line.startswith('# HELP ') or line.startswith('# TYPE ') or SAMPLE.match(line), line
+    requests = 'trivia_http_requests_total{route="/questions",method="GET",status="200"}'
+    assert sample(after, requests) == (sample(before, requests) or 0) + 2
+    assert sample(after, 'trivia_http_requests_total{route="unmatched",method="GET",status="404"}') >= 1
+    queries = 'trivia_db_queries_total{route="/questions"}'
+    assert sample(after, queries) > (sample(before, queries) or 0)
+    assert sample(after, 'trivia_db_pool_size') is not None
+
+
+def test_failed_statements_do_not_leak_timers(app):
+    with app.app_context():
+        with db.engine.connect() as connection:
+            for _ in range(3):
+                with pytest.raises(OperationalError):
+                    connection.execute('SELECT * FROM no_such_table')
+            assert not connection.info.get('query_started')
+            assert connection.execute('SELECT 1').scalar() == 1
+            assert not connection.info.get('query_started')
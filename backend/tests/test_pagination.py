@@ -0,0 +1,78 @@
+import base64
+import json
+
+import pytest
+
+from pagination import decode_cursor, encode_cursor
+
+
+def raw_cursor(payload):
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip('=')
+
+
+@pytest.mark.parametrize('direction, position', [('after', 0), ('after', 12), ('before', 123456789)])
+def test_cursor_roundtrip(direction, position):
+    cursor = encode_cursor(direction, position)
+    assert '=' not in cursor
+    assert decode_cursor(cursor) == (direction, position)
+
+
+@pytest.mark.parametrize('payload', [
+    [1, 2],
+    12,
+    {},
+    {'after': 1, 'before': 2},
+    {'after': -1},
+    {'after': True},
+    {'after': '12'},
+    {'after': 1.5},
+    {'sideways': 1}
+])
+def test_malformed_cursor_payloads_are_refused(payload):
+    with pytest.raises(ValueError):
+        decode_cursor(raw_cursor(payload))
+
+
+@pytest.mark.parametrize('cursor', ['!!!', 'bm90IGpzb24', 'été'])
+def test_undecodable_cursors_are_refused(cursor):
+    with pytest.raises((ValueError, TypeError)):
+        decode_cursor(cursor)
+
+
+def test_cursor_pages_walk_every_question(client):
+    first = client.get('/questions?cursor=').get_json()
+    assert len(first['questions']) == 10
+    assert first['prev_cursor'] is None
+
+    second = client.get('/questions?cursor=' + first['next_cursor']).get_json()
+    assert [question['id'] for question in second['questions']] == [11, 12]
+    assert second['next_cursor'] is None
+
+    back = client.get('/questions?cursor=' + second['prev_cursor']).get_json()
+    assert back['questions'] == first['questions']
+
+
+def test_page_and_cursor_modes_agree(client):
+    paged = client.get('/categories/3/questions').get_json()
+    keyed = client.get('/categories/3/questions?cursor=').get_json()
+    assert paged['questions'] == keyed['questions']
+    assert 'next_cursor' not in paged
+
+
+def test_search_cursor_carries_the_ranking_position(client):
+    ranked = client.get('/questions/search?search=which&cursor=').get_json()
+    assert ranked['total_questions'] == 5
+    assert ranked['next_cursor'] is None and ranked['prev_cursor'] is None
+
+    tail = client.get('/questions/search?search=which&cursor=' + encode_cursor('after', 3)).get_json()
+    assert tail['Questions'] == ranked['Questions'][3:]
+    assert decode_cursor(tail['prev_cursor']) == ('before', 3)
+
+
+@pytest.mark.parametrize('path', ['/questions', '/categories/1/questions', '/questions/search?search=which'])
+@pytest.mark.parametrize('cursor', ['!!!', raw_cursor({'after': -3}), raw_cursor({'after': True}), raw_cursor([1])])
+def test_bad_cursor_is_unprocessable(client, path, cursor):
+    separator = '&' if '?' in path else '?'
+    response = client.get(path + separator + 'cursor=' + cursor)
+    assert response.status_code == 422
+    assert response.get_json()['success'] is False
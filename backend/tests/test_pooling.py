@@ -0,0 +1,72 @@
+import pytest
+from flask import Flask
+from sqlalchemy import create_engine, exc
+from sqlalchemy.pool import NullPool
+
+from models import DB_DEFAULTS, TimedQueuePool, db, db_setting, engine_options, pool_stats
+
+
+@pytest.fixture
+def flask_app(monkeypatch):
+    for name in DB_DEFAULTS:
+        monkeypatch.delenv(name, raising=False)
+    return Flask(__name__)
+
+
+def test_settings_come_from_config_then_environment(flask_app, monkeypatch):
+    assert db_setting(flask_app, 'DB_POOL_SIZE') == 5
+    monkeypatch.setenv('DB_POOL_SIZE', '12')
+    monkeypatch.setenv('DB_POOL_PRE_PING', 'no')
+    monkeypatch.setenv('DB_REPLICA_MAX_LAG', '2.5')
+    monkeypatch.setenv('DB_STATEMENT_TIMEOUT_MS', '250')
+    assert db_setting(flask_app, 'DB_POOL_SIZE') == 12
+    assert db_setting(flask_app, 'DB_POOL_PRE_PING') is False
+    assert db_setting(flask_app, 'DB_REPLICA_MAX_LAG') == 2.5
+    assert db_setting(flask_app, 'DB_STATEMENT_TIMEOUT_MS') == 250
+    flask_app.config['DB_POOL_SIZE'] = 3
+    assert db_setting(flask_app, 'DB_POOL_SIZE') == 3
+
+
+def test_engine_options(flask_app):
+    flask_app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'echo': False}
+    # SQLite keeps Flask-SQLAlchemy's pool unless one is asked for
+    assert engine_options(flask_app, 'sqlite:///trivia.db') == {'echo': False}
+
+    flask_app.config.update(DB_POOL_SIZE=2, DB_STATEMENT_TIMEOUT_MS=500)
+    options = engine_options(flask_app, 'postgresql://localhost/trivia')
+    assert options['poolclass'] is TimedQueuePool
+    assert (options['pool_size'], options['max_overflow'], options['pool_timeout'], options['pool_recycle']) == \
+        (2, 10, 30, 1800)
+    assert options['pool_pre_ping'] is True
+    assert options['connect_args'] == {'options': '-c statement_timeout=500'}
+
+    flask_app.config['DB_POOL'] = 'queue'
+    assert engine_options(flask_app, 'sqlite:///trivia.db')['connect_args'] == {'check_same_thread': False}
+    flask_app.config['DB_POOL'] = 'null'
+    options = engine_options(flask_app, 'postgresql://localhost/trivia')
+    assert options['poolclass'] is NullPool and 'pool_size' not in options
+
+
+def test_pool_stats_count_waits_for_an_exhausted_pool(tmp_path):
+    engine = create_engine('sqlite:///%s' % (tmp_path / 'pool.db'), poolclass=TimedQueuePool,
+                           pool_size=1, max_overflow=0, pool_timeout=0.05)
+    held = engine.connect()
+    assert pool_stats(engine) == {'size': 1, 'checked_in': 0, 'checked_out': 1, 'overflow': 0,
+                                  'waits': 0, 'wait_seconds': 0.0}
+    with pytest.raises(exc.TimeoutError):
+        engine.connect()
+    stats = pool_stats(engine)
+    assert stats['waits'] == 1 and stats['wait_seconds'] >= 0.05
+    held.close()
+    assert pool_stats(engine)['checked_in'] == 1
+    # the counts survive a pool that is recreated after a disconnect
+    engine.dispose()
+    assert pool_stats(engine)['waits'] == 1
+
+
+def test_app_uses_the_configured_pool(make_app):
+    app = make_app({'DB_POOL': 'queue'}, DB_POOL_SIZE=3)
+    with app.app_context():
+        assert isinstance(db.engine.pool, TimedQueuePool)
+        assert pool_stats(db.engine)['size'] == 3
+    assert 'trivia_db_pool_size 3' in app.test_client().get('/metrics').get_data(as_text=True)
@@ -0,0 +1,47 @@
+import json
+import pstats
+
+from profiling import PROFILE_HEADER, prune
+
+
+def profiling_client(make_app, tmp_path, **env):
+    env = dict({'PROFILE_DIR': str(tmp_path / 'profiles')}, **env)
+    return make_app(env).test_client()
+
+
+def test_token_profiles_only_matching_requests(make_app, tmp_path):
+    client = profiling_client(make_app, tmp_path, PROFILE_TOKEN='secret')
+    assert 'X-Profile-Id' not in client.get('/questions').headers
+    assert 'X-Profile-Id' not in client.get('/questions', headers={PROFILE_HEADER: 'guess'}).headers
+
+    response = client.get('/categories/1/questions?page=1', headers={PROFILE_HEADER: 'secret'})
+    name = response.headers['X-Profile-Id']
+    assert name.endswith('-GET-categories_int_category_id_questions')
+    directory = tmp_path / 'profiles'
+    assert sorted(path.name for path in directory.iterdir()) == [name + '.prof', name + '.sql.json']
+    assert pstats.Stats(str(directory / (name + '.prof'))).total_calls > 0
+    log = json.loads((directory / (name + '.sql.json')).read_text())
+    assert log['path'] == '/categories/1/questions?page=1'
+    assert log['status'] == 200
+    assert log['queries'] and all('SELECT' in query['statement'] for query in log['queries'])
+
+
+def test_sample_rate_profiles_every_request_at_one(make_app, tmp_path):
+    client = profiling_client(make_app, tmp_path, PROFILE_SAMPLE_RATE='1')
+    assert 'X-Profile-Id' in client.get('/categories').headers
+    assert client.get('/nowhere').headers['X-Profile-Id'].endswith('-GET-unmatched')
+
+
+def test_disabled_without_token_or_sample_rate(make_app, tmp_path):
+    client = profiling_client(make_app, tmp_path)
+    assert 'X-Profile-Id' not in client.get('/questions', headers={PROFILE_HEADER: ''}).headers
+    assert not (tmp_path / 'profiles').exists()
+
+
+def test_prune_keeps_the_newest_profiles(tmp_path):
+    for number in range(5):
+        (tmp_path / ('%d-run.prof' % number)).write_text('')
+        (tmp_path / ('%d-run.sql.json' % number)).write_text('{}')
+    prune(str(tmp_path), 2)
+    assert sorted(path.name for path in tmp_path.iterdir()) == \
+        ['3-run.prof', '3-run.sql.json', '4-run.prof', '4-run.sql.json']
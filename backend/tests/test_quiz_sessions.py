@@ -0,0 +1,87 @@
+import pytest
+
+from quiz_sessions import parse_session_request, QuizSessionStore, QUIZ_DECK_LIMIT, QUIZ_DECK_SIZE
+from question_ids import ALL_CATEGORIES, ANY_DIFFICULTY
+from conftest import quiz_body, QUESTIONS
+
+
+def test_session_deals_every_question_once(client):
+    created = client.post('/quizzes/sessions', json=quiz_body(3)).get_json()
+    assert created['total_questions'] == 3
+    session_id = created['session_id']
+
+    drawn = []
+    for remaining in (2, 1, 0):
+        round = client.post('/quizzes/sessions/%s/next' % session_id).get_json()
+        assert round['remaining'] == remaining
+        drawn.append(round['question']['id'])
+    assert sorted(drawn) == [7, 8, 9]
+    assert client.post('/quizzes/sessions/%s/next' % session_id).get_json()['question'] is None
+
+    assert client.delete('/quizzes/sessions/%s' % session_id).status_code == 200
+    assert client.post('/quizzes/sessions/%s/next' % session_id).status_code == 404
+    assert client.delete('/quizzes/sessions/%s' % session_id).status_code == 404
+
+
+def test_session_skips_questions_deleted_after_dealing(client):
+    session_id = client.post('/quizzes/sessions', json=quiz_body(4)).get_json()['session_id']
+    client.delete('/questions/10')
+    rounds = [client.post('/quizzes/sessions/%s/next' % session_id).get_json() for _ in range(2)]
+    assert [round['question']['id'] for round in rounds if round['question']] == [11]
+    assert rounds[-1]['remaining'] == 0
+
+
+def test_session_deck_size_and_difficulty(client):
+    everything = client.post('/quizzes/sessions', json=quiz_body(questions=5)).get_json()
+    assert everything['total_questions'] == 5
+    hard = client.post('/quizzes/sessions', json=quiz_body(difficulty=4, questions=3)).get_json()
+    # the deck is drawn from difficulty 4 before the nearest other levels
+    drawn = [client.post('/quizzes/sessions/%s/next' % hard['session_id']).get_json()['question'] for _ in range(3)]
+    assert sorted(question['id'] for question in drawn) == [1, 3, 12]
+    wide = client.post('/quizzes/sessions', json=quiz_body(difficulty=4)).get_json()
+    assert wide['total_questions'] == len(QUESTIONS)
+
+
+def test_unknown_session_is_not_found(client):
+    assert client.post('/quizzes/sessions/nope/next').status_code == 404
+
+
+@pytest.mark.parametrize('body', [
+    [1],
+    'quiz',
+    {},
+    {'quiz_category': 'bad'},
+    {'quiz_category': {'type': 'Science', 'id': [1]}},
+    {'quiz_category': {'type': 'Science', 'id': 1.5}},
+    {'quiz_category': {'type': 'click', 'id': 0}, 'questions': True},
+    {'quiz_category': {'type': 'click', 'id': 0}, 'questions': 0},
+    {'quiz_category': {'type': 'click', 'id': 0}, 'questions': '5'},
+    {'quiz_category': {'type': 'click', 'id': 0}, 'difficulty': 6},
+    {'quiz_category': {'type': 'click', 'id': 0}, 'difficulty': '3'}
+])
+def test_malformed_session_requests_are_unprocessable(client, body):
+    response = client.post('/quizzes/sessions', json=body)
+    assert response.status_code == 422
+    assert response.get_json()['success'] is False
+
+
+def test_parse_session_request():
+    assert parse_session_request({'quiz_category': {'type': 'click', 'id': 3}}) == \
+        (ALL_CATEGORIES, ANY_DIFFICULTY, QUIZ_DECK_SIZE)
+    assert parse_session_request({'quiz_category': {'type': 'Art', 'id': 2}, 'difficulty': 1, 'questions': 7}) == \
+        (2, 1, 7)
+    assert parse_session_request({'quiz_category': {'type': 'Art', 'id': '2'}, 'questions': 10 ** 9}) == \
+        ('2', ANY_DIFFICULTY, QUIZ_DECK_LIMIT)
+
+
+def test_session_store_evicts_and_expires():
+    store = QuizSessionStore(limit=2, ttl=60)
+    first, _ = store.create([1, 2, 3])
+    second, _ = store.create([4])
+    store.get(first)
+    third, _ = store.create([5])
+    assert len(store) == 2
+    assert store.get(second) is None and store.get(first) is not None
+
+    store.get(third).touched_at -= 61
+    assert store.get(third) is None
@@ -0,0 +1,106 @@
+import sys
+
+import pytest
+
+from models import db, Question
+from changes import ChangeSet, change_feed
+from question_ids import IdList, QuestionIdIndex, nearest_difficulties, sample_unseen, ALL_CATEGORIES
+
+from conftest import quiz_body
+from test_changes import create, log_as_other_worker
+
+
+def test_id_list_swaps_removed_slots():
+    ids = IdList()
+    for question_id in (1, 2, 3, 4):
+        ids.add(question_id)
+    ids.add(2)
+    ids.remove(2)
+    ids.remove(9)
+    assert ids.ids == [1, 4, 3]
+    assert ids.slots == {1: 0, 4: 1, 3: 2}
+
+
+def test_sample_unseen_draws_distinct_unseen_ids():
+    ids = list(range(100))
+    excluded = set(range(0, 100, 2))
+    for _ in range(20):
+        chosen = sample_unseen(ids, excluded, 10)
+        assert len(set(chosen)) == 10
+        assert not excluded & set(chosen)
+    # more than are left: every unseen id, found by the reservoir pass
+    assert sorted(sample_unseen(ids, set(range(97)), 10)) == [97, 98, 99]
+    assert sample_unseen([], (), 3) == []
+
+
+def test_index_draws_nearest_difficulties_first():
+    index = QuestionIdIndex()
+    for question_id, difficulty in ((1, 1), (2, 3), (3, 3), (4, 5)):
+        index.add(question_id, 7, difficulty)
+    assert nearest_difficulties(4) == [4, 3, 5, 2, 1]
+    assert sorted(index.random_unseen_many(7, (), 2, 4)) == [2, 3]
+    assert index.random_unseen_many(7, (2, 3), 1, 4) == [4]
+    index.remove(4, 7, 5)
+    assert index.random_unseen(ALL_CATEGORIES, (1, 2, 3)) is None
+
+
+def test_quiz_excludes_previous_questions(client):
+    assert client.post('/quizzes', json=quiz_body(2, previous=[4, 5])).get_json()['question']['id'] == 6
+    assert client.post('/quizzes', json=quiz_body(2, previous=[4, 5, 6])).get_json()['question'] is None
+    drawn = client.post('/quizzes', json=quiz_body(previous=range(1, 12))).get_json()['question']
+    assert drawn['id'] == 12
+
+
+def test_quiz_difficulty(client):
+    assert client.post('/quizzes', json=quiz_body(1, difficulty=3)).get_json()['question']['id'] == 2
+
+
+@pytest.mark.parametrize('body', [
+    None,
+    [1],
+    {'previous_questions': []},
+    {'quiz_category': 'bad', 'previous_questions': []},
+    {'quiz_category': {'type': 'Science', 'id': 1}, 'previous_questions': 5},
+    dict(quiz_body(), difficulty=0),
+    dict(quiz_body(), difficulty='3')
+])
+def test_malformed_quiz_requests_are_unprocessable(client, body):
+    assert client.post('/quizzes', json=body).status_code == 422
+
+
+def test_writes_update_the_quiz_ids(client):
+    question_id = create(client, category=6)['New_question_ID']
+    drawn = client.post('/quizzes', json=quiz_body(6, previous=[12])).get_json()['question']
+    assert drawn['id'] == question_id
+
+    client.delete('/questions/%d' % question_id)
+    assert client.post('/quizzes', json=quiz_body(6, previous=[12])).get_json()['question'] is None
+
+
+def test_other_workers_writes_reach_the_quiz_ids(client, app):
+    with app.app_context():
+        question_id = db.session.execute(Question.__table__.insert().values(
+            question='Logged elsewhere?', answer='Yes', category=5, difficulty=2)).inserted_primary_key[0]
+        changes = ChangeSet()
+        changes.questions_added.append(
+            {'id': question_id, 'question': 'Logged elsewhere?', 'answer': 'Yes', 'category': 5, 'difficulty': 2})
+        log_as_other_worker(changes)
+    # the feed is synced before the request is served
+    assert client.post('/quizzes', json=quiz_body(5)).get_json()['question']['id'] == question_id
+    assert change_feed.applied == changes.version
+
+
+def test_prefetch_returns_a_round_of_unseen_questions(client, monkeypatch):
+    round = client.post('/quizzes', json=quiz_body(1, previous=[2], count=10)).get_json()
+    assert sorted(question['id'] for question in round['questions']) == [1, 3]
+    assert round['question'] == round['questions'][0]
+    # capped at QUIZ_PREFETCH_LIMIT, and empty once the category runs dry
+    monkeypatch.setattr(sys.modules['app'], 'QUIZ_PREFETCH_LIMIT', 5)
+    assert len(client.post('/quizzes', json=quiz_body(count=1000)).get_json()['questions']) == 5
+    assert client.post('/quizzes', json=quiz_body(2, previous=[4, 5, 6], count=3)).get_json() == \
+        {'success': True, 'question': None, 'questions': []}
+
+
+@pytest.mark.parametrize('count', [0, -1, '3', 2.0, True, False, None, [2]])
+def test_prefetch_refuses_bad_counts(client, count):
+    assert client.post('/quizzes', json=quiz_body(count=count)).status_code == 422
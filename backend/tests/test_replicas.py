@@ -0,0 +1,101 @@
+import shutil
+import time
+
+import pytest
+from sqlalchemy import create_engine
+
+import replicas as routing
+import versions
+from models import db, replicas, Question
+from replicas import STICKY_COOKIE
+
+from test_changes import create
+
+
+class Clock:
+    # stands in for the time module in replicas.py and versions.py
+    offset = 0.0
+
+    @classmethod
+    def time(cls):
+        return time.time() + cls.offset
+
+
+@pytest.fixture
+def replica_app(make_app, tmp_path, monkeypatch):
+    monkeypatch.setattr(Clock, 'offset', 0.0)
+    monkeypatch.setattr(routing, 'time', Clock)
+    monkeypatch.setattr(versions, 'time', Clock)
+    app = make_app({'DATABASE_REPLICA_URLS': 'sqlite:///%s' % (tmp_path / 'replica.db')})
+    # the replica starts as a copy of the primary, then tells itself apart
+    shutil.copy(str(tmp_path / 'trivia.db'), str(tmp_path / 'replica.db'))
+    engine = create_engine('sqlite:///%s' % (tmp_path / 'replica.db'))
+    engine.execute(Question.__table__.update().where(Question.id == 1).values(difficulty=5))
+    engine.dispose()
+    yield app
+    replicas.configure([])
+
+
+def read_from(client):
+    # question 1 has difficulty 4 on the primary and 5 on the replica
+    difficulty = client.get('/questions/1/stats').get_json()['difficulty']
+    return {4: 'primary', 5: 'replica'}[difficulty]
+
+
+def test_routing_session_reads_from_the_replica_until_it_writes(replica_app):
+    with replica_app.app_context():
+        db.session.info['read_engine'] = replicas.engines[0]
+        assert db.session.query(Question.difficulty).filter_by(id=1).scalar() == 5
+        db.session.add(Question('Written?', 'Yes', 1, 1))
+        db.session.flush()
+        assert 'read_engine' not in db.session.info
+        assert db.session.query(Question.difficulty).filter_by(id=1).scalar() == 4
+        db.session.rollback()
+
+
+def test_reads_stay_on_the_primary_after_a_write(replica_app):
+    client = replica_app.test_client()
+    # the seed data was just committed by this process
+    assert read_from(client) == 'primary'
+    Clock.offset = 11
+    assert read_from(client) == 'replica'
+
+    create(client)
+    cookie = next(cookie for cookie in client.cookie_jar if cookie.name == STICKY_COOKIE)
+    assert float(cookie.value) == pytest.approx(Clock.time() + 10, abs=1)
+    other = replica_app.test_client()
+    assert read_from(client) == 'primary'
+    assert read_from(other) == 'primary'
+    Clock.offset = 22
+    assert read_from(client) == 'replica'
+    assert read_from(other) == 'replica'
+
+
+def test_sticky_cookie_keeps_one_client_on_the_primary(replica_app):
+    Clock.offset = 11
+    client, other = replica_app.test_client(), replica_app.test_client()
+    client.set_cookie('localhost', STICKY_COOKIE, '%.3f' % (Clock.time() + 5))
+    assert read_from(client) == 'primary'
+    assert read_from(other) == 'replica'
+    client.set_cookie('localhost', STICKY_COOKIE, 'garbage')
+    assert read_from(client) == 'replica'
+
+
+def test_failed_writes_and_reads_set_no_cookie(replica_app):
+    client = replica_app.test_client()
+    client.get('/questions')
+    assert client.post('/questions', json={'question': 'Incomplete?'}).status_code == 422
+    assert not list(client.cookie_jar)
+
+
+def test_unhealthy_replica_sends_reads_to_the_primary(replica_app):
+    Clock.offset = 11
+    client = replica_app.test_client()
+    replicas.mark_down(replicas.engines[0])
+    assert read_from(client) == 'primary'
+
+
+def test_sticky_window_must_cover_the_replica_lag(make_app, tmp_path):
+    with pytest.raises(ValueError):
+        make_app({'DATABASE_REPLICA_URLS': 'sqlite:///%s' % (tmp_path / 'replica.db')}, DB_STICKY_SECONDS=3)
+    replicas.configure([])
@@ -0,0 +1,75 @@
+from werkzeug.datastructures import MultiDict
+
+from response_cache import MemoryResponseCache, SQLiteResponseCache, cache_key, response_cache
+
+from test_changes import create
+
+
+def page_ids(client, path):
+    return [question['id'] for question in client.get(path).get_json()['questions']]
+
+
+def test_cache_key_ignores_argument_order():
+    key = cache_key('get_categories_questions', {'category_id': 2}, MultiDict([('page', '2'), ('cursor', '')]))
+    assert key == 'get_categories_questions|category_id=2|cursor=|page=2'
+    assert key == cache_key('get_categories_questions', {'category_id': 2}, MultiDict([('cursor', ''), ('page', '2')]))
+
+
+def test_memory_cache_evicts_least_recently_used():
+    cache = MemoryResponseCache(max_bytes=10, max_entries=2)
+    cache.set('a', b'1234', 'application/json', ['all'], 60)
+    cache.set('b', b'1234', 'application/json', ['category:1'], 60)
+    cache.get('a')
+    cache.set('c', b'1234', 'application/json', ['category:2'], 60)
+    assert cache.get('b') is None and cache.get('a') is not None
+    cache.set('d', b'12345678', 'application/json', ['all'], 60)
+    assert cache.get('a') is None and cache.get('c') is None
+    cache.invalidate(['all'])
+    assert cache.get('d') is None
+    cache.set('e', b'1', 'application/json', [], -1)
+    assert cache.get('e') is None
+
+
+def test_write_invalidates_only_the_touched_category(client):
+    art = page_ids(client, '/categories/2/questions')
+    science = page_ids(client, '/categories/1/questions')
+    backend = response_cache.backend
+    assert backend.get('get_categories_questions|category_id=2') is not None
+
+    question_id = create(client)['New_question_ID']
+    assert backend.get('get_categories_questions|category_id=2') is not None
+    assert backend.get('get_categories_questions|category_id=1') is None
+    assert page_ids(client, '/categories/2/questions') == art
+    assert page_ids(client, '/categories/1/questions') == science + [question_id]
+
+
+def test_sqlite_cache_refuses_pages_older_than_an_invalidation(tmp_path):
+    cache = SQLiteResponseCache(str(tmp_path / 'responses.db'))
+    cache.set('page', b'{}', 'application/json', ['category:1'], 60, version=3)
+    assert cache.get('page') == (b'{}', 'application/json')
+
+    cache.invalidate(['category:1'], version=5)
+    assert cache.get('page') is None
+    # built by a worker that had not applied version 5 yet
+    cache.set('page', b'{}', 'application/json', ['category:1'], 60, version=4)
+    assert cache.get('page') is None
+    cache.set('page', b'{}', 'application/json', ['category:1'], 60, version=5)
+    assert cache.get('page') is not None
+
+    cache.clear(version=8)
+    cache.set('other', b'{}', 'application/json', ['all'], 60, version=7)
+    assert cache.get('other') is None
+    # no version, no way to check it
+    cache.set('other', b'{}', 'application/json', ['all'], 60)
+    assert cache.get('other') is None
+
+
+def test_sqlite_cache_is_shared_between_workers(make_app, tmp_path):
+    client = make_app({'RESPONSE_CACHE': 'sqlite:///%s' % (tmp_path / 'responses.db')}).test_client()
+    before = page_ids(client, '/categories/1/questions')
+    other_worker = SQLiteResponseCache(str(tmp_path / 'responses.db'))
+    assert other_worker.get('get_categories_questions|category_id=1') is not None
+
+    question_id = create(client)['New_question_ID']
+    assert other_worker.get('get_categories_questions|category_id=1') is None
+    assert page_ids(client, '/categories/1/questions') == before + [question_id]
@@ -0,0 +1,50 @@
+from search import MemorySearchIndex, tokenize
+
+from test_changes import create
+
+
+def question(question_id, text, answer='Yes'):
+    return {'id': question_id, 'question': text, 'answer': answer, 'category': 1, 'difficulty': 1}
+
+
+def search_ids(client, query):
+    return [found['id'] for found in client.get('/questions/search?' + query).get_json()['Questions']]
+
+
+def test_tokenize():
+    assert tokenize('Who painted "La Giaconda"?') == ['who', 'painted', 'la', 'giaconda']
+    assert tokenize('') == [] and tokenize(None) == []
+
+
+def test_memory_index_ranks_and_expands_the_last_term():
+    index = MemorySearchIndex()
+    index.add(question(1, 'What is the capital of France?', 'Paris'))
+    index.add(question(2, 'Capital of France, capital of fashion: which city?', 'Paris'))
+    index.add(question(3, 'Which river flows through Paris?', 'The Seine'))
+    assert index.search('capital fra') == ([2, 1], 2)
+    assert index.search('capital fra', offset=1, limit=1) == ([1], 2)
+    assert index.search('paris') == ([3], 1)
+    assert sorted(index.search('paris', include_answers=True)[0]) == [1, 2, 3]
+    assert index.search('capital tokyo') == ([], 0)
+
+    index.remove(question(2, 'Capital of France, capital of fashion: which city?', 'Paris'))
+    assert index.search('capital') == ([1], 1)
+
+
+def test_search_endpoint(client):
+    assert search_ids(client, 'search=which lake') == []
+    assert search_ids(client, 'search=largest lake') == [7]
+    assert search_ids(client, 'search=optical') == [4]
+    # answers only count when asked for
+    assert search_ids(client, 'search=fleming') == []
+    assert search_ids(client, 'search=fleming&answers=true') == [2]
+    # no terms to match on lists every question
+    assert len(client.get('/questions/search?search=%3F%3F').get_json()['Questions']) == 10
+    assert client.get('/questions/search').status_code == 422
+
+
+def test_writes_update_the_index(client):
+    question_id = create(client)['New_question_ID']
+    assert search_ids(client, 'search=planet') == [question_id]
+    client.delete('/questions/%d' % question_id)
+    assert search_ids(client, 'search=planet') == []
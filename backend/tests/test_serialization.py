@@ -0,0 +1,46 @@
+import json
+
+import pytest
+
+from models import Question
+from serialization import QUESTION_FIELDS, json_response, load_backend, project_questions, question_dict
+
+PAYLOAD = {'success': True, 'questions': [{'id': 1, 'question': 'Où est Nice?', 'answer': 'France'}], 'total': 2}
+
+
+def test_project_questions_matches_format(app):
+    with app.app_context():
+        selection = Question.query.filter(Question.category == 2).order_by(Question.id)
+        assert project_questions(selection) == [question.format() for question in selection]
+    assert question_dict((7, 'Q?', 'A', 3, 2)) == dict(zip(QUESTION_FIELDS, (7, 'Q?', 'A', 3, 2)))
+
+
+@pytest.mark.parametrize('name', ['json', 'ujson', 'orjson'])
+def test_backends_sort_keys_like_jsonify(app, name):
+    pytest.importorskip(name)
+    backend, dumps = load_backend(name)
+    assert backend == name
+    encoded = dumps(PAYLOAD)
+    encoded = encoded.decode('utf-8') if isinstance(encoded, bytes) else encoded
+    assert encoded.endswith('\n')
+    assert json.loads(encoded) == PAYLOAD
+    assert encoded.index('"questions"') < encoded.index('"success"') < encoded.index('"total"')
+
+
+def test_unknown_backend_is_refused():
+    with pytest.raises(ValueError):
+        load_backend('simplejson2')
+
+
+def test_json_response(app):
+    with app.app_context():
+        response = json_response(PAYLOAD, status=201)
+    assert response.status_code == 201
+    assert response.mimetype == 'application/json'
+    assert json.loads(response.get_data()) == PAYLOAD
+
+
+def test_endpoints_serve_projected_questions(client):
+    body = client.get('/categories/2/questions').get_json()
+    assert [question['id'] for question in body['questions']] == [4, 5, 6]
+    assert set(body['questions'][0]) == set(QUESTION_FIELDS)
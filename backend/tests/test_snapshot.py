@@ -0,0 +1,88 @@
+import pytest
+
+from app import create_app
+
+from conftest import quiz_body
+
+GET_PATHS = [
+    '/questions',
+    '/questions?page=2',
+    '/questions?page=3',
+    '/questions?page=0',
+    '/questions?cursor=',
+    '/questions?cursor=bad',
+    '/categories',
+    '/categories/1/questions',
+    '/categories/2/questions?page=1',
+    '/categories/2/questions?cursor=',
+    '/categories/2/questions?cursor=bad',
+    '/categories/5/questions',
+    '/categories/99/questions'
+]
+
+QUIZ_BODIES = [
+    quiz_body(2, previous=[4, 5]),
+    quiz_body(2, previous=[4, 5, 6]),
+    quiz_body(2, previous=[4, 5, 6], count=3),
+    quiz_body(previous=range(1, 12)),
+    quiz_body(1, difficulty=3),
+    quiz_body(count=True),
+    quiz_body(count=0),
+    dict(quiz_body(), difficulty='3'),
+    {'previous_questions': []},
+    {'quiz_category': 'bad', 'previous_questions': []},
+    [1]
+]
+
+
+@pytest.fixture
+def apps(make_app, tmp_path):
+    # the database app and a snapshot app over a snapshot of the same data
+    db_app = make_app()
+    path = str(tmp_path / 'bank.snap')
+    result = db_app.test_cli_runner().invoke(args=['export-snapshot', path])
+    assert 'wrote 12 questions' in result.output
+    return db_app.test_client(), create_app({'SNAPSHOT_PATH': path, 'TESTING': True}).test_client()
+
+
+def answer(response):
+    return response.status_code, response.get_json()
+
+
+@pytest.mark.parametrize('path', GET_PATHS)
+def test_reads_match_the_database_app(apps, path):
+    db_client, snapshot_client = apps
+    assert answer(snapshot_client.get(path)) == answer(db_client.get(path))
+
+
+def test_cursor_walks_match_the_database_app(apps):
+    for path in ('/questions', '/categories/1/questions'):
+        pages = []
+        for client in apps:
+            walk, cursor = [], ''
+            while cursor is not None:
+                page = client.get('%s?cursor=%s' % (path, cursor)).get_json()
+                walk.append(page)
+                cursor = page['next_cursor']
+            back = client.get('%s?cursor=%s' % (path, walk[-1]['prev_cursor'])).get_json() if len(walk) > 1 else None
+            pages.append((walk, back))
+        assert pages[0] == pages[1]
+
+
+@pytest.mark.parametrize('body', QUIZ_BODIES)
+def test_quizzes_match_the_database_app(apps, body):
+    db_client, snapshot_client = apps
+    assert answer(snapshot_client.post('/quizzes', json=body)) == answer(db_client.post('/quizzes', json=body))
+
+
+def test_prefetch_draws_the_same_questions(apps):
+    drawn = [client.post('/quizzes', json=quiz_body(1, previous=[2], count=10)).get_json() for client in apps]
+    assert [sorted(question['id'] for question in round['questions']) for round in drawn] == [[1, 3], [1, 3]]
+
+
+def test_snapshot_app_is_read_only(apps):
+    _, snapshot_client = apps
+    assert snapshot_client.post('/questions', json={'question': 'Q?'}).status_code in (404, 405)
+    assert snapshot_client.delete('/questions/1').status_code in (404, 405)
+    etag = snapshot_client.get('/categories').headers['ETag']
+    assert snapshot_client.get('/questions', headers={'If-None-Match': etag}).status_code == 304
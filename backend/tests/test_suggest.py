@@ -0,0 +1,67 @@
+import pytest
+
+from suggest import SuggestIndex
+
+from test_changes import create
+
+
+def suggested(client, prefix, **params):
+    params['prefix'] = prefix
+    return client.get('/questions/suggest', query_string=params).get_json()
+
+
+def test_index_ranks_terms_and_completes_titles():
+    index = SuggestIndex()
+    index._add(1, 'Which planet is the largest?')
+    index._add(2, 'Which planet has rings?')
+    index._add(3, 'Where is Plato buried?')
+    assert index.suggest('pla') == (['planet', 'plato'], [])
+    # titles come in alphabetical order, terms complete only the last word
+    titles = [(2, 'Which planet has rings?'), (1, 'Which planet is the largest?')]
+    assert index.suggest('which pl') == (['planet', 'plato'], titles)
+    assert index.suggest('WHICH PLANET H') == (['has'], titles[:1])
+    # a finished word asks for titles only
+    assert index.suggest('which ') == ([], titles)
+    assert index.suggest('') == ([], [])
+
+    index._remove(1, 'Which planet is the largest?')
+    index._remove(2, 'Which planet has rings?')
+    assert index.suggest('pla') == (['plato'], [])
+    only = SuggestIndex()
+    only._add(3, 'Where is Plato buried?')
+    assert index.bytes == only.bytes
+
+
+def test_memory_budget_skips_titles_but_keeps_terms():
+    index = SuggestIndex(max_bytes=1000)
+    for question_id in range(1, 6):
+        index._add(question_id, 'Question number %d about volcanoes' % question_id)
+    assert index.skipped_titles > 0
+    terms, questions = index.suggest('question number', limit=20)
+    assert terms == ['number'] and len(questions) == 5 - index.skipped_titles
+    assert index.suggest('volc')[0] == ['volcanoes']
+
+
+def test_suggest_endpoint(client):
+    body = suggested(client, 'who')
+    assert body['terms'] == ['who', 'whose']
+    assert [question['id'] for question in body['questions']] == [2, 10]
+    assert len(suggested(client, 'wh', limit=1)['terms']) == 1
+    assert client.get('/questions/suggest').status_code == 422
+    assert client.get('/questions/suggest?prefix=a&limit=0').status_code == 422
+    assert client.get('/questions/suggest?prefix=a&limit=21').status_code == 422
+
+
+def test_writes_update_the_suggestions(client):
+    question_id = create(client)['New_question_ID']
+    assert 'planet' in suggested(client, 'plan')['terms']
+    assert [question['id'] for question in suggested(client, 'which pla')['questions']] == [question_id]
+
+    client.delete('/questions/%d' % question_id)
+    assert suggested(client, 'plan')['terms'] == []
+    assert suggested(client, 'which pla')['questions'] == []
+
+
+@pytest.mark.parametrize('prefix', ['??', '   '])
+def test_prefix_without_words_suggests_nothing(client, prefix):
+    assert suggested(client, prefix)['terms'] == [] and suggested(client, prefix)['questions'] == []
@@ -0,0 +1,46 @@
+from models import db, Category
+from versions import DataVersions
+
+from conftest import quiz_body
+from test_changes import create
+
+
+def test_etags_follow_the_table_versions():
+    versions = DataVersions()
+    etag = versions.etag(('questions', 'categories'))
+    versions.bump('categories')
+    assert versions.etag(('questions',)) == etag.rsplit('-', 1)[0]
+    assert versions.etag(('questions', 'categories')) != etag
+    # another process never shares an ETag for different data
+    assert DataVersions().etag(('questions',)) != versions.etag(('questions',))
+
+
+def test_unchanged_data_answers_304(client):
+    response = client.get('/questions')
+    etag = response.headers['ETag']
+    revalidated = client.get('/questions', headers={'If-None-Match': etag})
+    assert revalidated.status_code == 304
+    assert revalidated.headers['ETag'] == etag
+    assert revalidated.get_data() == b''
+
+
+def test_write_changes_the_etag(client):
+    etag = client.get('/categories').headers['ETag']
+    create(client)
+    response = client.get('/categories', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+
+
+def test_search_etag_ignores_category_writes(client, app):
+    etag = client.get('/questions/search?search=lake').headers['ETag']
+    with app.app_context():
+        db.session.add(Category('Music'))
+        db.session.commit()
+    assert client.get('/questions/search?search=lake', headers={'If-None-Match': etag}).status_code == 304
+    assert client.get('/questions', headers={'If-None-Match': etag}).status_code == 200
+
+
+def test_writes_and_unconditional_routes_carry_no_etag(client):
+    assert 'ETag' not in client.post('/quizzes', json=quiz_body()).headers
+    assert 'ETag' not in client.get('/questions/1/stats').headers
@@ -85,6 +85,25 @@ class QuizView extends Component {
       numCorrect: !evaluate ? this.state.numCorrect : this.state.numCorrect + 1,
       showAnswer: true,
     });
+    this.reportAnswer(evaluate);
+  };
+
+  reportAnswer = (correct) => {
+    // feeds the difficulty calibration; the quiz does not wait for it
+    $.ajax({
+      url: '/answers',
+      type: 'POST',
+      dataType: 'json',
+      contentType: 'application/json',
+      data: JSON.stringify({
+        question_id: this.state.currentQuestion.id,
+        correct: correct,
+      }),
+      xhrFields: {
+        withCredentials: true,
+      },
+      crossDomain: true,
+    });
   };
 
   restartGame = () => {